@@ -0,0 +1,336 @@
+"""Benchmarks for nipals.py
+
+Run with
+    python bench_nipals.py
+
+The benchmark suite sweeps the data size, ncomp, missing values and CV folds
+and writes the times and peak memory to a JSON file, which is compared with the
+file of another version by
+    python bench_nipals.py --suite new.json --compare old.json
+"""
+
+from __future__ import division
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+
+def lowrank(nr, nc, rank=5, noise=0.1, missing=0.0, seed=0):
+    """Synthetic low rank plus noise matrix, optionally with missing values"""
+    rng = np.random.default_rng(seed)
+    # Halving singular values keep the NIPALS iteration counts moderate
+    scores = rng.standard_normal((nr, rank)) * 2.0 ** -np.arange(rank)
+    mat = scores.dot(rng.standard_normal((rank, nc)))
+    # Add noise and missing values in row chunks to keep the peak memory of the
+    # generator close to the size of the matrix
+    step = max(1, 2**20 // nc)
+    for i in range(0, nr, step):
+        chunk = mat[i : i + step]
+        chunk += noise * rng.standard_normal(chunk.shape)
+        if missing:
+            chunk[rng.random(chunk.shape) < missing] = np.nan
+    return mat
+
+
+def _denominators_repeat(mat_0, miss, th, ph):
+    """Missing data denominators as calculated before the mask formulation"""
+    nrt, nct = mat_0.shape
+    T2 = np.repeat(th * th, nct)
+    T2.shape = (nrt, nct)
+    T2[miss] = 0
+    P2 = np.repeat(ph * ph, nrt)
+    P2.shape = (nct, nrt)
+    P2[miss.T] = 0
+    return T2.sum(axis=0), P2.sum(axis=0)
+
+
+def _denominators_mask(obs, th, ph):
+    """Missing data denominators as matrix-vector products against the mask"""
+    return obs.T.dot(th * th), obs.dot(ph * ph)
+
+
+def bench_missing(nr=20000, nc=500, fractions=(0.01, 0.1, 0.5), number=5):
+    """Compare the per-iteration cost of the two missing data denominators"""
+    print("Missing data denominators, {} x {}, {} iterations".format(nr, nc, number))
+    for frac in fractions:
+        mat = lowrank(nr, nc, missing=frac)
+        miss = np.isnan(mat)
+        obs = (~miss).astype(mat.dtype)
+        mat_0 = np.nan_to_num(mat)
+        th = mat_0[:, 0]
+        ph = np.ones(nc) / np.sqrt(nc)
+        ref = _denominators_repeat(mat_0, miss, th, ph)
+        new = _denominators_mask(obs, th, ph)
+        assert all(np.allclose(a, b) for a, b in zip(ref, new))
+        t_repeat = timeit.timeit(
+            lambda: _denominators_repeat(mat_0, miss, th, ph), number=number
+        )
+        t_mask = timeit.timeit(lambda: _denominators_mask(obs, th, ph), number=number)
+        print(
+            "  {:4.0%} missing: repeat {:8.4f} s, mask {:8.4f} s, speedup {:5.1f}x".format(
+                frac, t_repeat, t_mask, t_repeat / t_mask
+            )
+        )
+
+
+def _fit_rss(model, nr, nc, ncomp, dtype):
+    """Fit a model in the current process and return (RSS before fit, peak RSS) in MB"""
+    import pandas as pd
+
+    import nipals
+
+    x_df = pd.DataFrame(lowrank(nr, nc), copy=False)
+    if model == "PLS":
+        instance = nipals.PLS(x_df, x_df.iloc[:, :2] + 1)
+    else:
+        instance = nipals.Nipals(x_df)
+    del x_df
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Only pass dtype when set, so older versions of nipals.py can be compared
+    instance.fit(ncomp=ncomp, **({"dtype": dtype} if dtype else {}))
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return before / 1024, after / 1024
+
+
+def bench_memory(nr=200000, nc=200, ncomp=3):
+    """Peak RSS of Nipals.fit and PLS.fit, every fit in a fresh process"""
+    print(
+        "Peak RSS, {} x {} ({:.0f} MB of data), {} components".format(
+            nr, nc, nr * nc * 8 / 2**20, ncomp
+        )
+    )
+    ctx = multiprocessing.get_context("spawn")
+    for model in ("Nipals", "PLS"):
+        for dtype in (None, "float32"):
+            with ctx.Pool(1) as pool:
+                before, after = pool.apply(_fit_rss, (model, nr, nc, ncomp, dtype))
+            print(
+                "  {:6} {:7}: {:7.0f} MB before fit, {:7.0f} MB peak".format(
+                    model, dtype or "float64", before, after
+                )
+            )
+
+
+def nonlinear_data(nr=100, nc=5, seed=42):
+    """The nonlinear example data of nonlinear_plsr_2.ipynb, with nr rows"""
+    np.random.seed(seed)
+    x = np.random.rand(nr, nc)
+    y = (
+        np.sin(2 * np.pi * x[:, 0])
+        + 0.5 * np.exp(x[:, 1])
+        + 0.3 * x[:, 2] ** 3
+        + 0.2 * np.random.randn(nr)
+    )
+    return x, y.reshape(-1, 1)
+
+
+def bench_nonlinear(sizes=(100, 10000, 200000), ncomp=2, cv=7, number=3):
+    """Fit time and RMSE of linear PLS and NonlinearPLS with every inner relation
+    on the example data of the nonlinear PLS notebook"""
+    import nipals
+    import nonlinear_plsr
+
+    print(
+        "Nonlinear PLS, {} components, {}-fold CV, best of {}".format(ncomp, cv, number)
+    )
+    for nr in sizes:
+        x, y = nonlinear_data(nr)
+        models = [("linear", nipals.PLS, {})] + [
+            (relation, nonlinear_plsr.NonlinearPLS, {"relation": relation})
+            for relation in ("quadratic", "polynomial", "spline")
+        ]
+        t_linear = None
+        for name, cls, kwargs in models:
+            model = cls(x, y)
+            t_fit = min(
+                timeit.repeat(
+                    lambda: model.fit(ncomp, cv=cv, **kwargs), number=1, repeat=number
+                )
+            )
+            t_linear = t_linear or t_fit
+            rmse = np.sqrt(np.mean((model.predict(x) - y) ** 2))
+            print(
+                "  {:7} rows, {:10}: {:8.4f} s ({:4.1f}x linear), RMSE {:.4f}, "
+                "Q2cum {:.3f}".format(
+                    nr, name, t_fit, t_fit / t_linear, rmse, model.Q2cum.iloc[-1]
+                )
+            )
+
+
+# The suite varies one setting of BASE at a time over the values in SWEEP
+BASE = dict(rows=20000, cols=200, ncomp=3, missing=0.0, cv=0)
+SWEEP = dict(
+    rows=(2000, 20000, 100000),
+    cols=(20, 200, 1000),
+    ncomp=(1, 3, 5),
+    missing=(0.0, 0.01, 0.1),
+    cv=(0, 3, 7),
+)
+
+
+def _configs(base=BASE, sweep=SWEEP):
+    """The settings of the suite, BASE first and then every value of SWEEP that
+    differs from it"""
+    configs = [dict(base)]
+    for key, values in sweep.items():
+        for value in values:
+            if value != base[key]:
+                configs.append(dict(base, **{key: value}))
+    return configs
+
+
+def _measure(func, repeat):
+    """Best wall time of repeat calls of func, and the peak memory in MB that
+    numpy and Python allocate in another call, traced by tracemalloc (which
+    slows the call, so it is not timed)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return dict(time=best, peak_mb=peak / 2**20)
+
+
+def _suitedata(config, seed=0, ny=2):
+    """X and Y data of a suite setting, Y is ny more columns of the same low rank
+    matrix as X"""
+    import pandas as pd
+
+    mat = lowrank(
+        config["rows"], config["cols"] + ny, missing=config["missing"], seed=seed
+    )
+    return pd.DataFrame(mat[:, :-ny]), pd.DataFrame(mat[:, -ny:])
+
+
+def bench_suite(repeat=3, npred=1000, plots=True, configs=None):
+    """Time fit, predict, dModX and the plots of Nipals and PLS for every setting
+    of the suite and return the results by name, e.g. "PLS fit rows=20000
+    cols=200 ncomp=3 missing=0.0 cv=0", see _measure"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    import nipals
+
+    results = {}
+    for config in configs or _configs():
+        x_df, y_df = _suitedata(config)
+        new_x, _ = _suitedata(dict(config, rows=npred), seed=1)
+        # Rows with only missing values are not allowed in the fit
+        y_df = y_df.fillna(y_df.mean())
+        fitargs = dict(ncomp=config["ncomp"], cv=config["cv"])
+        setting = " ".join("{}={}".format(key, config[key]) for key in BASE)
+        for name, make in (
+            ("Nipals", lambda: nipals.Nipals(x_df)),
+            ("PLS", lambda: nipals.PLS(x_df, y_df)),
+        ):
+            model = make()
+            ops = [
+                ("fit", lambda: model.fit(**fitargs)),
+                ("predict", lambda: model.predict(new_x)),
+                ("dModX", lambda: model.dModX()),
+            ]
+            # The plots show the first two components
+            if plots and config["ncomp"] >= 2:
+                ops += [
+                    ("plot", lambda: plt.close(model.plot())),
+                    ("loadingsplot", lambda: plt.close(model.loadingsplot())),
+                ]
+            for op, func in ops:
+                key = "{} {} {}".format(name, op, setting)
+                results[key] = _measure(func, repeat)
+                print(
+                    "  {:70} {:9.4f} s {:9.1f} MB".format(
+                        key, results[key]["time"], results[key]["peak_mb"]
+                    )
+                )
+    return results
+
+
+def write_baseline(results, path):
+    """Write suite results to a JSON file with the versions they were measured
+    with, sorted so that files of two versions can be diffed"""
+    import pandas as pd
+    import scipy
+
+    meta = dict(
+        python=platform.python_version(),
+        numpy=np.__version__,
+        pandas=pd.__version__,
+        scipy=scipy.__version__,
+        machine=platform.machine(),
+    )
+    with open(path, "w") as fh:
+        json.dump(dict(meta=meta, results=results), fh, indent=1, sort_keys=True)
+        fh.write("\n")
+
+
+def compare_baseline(results, path, threshold=1.2):
+    """Print the ratios of the times and peak memory of results to those in the
+    baseline file, marking ratios above threshold"""
+    with open(path) as fh:
+        old = json.load(fh)["results"]
+    print("Compared with {} (ratio new/old, * above {})".format(path, threshold))
+    for key in sorted(set(results) & set(old)):
+        ratios = [
+            results[key][field] / old[key][field] if old[key][field] else float("nan")
+            for field in ("time", "peak_mb")
+        ]
+        print(
+            "  {:70} time {:6.2f}{} memory {:6.2f}{}".format(
+                key,
+                ratios[0],
+                "*" if ratios[0] > threshold else " ",
+                ratios[1],
+                "*" if ratios[1] > threshold else " ",
+            )
+        )
+    for key in sorted(set(results) ^ set(old)):
+        print("  {:70} only in {}".format(key, "new" if key in results else path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--cols", type=int, default=500)
+    parser.add_argument("--memory", action="store_true", help="also measure peak RSS")
+    parser.add_argument(
+        "--nonlinear", action="store_true", help="also compare nonlinear PLS"
+    )
+    parser.add_argument(
+        "--suite", metavar="JSON", help="run the suite and write the results here"
+    )
+    parser.add_argument(
+        "--compare", metavar="JSON", help="compare the suite with this baseline"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="suite repeats")
+    parser.add_argument("--noplots", action="store_true", help="suite without plots")
+    args = parser.parse_args()
+    if args.suite or args.compare:
+        print("Benchmark suite, best of {}".format(args.repeat))
+        results = bench_suite(args.repeat, plots=not args.noplots)
+        if args.suite:
+            write_baseline(results, args.suite)
+        if args.compare:
+            compare_baseline(results, args.compare)
+        raise SystemExit
+    bench_missing(args.rows, args.cols)
+    if args.memory:
+        bench_memory()
+    if args.nonlinear:
+        bench_nonlinear()
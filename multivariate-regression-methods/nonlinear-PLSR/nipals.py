@@ -1,10 +1,22 @@
 from __future__ import division
 
+import functools
+import json
 import logging
 import math
+import os
+import struct
+import threading
+import time
+import tracemalloc
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
+from scipy.linalg.blas import get_blas_funcs
+from scipy.sparse import issparse
+from scipy.sparse.linalg import LinearOperator, svds
 from scipy.stats import f
 
 
@@ -12,6 +24,36 @@ def formatval(v):
     return v if (isinstance(v, str) or int(v) != v) else int(v)
 
 
+def _thin(df, maxpoints):
+    """At most maxpoints rows of df, a random sample (the same for every call)
+    of larger frames, in their order"""
+    if maxpoints is None or len(df) <= maxpoints:
+        return df
+    logging.info("Plotting {} of {} points".format(maxpoints, len(df)))
+    keep = np.random.default_rng(0).choice(len(df), maxpoints, replace=False)
+    return df.iloc[np.sort(keep)]
+
+
+def _annotate(ax, texts, x, y, maxlabels, size, zorder, fmt=None):
+    """Label the points x, y with texts, at most maxlabels of them: those
+    farthest from the origin relative to the spread of x and y"""
+    texts, x, y = np.asarray(texts), np.asarray(x, float), np.asarray(y, float)
+    if maxlabels is not None and len(x) > maxlabels:
+        dist = x * x / max(np.var(x), 1e-300) + y * y / max(np.var(y), 1e-300)
+        keep = np.argsort(-dist, kind="stable")[:maxlabels]
+        texts, x, y = texts[keep], x[keep], y[keep]
+    for text, xi, yi in zip(texts, x, y):
+        ax.annotate(
+            fmt(text) if fmt else text,
+            (xi, yi),
+            xytext=(10, -5),
+            textcoords="offset points",
+            size=size,
+            color="black",
+            zorder=zorder,
+        )
+
+
 def _plot(
     modelinstance,
     comps=["PC1", "PC2"],
@@ -29,14 +71,25 @@ def _plot(
     predlabels=None,
     textsize=10,
     color="#555555",
+    maxpoints=20000,
+    largemode="decimate",
+    maxlabels=200,
 ):
-    """Plot method for plotting scores, with optional classes and predictions"""
+    """Plot method for plotting scores, with optional classes and predictions
+
+    Above maxpoints scores (per class), a random sample of maxpoints scores is
+    plotted with largemode="decimate", or the density of all scores as
+    hexagonal bins with largemode="density" (without classes). At most
+    maxlabels points are labeled, the most outlying ones. The ellipse is
+    always that of all scores. None plots and labels all points."""
+    if largemode not in ("decimate", "density"):
+        raise ValueError("Unknown largemode {}".format(largemode))
     if not markers:
         markers = ["s", "^", "v", "o", "<", ">", "D", "p"]
     if classlevels:
         if not classcolors:
             classcolors = [str(f) for f in np.linspace(0, 1, len(classlevels) + 1)[1:]]
-        ax = modelinstance.scores.xs(1, level=classlevels[0]).plot(
+        ax = _thin(modelinstance.scores.xs(1, level=classlevels[0]), maxpoints).plot(
             kind="scatter",
             x=comps[0],
             y=comps[1],
@@ -49,7 +102,7 @@ def _plot(
             c=classcolors[0],
         )
         for i, lev in enumerate(classlevels[1:]):
-            modelinstance.scores.xs(1, level=lev).plot(
+            _thin(modelinstance.scores.xs(1, level=lev), maxpoints).plot(
                 kind="scatter",
                 x=comps[0],
                 y=comps[1],
@@ -62,8 +115,25 @@ def _plot(
                 ax=ax,
                 grid=True,
             )
-    else:
+    elif (
+        largemode == "density"
+        and maxpoints is not None
+        and len(modelinstance.scores) > maxpoints
+    ):
         ax = modelinstance.scores.plot(
+            kind="hexbin",
+            x=comps[0],
+            y=comps[1],
+            figsize=figsize,
+            gridsize=100,
+            bins="log",
+            mincnt=1,
+            cmap="Greys",
+            zorder=3,
+            grid=True,
+        )
+    else:
+        ax = _thin(modelinstance.scores, maxpoints).plot(
             kind="scatter",
             x=comps[0],
             y=comps[1],
@@ -76,21 +146,28 @@ def _plot(
             c=color,
             grid=True,
         )
+    try:
+        # Score statistics of the model, when the scores are not its training data
+        stats = modelinstance._scorestats(comps)
+    except AttributeError:
+        stats = (None, None, None)
     el = simpleEllipse(
-        modelinstance.scores[comps[0]], modelinstance.scores[comps[1]], 0.95, 200
+        modelinstance.scores[comps[0]],
+        modelinstance.scores[comps[1]],
+        0.95,
+        200,
+        *stats,
     )
     if labels:
-        modelinstance.scores.reset_index(labels).apply(
-            lambda row: ax.annotate(
-                row[labels],
-                (row[comps[0]], row[comps[1]]),
-                xytext=(10, -5),
-                textcoords="offset points",
-                size=textsize,
-                color="black",
-                zorder=4,
-            ),
-            axis=1,
+        scores = modelinstance.scores
+        _annotate(
+            ax,
+            scores.index.get_level_values(labels),
+            scores[comps[0]],
+            scores[comps[1]],
+            maxlabels,
+            textsize,
+            4,
         )
     ax.plot(el[0], el[1], color="black", linewidth=1)
     ax.axvline(x=0, ls="-", color="black", linewidth=1)
@@ -107,7 +184,9 @@ def _plot(
         if predlevels:
             for lev in range(len(predlevels)):
                 try:
-                    modelinstance.pred.xs(1, level=predlevels[lev]).plot(
+                    _thin(
+                        modelinstance.pred.xs(1, level=predlevels[lev]), maxpoints
+                    ).plot(
                         kind="scatter",
                         x=comps[0],
                         y=comps[1],
@@ -121,26 +200,15 @@ def _plot(
                         grid=True,
                     )
                     if not (predlabels is None):
-                        modelinstance.pred.xs(1, level=predlevels[lev]).reset_index(
-                            predlabels
-                        ).rename(columns={"index": "level_0"}).apply(
-                            lambda row: ax.annotate(
-                                row[
-                                    (
-                                        "level_{}".format(predlabels)
-                                        if 0 == predlabels
-                                        else predlabels
-                                    )
-                                ],
-                                (row[comps[0]], row[comps[1]]),
-                                xytext=(10, -5),
-                                textcoords="offset points",
-                                size=textsize
-                                * (2 if predsize is None else (predsize / msize)),
-                                color="black",
-                                zorder=6,
-                            ),
-                            axis=1,
+                        pred = modelinstance.pred.xs(1, level=predlevels[lev])
+                        _annotate(
+                            ax,
+                            pred.index.get_level_values(predlabels),
+                            pred[comps[0]],
+                            pred[comps[1]],
+                            maxlabels,
+                            textsize * (2 if predsize is None else (predsize / msize)),
+                            6,
                         )
                 except (KeyError, ValueError, IndexError):
                     logging.warning(
@@ -151,7 +219,7 @@ def _plot(
                     )
                     raise
         else:
-            modelinstance.pred.plot(
+            _thin(modelinstance.pred, maxpoints).plot(
                 kind="scatter",
                 x=comps[0],
                 y=comps[1],
@@ -165,27 +233,16 @@ def _plot(
                 grid=True,
             )
             if not (predlabels is None):
-                modelinstance.pred.reset_index(predlabels).rename(
-                    columns={"index": "level_0"}
-                ).apply(
-                    lambda row: ax.annotate(
-                        formatval(
-                            row[
-                                (
-                                    "level_{}".format(predlabels)
-                                    if 0 == predlabels
-                                    else predlabels
-                                )
-                            ]
-                        ),
-                        (row[comps[0]], row[comps[1]]),
-                        xytext=(10, -5),
-                        textcoords="offset points",
-                        size=textsize * (2 if predsize is None else (predsize / msize)),
-                        color="black",
-                        zorder=7,
-                    ),
-                    axis=1,
+                pred = modelinstance.pred
+                _annotate(
+                    ax,
+                    pred.index.get_level_values(predlabels),
+                    pred[comps[0]],
+                    pred[comps[1]],
+                    maxlabels,
+                    textsize * (2 if predsize is None else (predsize / msize)),
+                    7,
+                    formatval,
                 )
     return ax.figure
 
@@ -203,13 +260,19 @@ def _loadingsplot(
     weightsize=200,
     labels=True,
     textsize=10,
+    maxpoints=20000,
+    maxlabels=200,
 ):
-    """Plot method for plotting loadings"""
+    """Plot method for plotting loadings
+
+    Above maxpoints variables, a random sample of maxpoints of them is plotted,
+    and at most maxlabels variables are labeled, the most outlying ones. None
+    plots and labels all variables."""
     try:
         _loadings = modelinstance.weights
     except AttributeError:
         _loadings = modelinstance.loadings
-    ax = _loadings.plot(
+    ax = _thin(_loadings, maxpoints).plot(
         kind="scatter",
         x=comps[0],
         y=comps[1],
@@ -221,17 +284,14 @@ def _loadingsplot(
         zorder=3,
     )
     if labels:
-        _loadings.apply(
-            lambda row: ax.annotate(
-                row.name,
-                (row[comps[0]], row[comps[1]]),
-                xytext=(10, -5),
-                textcoords="offset points",
-                size=textsize,
-                color="black",
-                zorder=4,
-            ),
-            axis=1,
+        _annotate(
+            ax,
+            _loadings.index,
+            _loadings[comps[0]],
+            _loadings[comps[1]],
+            maxlabels,
+            textsize,
+            4,
         )
     if showweights:
         if weightmarkers is None:
@@ -257,52 +317,947 @@ def _loadingsplot(
                     _x, _y, marker=_m, c=_c, s=weightsize, edgecolor="k", zorder=5
                 )
         if labels:
-            modelinstance.q.apply(
-                lambda row: ax.annotate(
-                    row.name,
-                    (row[comps[0]], row[comps[1]]),
-                    xytext=(10, -5),
-                    textcoords="offset points",
-                    size=textsize * weightsize / msize,
-                    color="black",
-                    zorder=6,
-                ),
-                axis=1,
+            _annotate(
+                ax,
+                modelinstance.q.index,
+                modelinstance.q[comps[0]],
+                modelinstance.q[comps[1]],
+                maxlabels,
+                textsize * weightsize / msize,
+                6,
             )
     ax.axvline(x=0, ls="-", color="black", linewidth=1, zorder=2.7)
     ax.axhline(y=0, ls="-", color="black", linewidth=1, zorder=2.7)
     return ax.figure
 
 
-def simpleEllipse(x, y, alfa, length):
+def simpleEllipse(x, y, alfa, length, mean=None, var=None, n=None):
     """Helper function to calculate Hotelling's ellipse from scores
     Ported from the bioconductor package pcaMethods, https://doi.org/doi:10.18129/B9.bioc.pcaMethods
     Stacklies W, Redestig H, Scholz M, Walther D and Selbig J (2007).
     "pcaMethods - a Bioconductor package providing PCA methods for incomplete data."
     Bioinformatics, 23, pp. 1164-1167.
+
+    The means, variances and number of observations of the two scores default to
+    those of x and y
+    """
+    if n is None:
+        n = len(x)
+    if mean is None:
+        mean = (x.mean(), y.mean())
+    if var is None:
+        var = (x.var(), y.var())
+    mypi = np.linspace(0, 2 * np.pi, length)
+    scale = _fquantile(alfa, 2, n - 2) * 2 * (n**2 - 1) / (n * (n - 2))
+    r1 = np.sqrt(var[0] * scale)
+    r2 = np.sqrt(var[1] * scale)
+    return r1 * np.cos(mypi) + mean[0], r2 * np.sin(mypi) + mean[1]
+
+
+@functools.lru_cache(maxsize=1024)
+def _fquantile(q, dfn, dfd):
+    """Quantile of the F distribution, cached as the limits are reused for every
+    batch of new data"""
+    return f.ppf(q, dfn, dfd)
+
+
+def _dmodx(res, ssres, nobs, ncomp, A0=1):
+    """DModX of new rows with the residuals res (missing values as NaN), relative
+    to S0 of a model with the residual column sums of squares ssres. The
+    residual standard deviation of a row is taken over its observed variables."""
+    nc = res.shape[1]
+    count = nc - np.isnan(res).sum(axis=1)
+    s = np.sqrt(np.nansum(res * res, axis=1) / (count - ncomp))
+    S0 = np.sqrt(ssres.sum() / ((nobs - ncomp - A0) * (nc - ncomp)))
+    return s / S0
+
+
+def _dmodxlimit(alpha, nobs, nc, ncomp, A0=1):
+    """Critical DModX at significance level alpha, as in dModXPlot"""
+    return np.sqrt(_fquantile(1 - alpha, nobs - ncomp - A0, nc - ncomp))
+
+
+def _t2limit(alpha, nobs, ncomp):
+    """Critical Hotelling's T2 of new rows at significance level alpha, the
+    ncomp-dimensional form of the limit of simpleEllipse"""
+    return (
+        ncomp
+        * (nobs**2 - 1)
+        / (nobs * (nobs - ncomp))
+        * _fquantile(1 - alpha, ncomp, nobs - ncomp)
+    )
+
+
+def _usecomps(ncomp, maxcomp):
+    """Number of components of the model to use, all for None"""
+    if ncomp is None:
+        return maxcomp
+    if not 1 <= ncomp <= maxcomp:
+        raise ValueError(
+            "ncomp must be between 1 and the {} components of the model, got "
+            "{}".format(maxcomp, ncomp)
+        )
+    return ncomp
+
+
+def _deflate(mat, t, p, alpha=1.0):
+    """Rank one deflation mat -= alpha * outer(t, p)
+
+    Done in place with a BLAS ger update when mat is contiguous, so no full size
+    outer product or copy of mat is allocated"""
+    if isinstance(mat, _SparseResidual):
+        return mat.deflate(t, p, alpha)
+    ger = get_blas_funcs("ger", (mat,))
+    if mat.flags.c_contiguous:
+        ger(-alpha, p, t, a=mat.T, overwrite_a=True)
+    elif mat.flags.f_contiguous:
+        ger(-alpha, t, p, a=mat, overwrite_a=True)
+    else:
+        mat -= alpha * np.outer(t, p)
+    return mat
+
+
+def _rowchunks(mat, size=2**20):
+    """Slices over the rows of mat, each covering about size elements"""
+    step = max(1, size // max(1, mat.shape[1]))
+    return [slice(i, i + step) for i in range(0, mat.shape[0], step)]
+
+
+def _sumsq(mat):
+    """Sum of squares of the non-missing values of mat, accumulated in double
+    precision over row chunks instead of a full size temporary"""
+    if isinstance(mat, _SparseResidual):
+        return mat.residualss()[1].sum()
+    return sum(
+        np.nansum(np.square(mat[rows]), dtype=np.float64) for rows in _rowchunks(mat)
+    )
+
+
+def _residualss(mat):
+    """Row and column sums of squares of the non-missing values of mat, accumulated
+    over row chunks"""
+    if isinstance(mat, _SparseResidual):
+        return mat.residualss()
+    rowss = np.empty(mat.shape[0])
+    colss = 0
+    for rows in _rowchunks(mat):
+        square = np.square(mat[rows])
+        rowss[rows] = np.nansum(square, axis=1)
+        colss = colss + np.nansum(square, axis=0, dtype=np.float64)
+    return rowss, colss
+
+
+def _nanmeanstd(mat):
+    """Column means and standard deviations (ddof=1) of the non-missing values of
+    mat, calculated in two passes over row chunks instead of full size temporaries"""
+    if isinstance(mat, _SparseResidual):
+        return mat.meanstd()
+    chunks = _rowchunks(mat)
+    count = sum((~np.isnan(mat[rows])).sum(axis=0) for rows in chunks)
+    mean = sum(np.nansum(mat[rows], axis=0, dtype=np.float64) for rows in chunks)
+    mean = mean / count
+    ss = sum(np.nansum(np.square(mat[rows] - mean), axis=0) for rows in chunks)
+    return mean, np.sqrt(ss / (count - 1))
+
+
+def _combinestats(stats, block, weight=1.0):
+    """Update the streaming column statistics (count, mean, sum of squared
+    deviations) of the non-missing values with a block of rows
+
+    Blocks are merged with the pairwise formula of Chan et al., so the
+    statistics match a two-pass calculation over all rows. The old statistics
+    are down-weighted by weight (< 1 for exponential forgetting)"""
+    count, mean, m2 = stats
+    count = weight * count
+    m2 = weight * m2
+    bcount = (~np.isnan(block)).sum(axis=0)
+    bmean = np.nansum(block, axis=0, dtype=np.float64) / np.maximum(bcount, 1)
+    bm2 = np.nansum(np.square(block - bmean), axis=0, dtype=np.float64)
+    total = count + bcount
+    delta = bmean - mean
+    share = bcount / np.maximum(total, 1)
+    return total, mean + delta * share, m2 + bm2 + delta * delta * count * share
+
+
+def _rotations(weights, loadings):
+    """Rotations R with the scores T = X R of the deflation with weights W and
+    loadings P, r_a = w_a - sum_b<a r_b p_b'w_a. Equals W (P'W)^-1 when P'W is
+    upper triangular with a unit diagonal, which NIPALS with missing data does
+    not guarantee."""
+    rotations = np.empty(weights.shape)
+    for comp in range(weights.shape[1]):
+        rotations[:, comp] = weights[:, comp] - rotations[:, :comp].dot(
+            loadings[:, :comp].T.dot(weights[:, comp])
+        )
+    return rotations
+
+
+def _kernelpls(xtx, xty, ncomp, yss, startcol=None):
+    """PLS components from the cross product matrices X'X and X'Y of the
+    preprocessed data, by the improved kernel algorithm of Dayal and MacGregor
+    (J Chemometrics 11 (1997) 73-85)
+
+    yss are the column sums of squares of Y, the sign of every weight vector is
+    chosen as NIPALS would, starting from Y column startcol or the one with the
+    highest variance. Returns the weights, loadings, Y loadings and rotations (see
+    _rotations) with a column per component and the sums of squares of the
+    scores t't. The cost does not depend on the number of rows."""
+    nc, ny = xty.shape
+    xty = np.array(xty, dtype=np.float64)
+    yss = np.array(yss, dtype=np.float64)
+    weights = np.empty((nc, ncomp))
+    loadings = np.empty((nc, ncomp))
+    q = np.empty((ny, ncomp))
+    rotations = np.empty((nc, ncomp))
+    tt = np.empty((ncomp,))
+    for comp in range(ncomp):
+        # The weights are the dominant left singular vector of the deflated X'Y
+        if ny == 1:
+            wh = xty[:, 0].copy()
+        else:
+            wh = np.linalg.svd(xty, full_matrices=False)[0][:, 0]
+        if wh.dot(xty[:, _signcol(yss, startcol)]) < 0:
+            wh = -wh
+        wh /= math.sqrt(wh.dot(wh))
+        rh = wh - rotations[:, :comp].dot(loadings[:, :comp].T.dot(wh))
+        xtx_rh = xtx.dot(rh)
+        tt[comp] = rh.dot(xtx_rh)
+        ph = xtx_rh / tt[comp]
+        qh = xty.T.dot(rh) / tt[comp]
+        # Deflate X'Y, X'X is not deflated
+        _deflate(xty, ph, qh, tt[comp])
+        yss -= tt[comp] * qh * qh
+        weights[:, comp] = wh
+        loadings[:, comp] = ph
+        q[:, comp] = qh
+        rotations[:, comp] = rh
+    return weights, loadings, q, rotations, tt
+
+
+def _signcol(yss, startcol=None):
+    """The Y column that NIPALS starts from, whose scores u and t have a positive
+    inner product after convergence, by the rule of _startcolumn"""
+    return _startcolumn(yss) if startcol is None else startcol
+
+
+def _simpls(xtx, xty, ncomp, yss, startcol=None):
+    """PLS components from the cross product matrices X'X and X'Y of the
+    preprocessed data, by SIMPLS (de Jong, Chemometr Intell Lab 18 (1993)
+    251-263)
+
+    The weights and rotations are scaled and signed as in NIPALS. Returns the
+    same as _kernelpls."""
+    nc, ny = xty.shape
+    xty = np.array(xty, dtype=np.float64)
+    proj = xty.copy()
+    yss = np.array(yss, dtype=np.float64)
+    weights = np.empty((nc, ncomp))
+    loadings = np.empty((nc, ncomp))
+    q = np.empty((ny, ncomp))
+    rotations = np.empty((nc, ncomp))
+    basis = np.empty((nc, ncomp))
+    tt = np.empty((ncomp,))
+    # The rotations come from X'Y projected off the earlier loadings, the weights
+    # are the rotations orthonormalized against the earlier weights. For one Y
+    # column this is the NIPALS solution, for several the components differ
+    # slightly, as NIPALS maximizes the covariance of the deflated X instead
+    for comp in range(ncomp):
+        if ny == 1:
+            rh = proj[:, 0].copy()
+        else:
+            rh = np.linalg.svd(proj, full_matrices=False)[0][:, 0]
+        if rh.dot(proj[:, _signcol(yss, startcol)]) < 0:
+            rh = -rh
+        wh = rh - weights[:, :comp].dot(weights[:, :comp].T.dot(rh))
+        norm = math.sqrt(wh.dot(wh))
+        wh /= norm
+        rh /= norm
+        xtx_rh = xtx.dot(rh)
+        tt[comp] = rh.dot(xtx_rh)
+        ph = xtx_rh / tt[comp]
+        qh = xty.T.dot(rh) / tt[comp]
+        yss -= tt[comp] * qh * qh
+        # Project X'Y off the new loadings, kept as an orthonormal basis
+        vh = ph - basis[:, :comp].dot(basis[:, :comp].T.dot(ph))
+        vh /= math.sqrt(vh.dot(vh))
+        _deflate(proj, vh, vh.dot(proj))
+        weights[:, comp] = wh
+        loadings[:, comp] = ph
+        q[:, comp] = qh
+        rotations[:, comp] = rh
+        basis[:, comp] = vh
+    return weights, loadings, q, rotations, tt
+
+
+def _widekernelpls(x_mat, y_mat, ncomp, startcol=None):
+    """PLS components of complete preprocessed data with many more columns than
+    rows, by the kernel algorithm of Rannar et al. (J Chemometrics 8 (1994)
+    111-125) on the row kernel XX' and Y. Returns the same as _kernelpls."""
+    nr, nc = x_mat.shape
+    ny = y_mat.shape[1]
+    kernel = x_mat.dot(x_mat.T).astype(np.float64)
+    y_res = np.array(y_mat, dtype=np.float64)
+    weights = np.empty((nc, ncomp))
+    loadings = np.empty((nc, ncomp))
+    q = np.empty((ny, ncomp))
+    tt = np.empty((ncomp,))
+    # The scores are XX' v with v = Y c for the dominant eigenvector c of Y'XX'Y,
+    # the n x n kernel is deflated and X is only multiplied with vectors
+    for comp in range(ncomp):
+        if ny == 1:
+            vh = y_res[:, 0].copy()
+        else:
+            ky = kernel.dot(y_res)
+            vh = y_res.dot(np.linalg.eigh(y_res.T.dot(ky))[1][:, -1])
+        kv = kernel.dot(vh)
+        # The weights X'v / |X'v| have unit length, v is orthogonal to the
+        # earlier scores, so v'K v of the deflated kernel is |X'v|^2
+        norm = math.sqrt(vh.dot(kv))
+        th = kv / norm
+        if th.dot(y_res[:, _signcol((y_res * y_res).sum(axis=0), startcol)]) < 0:
+            th = -th
+            vh = -vh
+        wh = x_mat.T.dot(vh) / norm
+        tt[comp] = th.dot(th)
+        ph = x_mat.T.dot(th) / tt[comp]
+        qh = y_res.T.dot(th) / tt[comp]
+        # Deflate the kernel to (I - tt'/t't) K (I - tt'/t't) in place
+        kt = kernel.dot(th) / tt[comp]
+        _deflate(kernel, th, kt)
+        _deflate(kernel, kt - th * kt.dot(th) / tt[comp], th)
+        _deflate(y_res, th, qh)
+        weights[:, comp] = wh
+        loadings[:, comp] = ph
+        q[:, comp] = qh
+    return weights, loadings, q, _rotations(weights, loadings), tt
+
+
+def _asarray(new_x, columns):
+    """New data as a float array with the given columns, and its index (None
+    for arrays). Arrays and DataFrames with these columns are not copied, sparse
+    matrices are converted to arrays."""
+    index = None
+    if issparse(new_x):
+        new_x = new_x.toarray()
+    if isinstance(new_x, pd.DataFrame):
+        index = new_x.index
+        if not new_x.columns.equals(columns):
+            new_x = new_x[columns]
+        new_x = new_x.to_numpy()
+    new_x = np.asarray(new_x)
+    if new_x.dtype.kind != "f":
+        new_x = new_x.astype(float)
+    return new_x, index
+
+
+def _newdata(new_df, columns):
+    """New data as a float DataFrame with the given columns and as an array
+    with missing values for infs, sparse matrices are converted to arrays"""
+    if issparse(new_df):
+        new_df = new_df.toarray()
+    if not isinstance(new_df, pd.DataFrame):
+        new_df = pd.DataFrame(new_df)
+    try:
+        new_df = new_df[columns].astype("float")
+    except KeyError:
+        raise ValueError("New data does not have the columns of the model")
+    new_mat = np.array(new_df.values)
+    new_mat[np.isinf(new_mat)] = np.nan
+    return new_df, new_mat
+
+
+def _projectmissing(mat, loadings, method="tsr", scorevar=None, resvar=None):
+    """Scores of rows of preprocessed data with missing values (NaN) by projection
+    to the model plane, with the rows grouped by missingness pattern so every
+    pattern solves one ncomp x ncomp system
+
+    method - "pmp" for projection to the model plane, the least squares scores
+    (P*'P*)^-1 P*'x* of the observed variables, or "tsr" for trimmed score
+    regression, which regresses the scores on the trimmed scores P*'x* with the
+    score variances scorevar and the residual variances resvar of the variables
+    of the model (Arteaga and Ferrer, J Chemometrics 16 (2002) 408-418). The
+    residuals are taken as uncorrelated, so every system stays ncomp x ncomp.
+    """
+    miss = np.isnan(mat)
+    patterns, inverse = np.unique(miss, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    trimmed = np.nan_to_num(mat).dot(loadings)
+    scores = np.empty_like(trimmed)
+    # Row numbers of every pattern
+    groups = np.split(
+        np.argsort(inverse, kind="stable"), np.cumsum(np.bincount(inverse))[:-1]
+    )
+    for pattern, rows in zip(patterns, groups):
+        # P*'P* of the observed variables, formed explicitly as the loadings
+        # of a fit with missing values are not exactly orthonormal
+        lo = loadings[~pattern]
+        pp = lo.T.dot(lo)
+        if method == "pmp":
+            scores[rows] = np.linalg.solve(pp, trimmed[rows].T).T
+        elif method == "tsr":
+            # Covariance of the trimmed scores, P*' (P* S P*' + E*) P* with the
+            # residual variances E* of the observed variables
+            theta_pp = scorevar[:, np.newaxis] * pp
+            lhs = pp.dot(theta_pp) + (lo * resvar[~pattern, np.newaxis]).T.dot(lo)
+            scores[rows] = theta_pp.dot(np.linalg.solve(lhs, trimmed[rows].T)).T
+        else:
+            raise ValueError("Unknown method {}".format(method))
+    return scores
+
+
+@functools.lru_cache(maxsize=None)
+def _pcindex(ncomp):
+    """The component labels PC1, ..., PCncomp, shared by all result frames"""
+    return pd.Index(["PC{}".format(i + 1) for i in range(ncomp)])
+
+
+def _startcolumn(var):
+    """Column to start the NIPALS iteration from, the first column with the
+    highest variance. Variances within rounding of the highest count as equal,
+    as all variances are after scaling, so the start column and with it the
+    sign of the component do not depend on how the variances were summed or on
+    the precision (float32 or float64) of the working matrix."""
+    var = np.asarray(var)
+    return int(np.flatnonzero(var >= var.max() * (1 - 1e-6))[0])
+
+
+def _startvectors(init, nr, attr):
+    """Start vectors for the NIPALS iterations, as an array with one column per
+    component, from a fitted model (its attribute attr) or an array"""
+    if init is None:
+        return None
+    if hasattr(init, attr):
+        init = getattr(init, attr)
+    init = np.nan_to_num(np.asarray(init, dtype=float))
+    if init.ndim == 1:
+        init = init[:, np.newaxis]
+    if init.shape[0] != nr:
+        raise ValueError(
+            "Start vectors have {} rows, the data has {}".format(init.shape[0], nr)
+        )
+    return init
+
+
+def _njobs(n_jobs, ntasks):
+    """Number of workers to use for ntasks tasks, n_jobs=-1 means one per CPU"""
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    return max(1, min(n_jobs, ntasks))
+
+
+def _cvmap(func, nfolds, n_jobs):
+    """Run func(fold, worker) for all CV folds and return the results in fold order
+
+    Worker w handles folds w, w + n_jobs, ... one after another on its own thread,
+    so a worker can safely reuse its buffers between folds"""
+    if n_jobs <= 1:
+        return [func(fold, 0) for fold in range(nfolds)]
+    with ThreadPoolExecutor(n_jobs) as pool:
+        parts = list(
+            pool.map(
+                lambda worker: [
+                    func(fold, worker) for fold in range(worker, nfolds, n_jobs)
+                ],
+                range(n_jobs),
+            )
+        )
+    results = [None] * nfolds
+    for worker, part in enumerate(parts):
+        results[worker::n_jobs] = part
+    return results
+
+
+def _ritz(images, basis):
+    """Coefficients of the Ritz vector with the largest Ritz value in the span of
+    the columns of basis, for the operator C with v' C v = |image of v|^2
+
+    Nearly dependent directions of the basis are dropped, so the result stays
+    accurate close to convergence, where the directions become parallel."""
+    gram = basis.T.dot(basis)
+    sv, vec = np.linalg.eigh(gram)
+    keep = sv > sv[-1] * 1e-12
+    white = vec[:, keep] / np.sqrt(sv[keep])
+    reduced = white.T.dot(images.T.dot(images)).dot(white)
+    return white.dot(np.linalg.eigh(reduced)[1][:, -1])
+
+
+def _lobpcg(x, image, adjoint, tol, maxiter, comp, trace=None, stop=None, restart=20):
+    """Dominant eigenvector of C = A' A by LOBPCG without a preconditioner (Knyazev,
+    SIAM J Sci Comput 23 (2001) 517-541), an accelerated power iteration
+
+    image(v) returns the linear images of v as a tuple whose last entry is A v,
+    adjoint(a) returns A' a, one of each per iteration as in NIPALS. The images
+    are refreshed every restart iterations. Stops when the squared change of the
+    first image is below tol or the residual is at rounding level, and returns
+    None as soon as stop (a threading.Event) is set. The changes are appended to
+    trace. Returns x (unit length) and its images."""
+    x = x / math.sqrt(x.dot(x))
+    imgs = image(x)
+    # Rounding level of the directions
+    eps = len(x) * np.finfo(x.dtype).eps
+    step = None
+    it = 0
+    while True:
+        if stop is not None and stop.is_set():
+            return None
+        theta = imgs[-1].dot(imgs[-1])
+        resid = adjoint(imgs[-1]) - theta * x
+        rnorm = math.sqrt(resid.dot(resid))
+        if rnorm <= eps * theta:
+            break
+        # The next iterate is the Ritz vector in the span of x, its residual
+        # C x - (x' C x) x and the last step, whose images are combined as the
+        # step so no extra products are needed
+        vecs = [x, resid / rnorm]
+        vec_imgs = [imgs, image(vecs[1])]
+        if step is not None:
+            norm = math.sqrt(step[0].dot(step[0]))
+            if norm > eps:
+                vecs.append(step[0] / norm)
+                vec_imgs.append([i / norm for i in step[1]])
+        basis = np.column_stack(vecs)
+        parts = [np.column_stack([v[j] for v in vec_imgs]) for j in range(len(imgs))]
+        coef = _ritz(parts[-1], basis)
+        new_x = basis.dot(coef)
+        scale = math.sqrt(new_x.dot(new_x))
+        if new_x.dot(x) < 0:
+            scale = -scale
+        coef = coef / scale
+        # The step is the part of the new iterate outside of x
+        step = (
+            basis[:, 1:].dot(coef[1:]),
+            tuple(part[:, 1:].dot(coef[1:]) for part in parts),
+        )
+        old = imgs[0]
+        x = new_x / scale
+        imgs = tuple(part.dot(coef) for part in parts)
+
+        change = np.sum((imgs[0] - old) ** 2)
+        if trace is not None:
+            trace.append(change)
+        if change < tol:
+            break
+        it += 1
+        if it >= maxiter:
+            raise RuntimeError(
+                "Convergence was not reached in {} iterations for component {}".format(
+                    maxiter, comp
+                )
+            )
+        if it % restart == 0:
+            imgs = image(x)
+            step = None
+    return x, image(x)
+
+
+def _race(func, nstarts, n_jobs, comp):
+    """Run func(start, stop) for the start vectors 0, ..., nstarts - 1 on n_jobs
+    threads and return the result of the first start to converge
+
+    func returns None when the threading.Event stop was set by a start that
+    converged earlier, and raises RuntimeError if it does not converge. The
+    first result sets stop, so the other starts end at their next iteration.
+    With n_jobs=1 the starts run one after another, so a start only runs when
+    all earlier ones failed to converge."""
+    stop = threading.Event()
+    lock = threading.Lock()
+    winner = []
+
+    def run(start):
+        try:
+            result = func(start, stop)
+        except RuntimeError:
+            return
+        with lock:
+            if result is not None and not winner:
+                winner.append(result)
+                stop.set()
+
+    if n_jobs <= 1:
+        for start in range(nstarts):
+            run(start)
+    else:
+        with ThreadPoolExecutor(n_jobs) as pool:
+            list(pool.map(run, range(nstarts)))
+    if not winner:
+        raise RuntimeError(
+            "Convergence was not reached from any of {} start vectors for "
+            "component {}".format(nstarts, comp)
+        )
+    return winner[0]
+
+
+def _svdcomps(mat, ncomp, method, startcol=None, oversample=10, niter=None):
+    """Calculate all principal components of a complete data matrix in one blocked pass
+
+    Returns scores and loadings with the same scaling and sign convention as the
+    NIPALS path of Nipals.fit, i.e. the loading of the column the NIPALS
+    iteration would have started from is positive for every component.
+
+    method - "svd" for a full LAPACK SVD, "lanczos" for a truncated Lanczos SVD
+    or "randomized" for a randomized block Krylov SVD (Halko et al. 2011)
     """
-    n = len(x)
-    mypi = [i / (length - 1) * np.pi * 2 for i in range(length)]
-    r1 = np.sqrt(x.var() * f.ppf(alfa, 2, n - 2) * 2 * (n**2 - 1) / (n * (n - 2)))
-    r2 = np.sqrt(y.var() * f.ppf(alfa, 2, n - 2) * 2 * (n**2 - 1) / (n * (n - 2)))
-    return r1 * np.cos(mypi) + x.mean(), r2 * np.sin(mypi) + y.mean()
+    nr, nc = mat.shape
+    if method == "lanczos" and ncomp < min(nr, nc):
+        u, s, vt = svds(mat, k=ncomp)
+        order = np.argsort(s)[::-1]
+        u, s, vt = u[:, order], s[order], vt[order]
+    elif method == "randomized":
+        rng = np.random.default_rng(0)
+        nblock = min(ncomp + oversample, nr, nc)
+        if niter is None:
+            niter = 7 if ncomp < 0.1 * min(nr, nc) else 4
+        q, _ = np.linalg.qr(mat.dot(rng.standard_normal((nc, nblock))))
+        for _ in range(niter):
+            q, _ = np.linalg.qr(mat.T.dot(q))
+            q, _ = np.linalg.qr(mat.dot(q))
+        ub, s, vt = np.linalg.svd(q.T.dot(mat), full_matrices=False)
+        u = q.dot(ub)
+    elif method in ("svd", "lanczos"):
+        u, s, vt = np.linalg.svd(mat, full_matrices=False)
+    else:
+        raise ValueError("Unknown method {}".format(method))
+    u, s, vt = u[:, :ncomp], s[:ncomp], vt[:ncomp]
+
+    # Choose signs as NIPALS would, starting from the column with the highest
+    # variance in the deflated matrix
+    colmean = mat.mean(axis=0)
+    colss = (mat * mat).sum(axis=0)
+    umean = u.mean(axis=0)
+    for comp in range(ncomp):
+        if startcol is None:
+            xvar = (colss - nr * colmean**2) / (nr - 1)
+            startcol_use = _startcolumn(xvar)
+        else:
+            startcol_use = startcol
+        if vt[comp, startcol_use] < 0:
+            u[:, comp] = -u[:, comp]
+            vt[comp] = -vt[comp]
+            umean[comp] = -umean[comp]
+        colss = colss - (s[comp] * vt[comp]) ** 2
+        colmean = colmean - s[comp] * umean[comp] * vt[comp]
+    return u * s, vt.T
+
+
+def _kernelmatrix(a, b, kernel, gamma, degree=3, coef0=1.0):
+    """Kernel matrix k(a_i, b_j) of the rows of a and b
+
+    kernel - "rbf" for exp(-gamma |a - b|^2), "poly" for (gamma a'b + coef0)^degree
+    or "linear" for a'b"""
+    prod = a.dot(b.T)
+    if kernel == "rbf":
+        prod *= -2
+        prod += (a * a).sum(axis=1)[:, np.newaxis]
+        prod += (b * b).sum(axis=1)
+        np.maximum(prod, 0, out=prod)
+        prod *= -gamma
+        return np.exp(prod, out=prod)
+    if kernel == "poly":
+        prod *= gamma
+        prod += coef0
+        return np.power(prod, degree, out=prod)
+    if kernel == "linear":
+        return prod
+    raise ValueError("Unknown kernel {}".format(kernel))
+
+
+def _savemodel(path, arrays, meta):
+    """Save arrays and the dict meta (as JSON) in an uncompressed npz file at path
+
+    The data of every array starts at a multiple of 64 bytes in the file, so
+    _loadmodel can map the arrays aligned and without copying. The file can also
+    be read with np.load."""
+    meta = json.dumps(meta, default=lambda value: value.item())
+    arrays = dict(arrays, meta=np.frombuffer(meta.encode(), dtype=np.uint8))
+    with open(path, "wb") as fh, zipfile.ZipFile(fh, "w", allowZip64=True) as zf:
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            info = zipfile.ZipInfo(name + ".npy")
+            zip64 = arr.nbytes > 2**30
+            # The npy header is padded to 64 bytes, pad the local file header (30
+            # bytes, the name, the extra field and the zip64 sizes) to match
+            start = fh.tell() + 30 + len(info.filename) + 4 + 20 * zip64
+            pad = -start % 64
+            info.extra = struct.pack("<HH", 0xD935, pad) + bytes(pad)
+            with zf.open(info, "w", force_zip64=zip64) as entry:
+                np.lib.format.write_array(entry, arr, allow_pickle=False)
+
+
+def _loadmodel(path, model, mmap=True):
+    """Arrays and meta dict of a model saved by _savemodel, checking that it is a
+    model of the given class name
+
+    With mmap, the arrays are read-only views of one memory map of the file, so
+    loading does not read the data and processes that load the same file share
+    its pages. Otherwise the arrays are read into memory."""
+    if mmap:
+        buf = np.memmap(path, mode="r")
+        arrays = {}
+        with open(path, "rb") as fh, zipfile.ZipFile(fh) as zf:
+            for info in zf.infolist():
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError("Compressed files can only be loaded without mmap")
+                # Skip the local file header to the npy header of the entry
+                fh.seek(info.header_offset + 26)
+                namelen, extralen = struct.unpack("<HH", fh.read(4))
+                fh.seek(namelen + extralen, os.SEEK_CUR)
+                if np.lib.format.read_magic(fh) == (1, 0):
+                    shape, fortran, dtype = np.lib.format.read_array_header_1_0(fh)
+                else:
+                    shape, fortran, dtype = np.lib.format.read_array_header_2_0(fh)
+                arr = np.frombuffer(
+                    buf, dtype=dtype, count=math.prod(shape), offset=fh.tell()
+                )
+                arrays[info.filename[:-4]] = arr.reshape(
+                    shape, order="F" if fortran else "C"
+                )
+    else:
+        with np.load(path) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+    meta = json.loads(arrays.pop("meta").tobytes())
+    if meta.get("model") != model:
+        raise ValueError("{} does not contain a saved {} model".format(path, model))
+    return arrays, meta
+
+
+def _labelindex(labels):
+    """Index of labels saved as JSON, where tuples became lists"""
+    return pd.Index([tuple(lab) if isinstance(lab, list) else lab for lab in labels])
+
+
+def _labelframe(columns):
+    """Empty DataFrame with the given columns, which holds the column labels of a
+    model without data"""
+    return pd.DataFrame(np.empty((0, len(columns))), columns=columns)
+
+
+def _sparsedata(mat):
+    """Sparse data as a CSR matrix of floats in canonical format (sorted indices,
+    no duplicate entries)"""
+    mat = mat.tocsr().astype(float, copy=False)
+    if not mat.has_canonical_format:
+        mat = mat.copy()
+        mat.sum_duplicates()
+    if not np.isfinite(mat.data).all():
+        raise ValueError("Sparse data can not contain missing or infinite values")
+    return mat
+
+
+def _sparsemeanstd(mat):
+    """Column means and standard deviations (ddof=1) of a CSR matrix, the
+    deviations of the implicit zeros are added per column instead of densifying"""
+    nr, nc = mat.shape
+    mean = np.asarray(mat.sum(axis=0), dtype=np.float64).ravel() / nr
+    dev = mat.data - mean[mat.indices]
+    nnz = np.bincount(mat.indices, minlength=nc)
+    ss = np.bincount(mat.indices, weights=dev * dev, minlength=nc)
+    ss += (nr - nnz) * mean**2
+    return mean, np.sqrt(ss / (nr - 1))
+
+
+class _SparseResidual(LinearOperator):
+    """The centered, scaled and deflated residual matrix
+    E = (X - shift) / scale - T P' of sparse data X, which is never formed
+
+    Products with E and E' are products with X plus rank one corrections, so they
+    cost O(nnz + (nr + nc) * ncomp) and the data stays sparse. Only what the
+    NIPALS iterations use is available: E.dot, E.T.dot, the columns E[:, j],
+    deflation by _deflate and the statistics of _nanmeanstd, _sumsq and
+    _residualss."""
+
+    def __init__(self, mat, shift=None, scale=None):
+        super(_SparseResidual, self).__init__(np.dtype(np.float64), mat.shape)
+        nr, nc = mat.shape
+        self.mat = mat
+        self.shift = np.zeros(nc) if shift is None else shift
+        self.scale = np.ones(nc) if scale is None else scale
+        self.t = np.empty((nr, 0))
+        self.p = np.empty((nc, 0))
+        # Row and column sums of squares and column sums of the undeflated E
+        d2 = 1 / self.scale**2
+        square = mat.multiply(mat)
+        colsum = np.asarray(mat.sum(axis=0)).ravel()
+        self._rowss = (
+            square.dot(d2)
+            - 2 * mat.dot(self.shift * d2)
+            + self.shift.dot(self.shift * d2)
+        )
+        self._colss = (
+            np.asarray(square.sum(axis=0)).ravel()
+            - 2 * self.shift * colsum
+            + nr * self.shift**2
+        ) * d2
+        self._colsum = (colsum - nr * self.shift) / self.scale
+
+    def _matvec(self, vec):
+        vec = np.ravel(vec)
+        scaled = vec / self.scale
+        return (
+            self.mat.dot(scaled)
+            - self.shift.dot(scaled)
+            - self.t.dot(self.p.T.dot(vec))
+        )
+
+    def _rmatvec(self, vec):
+        vec = np.ravel(vec)
+        xt = (self.mat.T.dot(vec) - self.shift * vec.sum()) / self.scale
+        return xt - self.p.dot(self.t.T.dot(vec))
+
+    def __getitem__(self, key):
+        """The column E[:, j] for the key (slice(None), j)"""
+        rows, col = key
+        unit = np.zeros(self.shape[1])
+        unit[col] = 1.0
+        return self._matvec(unit)[rows]
+
+    def deflate(self, t, p, alpha=1.0):
+        """Rank one deflation E -= alpha * outer(t, p)"""
+        self.t = np.column_stack((self.t, alpha * t))
+        self.p = np.column_stack((self.p, p))
+        return self
+
+    def residualss(self):
+        """Row and column sums of squares of E"""
+        rowss = self._rowss
+        colss = self._colss
+        if self.t.shape[1]:
+            xp = self.mat.dot(self.p / self.scale[:, np.newaxis])
+            xp -= (self.shift / self.scale).dot(self.p)
+            xt = self.mat.T.dot(self.t) - np.outer(self.shift, self.t.sum(axis=0))
+            xt /= self.scale[:, np.newaxis]
+            rowss = rowss + ((self.t.dot(self.p.T.dot(self.p)) - 2 * xp) * self.t).sum(
+                axis=1
+            )
+            colss = colss + ((self.p.dot(self.t.T.dot(self.t)) - 2 * xt) * self.p).sum(
+                axis=1
+            )
+        return np.maximum(rowss, 0), np.maximum(colss, 0)
+
+    def meanstd(self):
+        """Column means and standard deviations (ddof=1) of E"""
+        nr = self.shape[0]
+        mean = (self._colsum - self.p.dot(self.t.sum(axis=0))) / nr
+        colss = self.residualss()[1]
+        return mean, np.sqrt(np.maximum(colss - nr * mean**2, 0) / (nr - 1))
+
+
+class FitStats(object):
+    """Instrumentation of the NIPALS fit of a PLS, Nipals, ChunkedNipals or
+    NonlinearPLS model
+
+    Pass an instance as stats to fit, fit_more then adds to the same records.
+    records has a dict per fitted component with
+        comp - the component number, from 0
+        niter - the iterations of the fit on all rows
+        trace - the squared score changes of these iterations
+        matvec, cv, deflate, total - seconds in the iterations, the CV rounds, the
+            deflation and the whole component
+        bytes - with memory, the peak bytes allocated during the component, as
+            traced by tracemalloc
+    callback(record) is called after every component. Components calculated at
+    once (the blocked and kernel algorithms) are not recorded."""
+
+    def __init__(self, callback=None, memory=False):
+        self.callback = callback
+        self.memory = memory
+        self.records = []
+        self._started = False
+
+    def _begin(self, comp):
+        """Start the record of component comp"""
+        self._record = dict(
+            comp=comp, niter=0, trace=None, matvec=0.0, cv=0.0, deflate=0.0
+        )
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started = True
+            tracemalloc.reset_peak()
+            self._base = tracemalloc.get_traced_memory()[0]
+        self._start = self._last = time.perf_counter()
+
+    def _lap(self, section):
+        """Add the time since the last lap to section of the current record"""
+        now = time.perf_counter()
+        self._record[section] += now - self._last
+        self._last = now
+
+    def _end(self, trace):
+        """Finish the current record with the trace of its iterations"""
+        record = self._record
+        record["total"] = time.perf_counter() - self._start
+        record["trace"] = np.asarray(trace, dtype=float)
+        record["niter"] = len(trace)
+        if self.memory:
+            record["bytes"] = tracemalloc.get_traced_memory()[1] - self._base
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def _finish(self):
+        """Stop tracing memory after a fit, if it was started for the fit"""
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def frame(self):
+        """The records as a DataFrame with a row per component, without the
+        traces"""
+        return pd.DataFrame(
+            [
+                dict((k, v) for k, v in record.items() if k != "trace")
+                for record in self.records
+            ],
+            index=["PC{}".format(record["comp"] + 1) for record in self.records],
+        )
 
 
 class PLS(object):
     """A class for PLS calculated by the NIPALS algorithm.
 
     Initialize with a Pandas DataFrame or an object that can be turned into a DataFrame
-    (e.g. an array or a dict of lists)"""
+    (e.g. an array or a dict of lists). X can also be a scipy.sparse matrix without
+    missing values, which is centered and scaled implicitly in the NIPALS
+    iterations, so the fit takes memory and time in proportion to its nonzeros."""
+
+    # Sparse X data as a CSR matrix, x_df then only holds the column labels
+    x_sparse = None
+    # Results that are built from the arrays in _res on first access
+    _lazyresults = (
+        "R2Xcum",
+        "R2Ycum",
+        "PRESS_SS",
+        "Q2",
+        "Q2cum",
+        "scores",
+        "loadings",
+        "u",
+        "q",
+        "weights",
+        "b",
+        "niter",
+        "traces",
+    )
+    # Results saved by save, besides the statistics of the data and residuals
+    _savedresults = ("loadings", "weights", "q", "b", "R2Xcum", "R2Ycum", "PRESS_SS")
 
     def __init__(self, x_df, y_df):
         super(PLS, self).__init__()
-        if not isinstance(x_df, pd.DataFrame):
-            x_df = pd.DataFrame(x_df)
+        if issparse(y_df):
+            y_df = y_df.toarray()
         if not isinstance(y_df, pd.DataFrame):
             y_df = pd.DataFrame(y_df)
         # Make sure data is numeric
-        self.x_df = x_df.astype("float")
         self.y_df = y_df.astype("float")
+        if issparse(x_df):
+            self.x_sparse = _sparsedata(x_df)
+            self.x_df = _labelframe(pd.RangeIndex(self.x_sparse.shape[1]))
+        else:
+            if not isinstance(x_df, pd.DataFrame):
+                x_df = pd.DataFrame(x_df)
+            self.x_df = x_df.astype("float")
         # Check for and remove infs
         if np.isinf(self.x_df).any().any():
             logging.warning(
@@ -325,26 +1280,188 @@ class PLS(object):
         maxiter=500,
         cv=False,
         dropzerovar=False,
+        dtype=None,
+        n_jobs=None,
+        init=None,
+        keep_training_data=True,
+        algorithm="nipals",
+        accelerate=False,
+        nstarts=1,
+        stats=None,
     ):
-        """The Fit method, will fit a PLS to the X and Y data"""
+        """The Fit method, will fit a PLS to the X and Y data
+
+        Keyword arguments as for Nipals.fit, and:
+        algorithm - "nipals" to iterate every component, or "kernel", "simpls" or
+            "widekernel" to fit complete dense data without cv or init from X'X and
+            X'Y or the row kernel XX', see the ReadMe, defaults to "nipals"
+        init - as for Nipals.fit, a fitted PLS model starts from its Y scores u
+        accelerate, nstarts - as for Nipals.fit, the starts are the Y columns with
+            the highest variance"""
+        if algorithm not in ("nipals", "kernel", "simpls", "widekernel"):
+            raise ValueError("Unknown algorithm {}".format(algorithm))
+        if algorithm != "nipals" and (
+            cv or init is not None or self.x_sparse is not None
+        ):
+            raise ValueError(
+                "cv, init and sparse X data are only available with the nipals "
+                "algorithm"
+            )
+        max_ncomp = min(map(len, self._labels()))
         if ncomp is None:
-            ncomp = min(self.x_df.shape)
-        elif ncomp > min(self.x_df.shape):
-            ncomp = min(self.x_df.shape)
+            ncomp = max_ncomp
+        elif ncomp > max_ncomp:
+            ncomp = max_ncomp
             logging.warning(
                 "ncomp is larger than the max dimension of the x matrix.\n"
                 "fit will only return {} components".format(ncomp)
             )
+        if cv and self.x_sparse is not None:
+            raise ValueError("cv is not available for sparse X data")
+
+        self._preparedata(center, scale, dropzerovar, dtype)
+        if algorithm != "nipals" and (self._x_hasna or self._y_hasna):
+            raise ValueError(
+                "The {} algorithm needs complete data, use nipals for data with "
+                "missing values".format(algorithm)
+            )
+        if cv is True:
+            cv = 7
+        self._fitopts = dict(
+            startcol=startcol,
+            tol=tol,
+            maxiter=maxiter,
+            cv=cv or 0,
+            n_jobs=n_jobs,
+            algorithm=algorithm,
+            accelerate=accelerate,
+            nstarts=nstarts,
+        )
+        self._stats = stats
+        self._initresults()
+        if algorithm == "nipals":
+            self._fitcomps(ncomp, init)
+        else:
+            self._fitkernel(ncomp, algorithm)
+        if not keep_training_data:
+            self.compact()
+        return True
+
+    @staticmethod
+    def fit_many(
+        x_df,
+        y_df,
+        targets=None,
+        ncomp=None,
+        center=True,
+        scale=True,
+        startcol=None,
+        tol=0.000001,
+        maxiter=500,
+        dropzerovar=False,
+        dtype=None,
+        n_jobs=None,
+    ):
+        """Fit one PLS model per target on the same X data and return the fitted
+        models in a list
+
+        targets is a list of Y column labels or lists of labels, each the Y data of
+        one model, and defaults to one model per Y column. The X data is prepared
+        once and the models are fit on n_jobs threads, the other arguments are as in
+        fit. Complete data is fit by kernel PLS from X'X and X'Y calculated once, so
+        fit_more is not available for these models."""
+        base = PLS(x_df, y_df)
+        base._preparedata(center, scale, dropzerovar, dtype)
+        if targets is None:
+            targets = list(base.y_df.columns)
+        targets = [
+            target if isinstance(target, (list, tuple, pd.Index)) else [target]
+            for target in targets
+        ]
+        max_ncomp = min(map(len, base._labels()))
+        if ncomp is None:
+            ncomp = max_ncomp
+        elif ncomp > max_ncomp:
+            ncomp = max_ncomp
+            logging.warning(
+                "ncomp is larger than the max dimension of the x matrix.\n"
+                "fit_many will only return {} components".format(ncomp)
+            )
+        kernel = base.x_sparse is None and not base._x_hasna
+        if kernel:
+            xtx = base.x_mat.T.dot(base.x_mat)
+            xty = base.x_mat.T.dot(np.nan_to_num(base.y_mat))
+            yss = np.nansum(np.square(base.y_mat), axis=0, dtype=np.float64)
+
+        def fitone(cols):
+            idx = base.y_df.columns.get_indexer(cols)
+            if (idx < 0).any():
+                raise ValueError(
+                    "Y data does not have the target column(s) {}".format(cols)
+                )
+            model = PLS.__new__(PLS)
+            model.x_df = base.x_df
+            model.y_df = base.y_df.iloc[:, idx]
+            model.x_sparse = base.x_sparse
+            model.center = center
+            model.scale = scale
+            model.x_mean = base.x_mean
+            model.x_std = base.x_std
+            model.y_mean = base.y_mean[idx]
+            model.y_std = base.y_std[idx]
+            model._nobs = base._nobs
+            model._x_hasna = base._x_hasna
+            model._y_hasna = np.isnan(base.y_mat[:, idx]).any()
+            model._fitopts = dict(
+                startcol=startcol, tol=tol, maxiter=maxiter, cv=0, n_jobs=None
+            )
+            if kernel and not model._y_hasna:
+                model._kernelfit(
+                    _kernelpls(xtx, xty[:, idx], ncomp, yss[idx], startcol),
+                    np.diag(xtx),
+                    yss[idx],
+                    base.x_mat,
+                    base.y_mat[:, idx],
+                    x_hasna=False,
+                )
+                model._setresults()
+                return model
+            if base.x_sparse is not None:
+                model.x_mat = _SparseResidual(
+                    base.x_mat.mat,
+                    base.x_mean if center else None,
+                    base.x_std if scale else None,
+                )
+            else:
+                model.x_mat = base.x_mat.copy()
+            model.y_mat = base.y_mat[:, idx]
+            model._TotalSSX = base._TotalSSX
+            model._TotalSSY = _sumsq(model.y_mat)
+            model._initresults()
+            model._fitcomps(ncomp)
+            return model
+
+        n_jobs = _njobs(n_jobs, len(targets))
+        if n_jobs <= 1:
+            return [fitone(cols) for cols in targets]
+        with ThreadPoolExecutor(n_jobs) as pool:
+            return list(pool.map(fitone, targets))
 
-        # Convert to np array
-        self.x_mat = self.x_df.values
-        self.y_mat = self.y_df.values
+    def _preparedata(self, center, scale, dropzerovar=False, dtype=None):
+        """Copy the data into the working matrices x_mat and y_mat of the given
+        dtype, drop or reject zero variance columns, center and scale, and set the
+        column statistics, total sums of squares and missing value flags"""
+        # Convert to np array, this is the working copy that is deflated in place
+        if self.x_sparse is not None:
+            self.x_mat = self.x_sparse.astype(dtype or float, copy=False)
+            self.x_mean, self.x_std = _sparsemeanstd(self.x_mat)
+        else:
+            self.x_mat = np.array(self.x_df.values, dtype=dtype)
+            self.x_mean, self.x_std = _nanmeanstd(self.x_mat)
+        self.y_mat = np.array(self.y_df.values, dtype=dtype)
         self.center = center
         self.scale = scale
-        self.x_mean = np.nanmean(self.x_mat, axis=0)
-        self.y_mean = np.nanmean(self.y_mat, axis=0)
-        self.x_std = np.nanstd(self.x_mat, axis=0, ddof=1)
-        self.y_std = np.nanstd(self.y_mat, axis=0, ddof=1)
+        self.y_mean, self.y_std = _nanmeanstd(self.y_mat)
 
         # check for zero variance variables
         x_zerovar = self.x_df.columns[self.x_std == 0].tolist()
@@ -352,6 +1469,8 @@ class PLS(object):
         if len(x_zerovar) > 0:
             if dropzerovar:
                 self.x_mat = self.x_mat[:, self.x_std != 0]
+                if self.x_sparse is not None:
+                    self.x_sparse = self.x_sparse[:, self.x_std != 0]
                 self.x_mean = self.x_mean[self.x_std != 0]
                 self.x_std = self.x_std[self.x_std != 0]
                 self.x_df = self.x_df.drop(x_zerovar, axis=1)
@@ -376,234 +1495,969 @@ class PLS(object):
                     + 'Recall with "dropzerovar=True" to drop automatically'
                 )
 
+        if self.x_sparse is not None:
+            self.x_mat = _SparseResidual(
+                self.x_mat,
+                self.x_mean if center else None,
+                self.x_std if scale else None,
+            )
+        else:
+            if center:
+                self.x_mat -= self.x_mean
+            if scale:
+                self.x_mat /= self.x_std
         if center:
-            self.x_mat = self.x_mat - self.x_mean
-            self.y_mat = self.y_mat - self.y_mean
+            self.y_mat -= self.y_mean
         if scale:
-            self.x_mat = self.x_mat / self.x_std
-            self.y_mat = self.y_mat / self.y_std
+            self.y_mat /= self.y_std
+
+        self._TotalSSX = _sumsq(self.x_mat)
+        self._TotalSSY = _sumsq(self.y_mat)
+        self._nobs = self.x_mat.shape[0]
 
-        TotalSSX = np.nansum(self.x_mat * self.x_mat)
-        TotalSSY = np.nansum(self.y_mat * self.y_mat)
+        # NA handling, sparse data has no missing values
+        if self.x_sparse is not None:
+            self._x_hasna = False
+        else:
+            x_miss = np.isnan(self.x_mat)
+            self._x_hasna = x_miss.any()
+            if x_miss.all(axis=1).any():
+                raise ValueError("X matrix contains row with only NA values")
+        self._y_hasna = np.isnan(self.y_mat).any()
+        if self._x_hasna or self._y_hasna:
+            logging.info("Data has NA values")
+
+    def _initresults(self):
+        """Empty result arrays with one column per component for the working
+        matrices"""
         nr, x_nc = self.x_mat.shape
         y_nc = self.y_mat.shape[1]
-        # initialize outputs
-        # eig = np.empty((ncomp,))
-        R2Xcum = np.empty((ncomp,))
-        R2Ycum = np.empty((ncomp,))
-        PRESS_SS = np.empty((ncomp,))
-        loadings = np.empty((x_nc, ncomp))
-        scores = np.empty((nr, ncomp))
-        u = np.empty((nr, ncomp))
-        weights = np.empty((x_nc, ncomp))
-        q = np.empty((y_nc, ncomp))
-        b = np.empty((ncomp,))
+        self._res = dict(
+            scores=np.empty((nr, 0)),
+            loadings=np.empty((x_nc, 0)),
+            u=np.empty((nr, 0)),
+            q=np.empty((y_nc, 0)),
+            weights=np.empty((x_nc, 0)),
+            b=np.empty((0,)),
+            R2Xcum=np.empty((0,)),
+            R2Ycum=np.empty((0,)),
+            PRESS_SS=np.empty((0,)),
+            niter=np.empty((0,), dtype=int),
+        )
+        self._traces = []
 
-        # NA handling
-        x_miss = np.isnan(self.x_mat)
-        x_hasna = x_miss.any()
-        if x_miss.all(axis=1).any():
-            raise ValueError("X matrix contains row with only NA values")
-        y_miss = np.isnan(self.y_mat)
-        y_hasna = y_miss.any()
-        if x_hasna or y_hasna:
-            logging.info("Data has NA values")
+    def fit_more(self, ncomp=1, init=None):
+        """Add ncomp components to a fitted model
 
-        if cv:
-            if cv is True:
-                cv = 7
-            cvn = int(np.ceil(nr / cv))
-            cvgroups = np.array(range(cvn * cv)).reshape(cvn, cv).T
-        else:
-            cv = 0
-        for comp in range(ncomp):
-            PRESS = 0
-            for cvround in range(cv + 1):
-                if cvround >= cv:
-                    # Calculate on full matrix after CV rounds
-                    train_x_mat = self.x_mat
-                    train_y_mat = self.y_mat
-                else:
-                    train_x_mat = np.delete(
-                        self.x_mat,
-                        [skp for skp in cvgroups[cvround] if skp < self.x_mat.shape[0]],
-                        0,
-                    )
-                    train_y_mat = np.delete(
-                        self.y_mat,
-                        [skp for skp in cvgroups[cvround] if skp < self.y_mat.shape[0]],
-                        0,
-                    )
-                nrt, x_nct = train_x_mat.shape
-                y_nct = train_y_mat.shape[1]
-                train_x_miss = np.isnan(train_x_mat)
-                train_y_miss = np.isnan(train_y_mat)
-                # Set u to some column of Y
-                if startcol is None:
-                    yvar = np.nanvar(self.y_mat, axis=0, ddof=1)
-                    startcol_use = np.where(yvar == yvar.max())[0][0]
-                else:
-                    startcol_use = startcol
-                logging.info(
-                    "PC {}, starting with column {}".format(comp, startcol_use)
-                )
+        The new components are calculated from the deflated X and Y data, with the
+        settings of the last call to fit. init works as in fit, with the columns of
+        the start vectors counted from the first component of the model."""
+        ncomp_max = min(map(len, self._labels())) - self._res["b"].shape[0]
+        if self._fitopts.get("updated"):
+            raise RuntimeError(
+                "fit_more is not available after partial_fit, refit the model"
+            )
+        if self._fitopts.get("compact") or not hasattr(self, "x_mat"):
+            raise RuntimeError(
+                "fit_more needs the deflated training data, refit the model"
+            )
+        if ncomp > ncomp_max:
+            ncomp = ncomp_max
+            logging.warning(
+                "ncomp is larger than the max dimension of the x matrix.\n"
+                "fit_more will only add {} components".format(ncomp)
+            )
+        self._fitcomps(ncomp, init)
+        return True
 
-                if y_hasna:
-                    train_y_mat_0 = np.nan_to_num(train_y_mat)
-                    uh = train_y_mat_0[:, startcol_use]
-                else:
-                    uh = train_y_mat[:, startcol_use]
-                th = uh
-
-                if x_hasna:
-                    train_x_mat_0 = np.nan_to_num(train_x_mat)
-
-                it = 0
-                while True:
-                    # X-block weights
-                    if x_hasna:
-                        U2 = np.repeat(uh * uh, x_nct)
-                        U2.shape = (nrt, x_nct)
-                        U2[train_x_miss] = 0
-                        wh = train_x_mat_0.T.dot(uh) / U2.sum(axis=0)
-                    else:
-                        wh = train_x_mat.T.dot(uh) / sum(uh * uh)
-                    # Normalize
-                    wh = wh / math.sqrt(np.nansum(wh * wh))
-
-                    # X-block Scores
-                    th_old = th
-                    if x_hasna:
-                        W2 = np.repeat(wh * wh, nrt)
-                        W2.shape = (x_nct, nrt)
-                        W2[train_x_miss.T] = 0
-                        th = train_x_mat_0.dot(wh) / W2.sum(axis=0)
-                    else:
-                        th = train_x_mat.dot(wh) / sum(wh * wh)
-
-                    # Y-block weights
-                    if y_hasna:
-                        T2 = np.repeat(th * th, y_nct)
-                        T2.shape = (nrt, y_nct)
-                        T2[train_y_miss] = 0
-                        qh = train_y_mat_0.T.dot(th) / T2.sum(axis=0)
-                    else:
-                        qh = train_y_mat.T.dot(th) / sum(th * th)
-                    # Normalize
-                    # According to Analytica Chimica Acta, 185 (1986) 1-17 this normalization
-                    # should be done. However, if so, the results are not the same as th R package
-                    # pls plsr method or Evince.
-                    # qh = qh / math.sqrt(np.nansum(qh*qh))
-
-                    # Y-block Scores
-                    if y_hasna:
-                        Q2 = np.repeat(qh * qh, nrt)
-                        Q2.shape = (y_nct, nrt)
-                        Q2[train_y_miss.T] = 0
-                        uh = train_y_mat_0.dot(qh) / Q2.sum(axis=0)
-                    else:
-                        uh = train_y_mat.dot(qh) / sum(qh * qh)
-
-                    # Check convergence
-                    if np.nansum((th - th_old) ** 2) < tol:
-                        break
-                    it += 1
-                    if it >= maxiter:
-                        raise RuntimeError(
-                            "Convergence was not reached in {} iterations for component {}".format(
-                                maxiter, comp
-                            )
-                        )
+    def partial_fit(self, new_x, new_y, forget=1.0):
+        """Update a fitted model with new observations (recursive PLS)
 
-                # Calculate PRESS for this CV
-                if cvround < cv:
-                    pred_x_mat = self.x_mat[[i for i in cvgroups[cvround] if i < nr]]
-                    pred_y_mat = self.y_mat[[i for i in cvgroups[cvround] if i < nr]]
-                    pred_x_mat = np.nan_to_num(pred_x_mat)
-                    cv_th = pred_x_mat.dot(wh) / sum(wh * wh)
-                    cv_bh = sum(uh * th) / sum(th**2)
-                    cv_res = pred_y_mat - cv_bh * np.outer(cv_th, qh)
-                    cv_res[np.isnan(pred_y_mat)] = 0
-                    PRESS += np.sum(cv_res**2)
+        The new rows are folded into the cross products X'X and X'Y and the column
+        statistics of the model, with the old data down-weighted by forget per new
+        row (e.g. 0.99 for a moving window of about 100 rows, defaults to 1), and the
+        components are recalculated from these by kernel PLS.
 
-            PRESS_SS[comp] = PRESS / np.nansum(self.y_mat * self.y_mat)
+        Missing values in the new rows are replaced by the column means. Afterwards
+        scores, u, dModX and dModY refer to the new rows, cross validation results
+        are removed and fit_more is not available."""
+        new_x, new_mat = _newdata(new_x, self._labels()[1])
+        _, new_ymat = _newdata(new_y, self.y_df.columns)
+        if new_mat.shape[0] != new_ymat.shape[0]:
+            raise ValueError("New X and Y data have different numbers of rows")
+        nb = new_mat.shape[0]
+        weight = forget**nb
+        ncomp = self._res["b"].shape[0]
+        if not hasattr(self, "_sketch"):
+            if self._fitopts.get("compact"):
+                raise RuntimeError(
+                    "partial_fit of a model without the training data is only "
+                    "available if it was updated before the data was dropped"
+                )
+            self._sketch = self._initsketch()
+        sketch = self._sketch
 
-            # Calculate X loadings and rescale the scores and weights
-            if x_hasna:
-                T2 = np.repeat(th * th, x_nc)
-                T2.shape = (nr, x_nc)
-                T2[x_miss] = 0
-                ph = train_x_mat_0.T.dot(th) / T2.sum(axis=0)
-            else:
-                ph = train_x_mat.T.dot(th) / sum(th * th)
-            # Normalize
-            # According to Analytica Chimica Acta, 185 (1986) 1-17 this normalization
-            # should be done. However, if so, the results are not the same as th R package
-            # pls plsr method or Evince.
-            # pold_len = math.sqrt(np.nansum(ph*ph))
+        # Cross products and column statistics, with the old data down-weighted
+        new_xmean = np.nan_to_num(np.nanmean(new_mat, axis=0))
+        new_ymean = np.nan_to_num(np.nanmean(new_ymat, axis=0))
+        x_c = np.nan_to_num(new_mat - new_xmean)
+        y_c = np.nan_to_num(new_ymat - new_ymean)
+        x_d = new_xmean - self.x_mean
+        y_d = new_ymean - self.y_mean
+        share = weight * self._nobs * nb / (weight * self._nobs + nb)
+        sketch["xx"] = (
+            weight * sketch["xx"] + x_c.T.dot(x_c) + share * np.outer(x_d, x_d)
+        )
+        sketch["xy"] = (
+            weight * sketch["xy"] + x_c.T.dot(y_c) + share * np.outer(x_d, y_d)
+        )
+        self._nobs = weight * self._nobs + nb
+        sketch["x_count"], self.x_mean, x_m2 = _combinestats(
+            (sketch["x_count"], self.x_mean, self.x_std**2 * (sketch["x_count"] - 1)),
+            new_mat,
+            weight,
+        )
+        sketch["y_count"], self.y_mean, y_m2 = _combinestats(
+            (sketch["y_count"], self.y_mean, self.y_std**2 * (sketch["y_count"] - 1)),
+            new_ymat,
+            weight,
+        )
+        self.x_std = np.sqrt(x_m2 / (sketch["x_count"] - 1))
+        self.y_std = np.sqrt(y_m2 / (sketch["y_count"] - 1))
+
+        # Cross products of the preprocessed data
+        x_offset = 0 if self.center else self.x_mean
+        y_offset = 0 if self.center else self.y_mean
+        x_scale = self.x_std if self.scale else np.ones_like(self.x_std)
+        y_scale = self.y_std if self.scale else np.ones_like(self.y_std)
+        xtx = (sketch["xx"] + self._nobs * np.outer(x_offset, x_offset)) / np.outer(
+            x_scale, x_scale
+        )
+        xty = (sketch["xy"] + self._nobs * np.outer(x_offset, y_offset)) / np.outer(
+            x_scale, y_scale
+        )
+        yss = (y_m2 + sketch["y_count"] * y_offset**2) / y_scale**2
+        new_mat = (new_mat - (self.x_mean if self.center else 0)) / x_scale
+        new_ymat = (new_ymat - (self.y_mean if self.center else 0)) / y_scale
+        comps = _kernelpls(xtx, xty, ncomp, yss, self._fitopts.get("startcol"))
+        self._kernelfit(comps, np.diag(xtx), yss, new_mat, new_ymat)
+        self._fitopts.update(cv=0, updated=True)
+        for attr in ("PRESS_SS", "Q2", "Q2cum", "niter", "traces"):
+            self.__dict__.pop(attr, None)
+        self._setresults(new_x.index)
+        return True
+
+    def _fitkernel(self, ncomp, algorithm):
+        """Fit ncomp components of complete data by a kernel algorithm (see fit)
+        and deflate the working matrices as NIPALS would"""
+        startcol = self._fitopts["startcol"]
+        yss = _residualss(self.y_mat)[1]
+        if algorithm == "widekernel":
+            xss = _residualss(self.x_mat)[1]
+            comps = _widekernelpls(self.x_mat, self.y_mat, ncomp, startcol)
+        else:
+            xtx = self.x_mat.T.dot(self.x_mat)
+            xty = self.x_mat.T.dot(self.y_mat)
+            xss = np.diag(xtx)
+            pls = _kernelpls if algorithm == "kernel" else _simpls
+            comps = pls(xtx, xty, ncomp, yss, startcol)
+        self._kernelfit(comps, xss, yss, self.x_mat, self.y_mat, x_hasna=False)
+        self._res["niter"] = np.zeros(ncomp, dtype=int)
+        self._traces = [np.empty((0,)) for _ in range(ncomp)]
+        for comp in range(ncomp):
+            th = self._res["scores"][:, comp]
+            _deflate(self.x_mat, th, self._res["loadings"][:, comp])
+            _deflate(self.y_mat, th, self._res["q"][:, comp])
+        self._setresults()
+
+    def _kernelfit(self, comps, xss, yss, x_mat, y_mat, x_hasna=True):
+        """Set the results of the components comps (weights, loadings, q,
+        rotations, t't as from _kernelpls) of preprocessed data with the column
+        sums of squares xss and yss, with the scores and residuals of the
+        preprocessed rows x_mat and y_mat (missing values as NaN, x_hasna=False
+        skips their replacement in X)
+
+        The rows are scored in chunks, so no other full size matrix than x_mat is
+        needed."""
+        weights, loadings, q, rotations, tt = comps
+        ncomp = tt.shape[0]
+        self._tt = tt
+
+        # Explained and residual sums of squares of the model
+        self._TotalSSX = xss.sum()
+        self._TotalSSY = yss.sum()
+        self._xssres = np.maximum(xss - (loadings * loadings).dot(tt), 0)
+        self._yssres = np.maximum(yss - (q * q).dot(tt), 0)
+
+        # Scores and residuals of the rows
+        nr = x_mat.shape[0]
+        scores = np.empty((nr, ncomp))
+        self._xrowss = np.empty(nr)
+        for rows in _rowchunks(x_mat):
+            x_rows = np.nan_to_num(x_mat[rows]) if x_hasna else x_mat[rows]
+            scores[rows] = x_rows.dot(rotations)
+            self._xrowss[rows] = (np.nansum if x_hasna else np.sum)(
+                np.square(x_mat[rows] - scores[rows].dot(loadings.T)), axis=1
+            )
+        y_res = np.nan_to_num(y_mat)
+        u = np.empty((nr, ncomp))
+        for comp in range(ncomp):
+            u[:, comp] = y_res.dot(q[:, comp]) / q[:, comp].dot(q[:, comp])
+            _deflate(y_res, scores[:, comp], q[:, comp])
+        self._yrowss = _residualss(y_mat - scores.dot(q.T))[0]
+
+        self._res = dict(
+            scores=scores,
+            loadings=loadings,
+            u=u,
+            q=q,
+            weights=weights,
+            b=np.ones((ncomp,)),
+            R2Xcum=np.cumsum((loadings * loadings).sum(axis=0) * tt) / self._TotalSSX,
+            R2Ycum=np.cumsum((q * q).sum(axis=0) * tt) / self._TotalSSY,
+            PRESS_SS=np.empty((0,)),
+        )
+
+    def compact(self):
+        """Drop the training data and working matrices of a fitted model
+
+        The data (x_df and y_df keep the column labels only, x_sparse), the
+        deflated x_mat and y_mat and the Y scores u are removed. The model keeps
+        its results, the X scores and the per-row residual sums of squares of
+        dModX and dModY, so it still predicts and scores new data and plots its
+        scores. fit_more is no longer available, and partial_fit only if it was
+        called before compact; it sets scores and u of its new rows.
+        """
+        # The scores are kept as their DataFrame
+        self.scores
+        self.x_df = _labelframe(self.x_df.columns)
+        self.y_df = _labelframe(self.y_df.columns)
+        for attr in ("x_sparse", "x_mat", "y_mat", "u"):
+            self.__dict__.pop(attr, None)
+        ncomp = self._res["b"].shape[0]
+        self._res.update(scores=np.empty((0, ncomp)), u=np.empty((0, ncomp)))
+        self._fitopts["compact"] = True
+        return True
+
+    def _initsketch(self):
+        """Cross products about the means and column counts of the fitted data,
+        with missing values replaced by the column means"""
+        y_c = np.nan_to_num(np.array(self.y_df.values) - self.y_mean)
+        if self.x_sparse is not None:
+            # Sparse data is complete, the cross products are corrected for the
+            # means instead of centering
+            mat = self.x_sparse
+            nr, nc = mat.shape
+            return dict(
+                xx=mat.T.dot(mat).toarray() - nr * np.outer(self.x_mean, self.x_mean),
+                xy=mat.T.dot(y_c) - np.outer(self.x_mean, y_c.sum(axis=0)),
+                x_count=np.full(nc, nr),
+                y_count=self.y_df.notna().values.sum(axis=0),
+            )
+        x_c = np.nan_to_num(np.array(self.x_df.values) - self.x_mean)
+        return dict(
+            xx=x_c.T.dot(x_c),
+            xy=x_c.T.dot(y_c),
+            x_count=self.x_df.notna().values.sum(axis=0),
+            y_count=self.y_df.notna().values.sum(axis=0),
+        )
+
+    def _labels(self):
+        """Row and column labels of the X data, the rows of sparse X data are those
+        of Y"""
+        index = self.x_df.index if self.x_sparse is None else self.y_df.index
+        return index, self.x_df.columns
+
+    def _scorestats(self, comps):
+        """Means and variances of the scores comps and the number of observations
+        of the model, for the Hotelling ellipse of a model updated by partial_fit.
+        None for a fitted model, whose scores are its data."""
+        if not self._fitopts.get("updated"):
+            return None, None, None
+        idx = [self._pcs().get_loc(comp) for comp in comps]
+        tt = self._tt[idx]
+        if self.center:
+            mean = np.zeros(len(idx))
+        else:
+            mean = (self.x_mean / (self.x_std if self.scale else 1)).dot(
+                self._rotations[:, idx]
+            )
+        return mean, (tt - self._nobs * mean**2) / (self._nobs - 1), self._nobs
+
+    def _fitcomps(self, ncomp, init=None):
+        """Calculate ncomp more components from the deflated data and update the
+        results"""
+        startcol = self._fitopts["startcol"]
+        tol = self._fitopts["tol"]
+        maxiter = self._fitopts["maxiter"]
+        cv = self._fitopts["cv"]
+        accelerate = self._fitopts.get("accelerate", False)
+        stats = getattr(self, "_stats", None)
+        x_hasna = self._x_hasna
+        y_hasna = self._y_hasna
+        nr, x_nc = self.x_mat.shape
+        y_nc = self.y_mat.shape[1]
+        firstcomp = self._res["b"].shape[0]
+        init = _startvectors(init, nr, "u")
+
+        # initialize outputs
+        # eig = np.empty((ncomp,))
+        R2Xcum = np.empty((ncomp,))
+        R2Ycum = np.empty((ncomp,))
+        PRESS_SS = np.empty((ncomp,))
+        loadings = np.empty((x_nc, ncomp))
+        scores = np.empty((nr, ncomp))
+        u = np.empty((nr, ncomp))
+        weights = np.empty((x_nc, ncomp))
+        q = np.empty((y_nc, ncomp))
+        b = np.empty((ncomp,))
+        niter = np.empty((ncomp,), dtype=int)
+
+        if cv:
+            # Row i is left out in CV round i % cv. The training rows of every
+            # round are gathered into buffers that are reused for all components,
+            # one set of buffers per worker
+            n_jobs = _njobs(self._fitopts["n_jobs"], cv)
+            cvtest = [np.arange(cvround, nr, cv) for cvround in range(cv)]
+            cvtrain = [np.setdiff1d(np.arange(nr), test) for test in cvtest]
+            ntrain = max(len(train) for train in cvtrain)
+
+            def buffer(mat, needed=True):
+                if needed:
+                    return np.empty((ntrain, mat.shape[1]), dtype=mat.dtype)
+
+            cvbuffers = [
+                (
+                    buffer(self.x_mat),
+                    buffer(self.y_mat),
+                    buffer(self.x_mat, x_hasna),
+                    buffer(self.y_mat, y_hasna),
+                )
+                for _ in range(n_jobs)
+            ]
+        for i, comp in enumerate(range(firstcomp, firstcomp + ncomp)):
+            # Set u to some column of Y, or to the start vector
+            uh0 = None
+            if init is not None and comp < init.shape[1]:
+                uh0 = init[:, comp]
+                startcol_use = None
+                logging.info("PC {}, starting with given vector".format(comp))
+            else:
+                if startcol is None:
+                    yvar = np.nanvar(self.y_mat, axis=0, ddof=1)
+                    startcol_use = _startcolumn(yvar)
+                else:
+                    startcol_use = startcol
+                logging.info(
+                    "PC {}, starting with column {}".format(comp, startcol_use)
+                )
+            if stats is not None:
+                stats._begin(comp)
+
+            # CV rounds
+            PRESS = 0
+            for fold_press in _cvmap(
+                lambda cvround, worker: self._cvpress(
+                    cvtrain[cvround],
+                    cvtest[cvround],
+                    cvbuffers[worker],
+                    comp,
+                    startcol_use,
+                    tol,
+                    maxiter,
+                    None if uh0 is None else uh0[cvtrain[cvround]],
+                    accelerate,
+                ),
+                cv,
+                n_jobs if cv else 1,
+            ):
+                PRESS += fold_press
+            PRESS_SS[i] = PRESS / np.nansum(self.y_mat * self.y_mat)
+            if stats is not None:
+                stats._lap("cv")
+
+            # Calculate on full matrix after CV rounds. Observed-value masks, the
+            # missing data denominators are calculated as matrix-vector products
+            # against these
+            if x_hasna:
+                x_obs = (~np.isnan(self.x_mat)).astype(self.x_mat.dtype)
+                x_mat_0 = np.nan_to_num(self.x_mat)
+            else:
+                x_obs = None
+                x_mat_0 = self.x_mat
+            if y_hasna:
+                y_obs = (~np.isnan(self.y_mat)).astype(self.y_mat.dtype)
+                y_mat_0 = np.nan_to_num(self.y_mat)
+            else:
+                y_obs = None
+                y_mat_0 = self.y_mat
+            th, uh, wh, qh, trace = self._racecomp(
+                (x_mat_0, y_mat_0, x_obs, y_obs), comp, startcol_use, uh0
+            )
+            niter[i] = len(trace)
+            self._traces.append(np.array(trace))
+            if stats is not None:
+                stats._lap("matvec")
+
+            # Calculate X loadings and rescale the scores and weights
+            if x_hasna:
+                ph = x_mat_0.T.dot(th) / x_obs.T.dot(th * th)
+            else:
+                ph = x_mat_0.T.dot(th) / th.dot(th)
+            # Normalize
+            # According to Analytica Chimica Acta, 185 (1986) 1-17 this normalization
+            # should be done. However, if so, the results are not the same as th R package
+            # pls plsr method or Evince.
+            # pold_len = math.sqrt(np.nansum(ph*ph))
             # ph = ph / pold_len
             # th = th * pold_len
             # wh = wh * pold_len
-            loadings[:, comp] = ph
-            scores[:, comp] = th
-            u[:, comp] = uh
-            q[:, comp] = qh
-            weights[:, comp] = wh
-            bh = sum(uh * th) / sum(th**2)
-            b[comp] = bh
+            loadings[:, i] = ph
+            scores[:, i] = th
+            u[:, i] = uh
+            q[:, i] = qh
+            weights[:, i] = wh
+            if y_hasna:
+                # Rows without observed Y values have u = 0 and are left out of
+                # the inner relation
+                th_y = th * y_obs.any(axis=1)
+                bh = uh.dot(th) / th_y.dot(th_y)
+            else:
+                bh = uh.dot(th) / th.dot(th)
+            b[i] = bh
 
-            self.x_mat = self.x_mat - np.outer(th, ph)
-            self.y_mat = self.y_mat - bh * np.outer(th, qh)
+            _deflate(self.x_mat, th, ph)
+            _deflate(self.y_mat, th, qh, bh)
 
             # Cumulative proportion of variance explained
-            R2Xcum[comp] = 1 - (np.nansum(self.x_mat * self.x_mat) / TotalSSX)
-            R2Ycum[comp] = 1 - (np.nansum(self.y_mat * self.y_mat) / TotalSSY)
+            R2Xcum[i] = 1 - (_sumsq(self.x_mat) / self._TotalSSX)
+            R2Ycum[i] = 1 - (_sumsq(self.y_mat) / self._TotalSSY)
+            if stats is not None:
+                stats._lap("deflate")
+                stats._end(trace)
+        if stats is not None:
+            stats._finish()
+
+        for key, value in (
+            ("scores", scores),
+            ("loadings", loadings),
+            ("u", u),
+            ("q", q),
+            ("weights", weights),
+            ("b", b),
+            ("R2Xcum", R2Xcum),
+            ("R2Ycum", R2Ycum),
+            ("PRESS_SS", PRESS_SS),
+            ("niter", niter),
+        ):
+            self._res[key] = np.concatenate((self._res[key], value), axis=-1)
+        self._xrowss, self._xssres = _residualss(self.x_mat)
+        self._yrowss, self._yssres = _residualss(self.y_mat)
+        self._tt = (self._res["scores"] ** 2).sum(axis=0)
+        self._setresults()
+
+    def _racecomp(self, mats, comp, startcol, uh0=None):
+        """NIPALS iteration for component comp of the deflated data mats (x_mat,
+        y_mat and their observed-value masks as in _onecomp), from nstarts start
+        vectors raced on n_jobs threads (see fit). Returns th, uh, wh, qh and the
+        trace of the start that converged first, with the signs that the first
+        start gives, i.e. th'u0 > 0 for its start vector u0."""
+        tol = self._fitopts["tol"]
+        maxiter = self._fitopts["maxiter"]
+        accelerate = self._fitopts.get("accelerate", False)
+        nstarts = min(self._fitopts.get("nstarts", 1), mats[1].shape[1])
+        columns = []
+        if nstarts > 1:
+            # The other starts are the Y columns with the highest variance
+            yvar = np.nanvar(self.y_mat, axis=0)
+            order = np.argsort(-yvar, kind="stable")
+            columns = [col for col in order if col != startcol][: nstarts - 1]
+
+        def run(start, stop):
+            trace = []
+            result = self._onecomp(
+                *mats,
+                comp,
+                startcol if start == 0 else columns[start - 1],
+                tol,
+                maxiter,
+                uh0 if start == 0 else None,
+                accelerate,
+                trace,
+                stop,
+            )
+            return None if result is None else result + (trace,)
+
+        if nstarts <= 1:
+            return run(0, None)
+        th, uh, wh, qh, trace = _race(
+            run, nstarts, _njobs(self._fitopts["n_jobs"], nstarts), comp
+        )
+        uh0 = mats[1][:, startcol] if uh0 is None else uh0
+        if th.dot(uh0) < 0:
+            th, uh, wh, qh = -th, -uh, -wh, -qh
+        return th, uh, wh, qh, trace
+
+    def _setresults(self, index=None):
+        """Set the results that predictions need from the collected arrays, index
+        defaults to the rows of the data. The Series and DataFrames of the
+        results (_lazyresults) are built from the arrays on first access, so
+        fits that only read a few of them do not build the others. They are
+        copies, so editing them does not change the model."""
+        if index is None:
+            index = self._labels()[0]
+        self._resindex = index
+        for attr in self._lazyresults:
+            self.__dict__.pop(attr, None)
+        R2Xcum = self._res["R2Xcum"]
+        R2Ycum = self._res["R2Ycum"]
 
         # "Uncumulate" R2
         self.R2X = np.insert(np.diff(R2Xcum), 0, R2Xcum[0])
         self.R2Y = np.insert(np.diff(R2Ycum), 0, R2Ycum[0])
-        self.R2Xcum = pd.Series(
-            R2Xcum, index=["PC{}".format(i + 1) for i in range(ncomp)]
+
+        # Regression coefficients and intercepts in the units of the data, Y =
+        # X coef + intercept, with the rotations for the scores T = X R
+        self._rotations = _rotations(self._res["weights"], self._res["loadings"])
+        x_center = self.x_mean if self.center else np.zeros_like(self.x_mean)
+        y_center = self.y_mean if self.center else np.zeros_like(self.y_mean)
+        x_scale = self.x_std if self.scale else np.ones_like(self.x_std)
+        y_scale = self.y_std if self.scale else np.ones_like(self.y_std)
+        self._coef = (
+            (self._rotations * self._res["b"]).dot(self._res["q"].T)
+            / x_scale[:, np.newaxis]
+            * y_scale
         )
-        self.R2Ycum = pd.Series(
-            R2Ycum, index=["PC{}".format(i + 1) for i in range(ncomp)]
+        self._intercept = y_center - x_center.dot(self._coef)
+
+    def _pcs(self):
+        """Labels of the components of the model"""
+        return _pcindex(self._res["b"].shape[0])
+
+    @functools.cached_property
+    def R2Xcum(self):
+        return pd.Series(self._res["R2Xcum"], index=self._pcs(), copy=True)
+
+    @functools.cached_property
+    def R2Ycum(self):
+        return pd.Series(self._res["R2Ycum"], index=self._pcs(), copy=True)
+
+    @functools.cached_property
+    def PRESS_SS(self):
+        if not self._fitopts["cv"]:
+            raise AttributeError("PRESS_SS is only available after a fit with cv")
+        return pd.Series(self._res["PRESS_SS"], index=self._pcs(), copy=True)
+
+    @functools.cached_property
+    def Q2(self):
+        return 1 - self.PRESS_SS
+
+    @functools.cached_property
+    def Q2cum(self):
+        return 1 - np.cumprod(self.PRESS_SS)
+
+    @functools.cached_property
+    def scores(self):
+        return pd.DataFrame(
+            self._res["scores"], index=self._resindex, columns=self._pcs(), copy=True
         )
 
-        if cv:
-            self.PRESS_SS = pd.Series(
-                PRESS_SS, index=["PC{}".format(i + 1) for i in range(ncomp)]
+    @functools.cached_property
+    def loadings(self):
+        return pd.DataFrame(
+            self._res["loadings"],
+            index=self.x_df.columns,
+            columns=self._pcs(),
+            copy=True,
+        )
+
+    @functools.cached_property
+    def u(self):
+        if self._res["u"].shape[0] != len(self._resindex):
+            # compact drops the Y scores of the training rows, partial_fit sets
+            # those of its new rows
+            raise AttributeError(
+                "u of the training data is not available after compact, only "
+                "u of the rows of a later partial_fit"
             )
-            self.Q2 = 1 - self.PRESS_SS
-            self.Q2cum = 1 - np.cumprod(self.PRESS_SS)
-
-        # Convert results to DataFrames
-        self.scores = pd.DataFrame(
-            scores,
-            index=self.x_df.index,
-            columns=["PC{}".format(i + 1) for i in range(ncomp)],
+        return pd.DataFrame(
+            self._res["u"], index=self._resindex, columns=self._pcs(), copy=True
         )
-        self.loadings = pd.DataFrame(
-            loadings,
+
+    @functools.cached_property
+    def q(self):
+        return pd.DataFrame(
+            self._res["q"], index=self.y_df.columns, columns=self._pcs(), copy=True
+        )
+
+    @functools.cached_property
+    def weights(self):
+        return pd.DataFrame(
+            self._res["weights"],
             index=self.x_df.columns,
-            columns=["PC{}".format(i + 1) for i in range(ncomp)],
+            columns=self._pcs(),
+            copy=True,
         )
-        self.u = pd.DataFrame(
-            u,
-            index=self.x_df.index,
-            columns=["PC{}".format(i + 1) for i in range(ncomp)],
+
+    @functools.cached_property
+    def b(self):
+        return pd.Series(self._res["b"], index=self._pcs(), copy=True)
+
+    @functools.cached_property
+    def niter(self):
+        if "niter" not in self._res:
+            raise AttributeError("niter is not available after partial_fit")
+        return pd.Series(self._res["niter"], index=self._pcs(), copy=True)
+
+    @functools.cached_property
+    def traces(self):
+        if "niter" not in self._res:
+            raise AttributeError("traces are not available after partial_fit")
+        return dict(zip(self._pcs(), self._traces))
+
+    def _onecomp(
+        self,
+        x_mat,
+        y_mat,
+        x_obs,
+        y_obs,
+        comp,
+        startcol,
+        tol,
+        maxiter,
+        uh0=None,
+        accelerate=False,
+        trace=None,
+        stop=None,
+    ):
+        """NIPALS iteration for one PLS component
+
+        x_mat and y_mat have their missing values set to 0 and x_obs and y_obs are
+        the observed-value masks, or None if there are no missing values. The
+        iteration starts from uh0 if given, otherwise from column startcol of Y.
+        With accelerate and complete data, the weights are found by _lobpcg as
+        the dominant eigenvector of X'YY'X. The squared changes of the scores are
+        appended to trace, and None is returned as soon as stop (a
+        threading.Event) is set."""
+        uh = y_mat[:, startcol] if uh0 is None else uh0
+        if accelerate and x_obs is None and y_obs is None:
+
+            def image(wh):
+                th = x_mat.dot(wh)
+                return th, y_mat.T.dot(th)
+
+            result = _lobpcg(
+                x_mat.T.dot(uh),
+                image,
+                lambda yt: x_mat.T.dot(y_mat.dot(yt)),
+                tol,
+                maxiter,
+                comp,
+                trace,
+                stop,
+            )
+            if result is None:
+                return None
+            wh, (th, yt) = result
+            qh = yt / th.dot(th)
+            return th, y_mat.dot(qh) / qh.dot(qh), wh, qh
+        th = uh
+        it = 0
+        while True:
+            if stop is not None and stop.is_set():
+                return None
+            # X-block weights
+            if x_obs is not None:
+                wh = x_mat.T.dot(uh) / x_obs.T.dot(uh * uh)
+            else:
+                wh = x_mat.T.dot(uh) / uh.dot(uh)
+            # Normalize
+            wh = wh / math.sqrt(np.nansum(wh * wh))
+
+            # X-block Scores
+            th_old = th
+            if x_obs is not None:
+                th = x_mat.dot(wh) / x_obs.dot(wh * wh)
+            else:
+                th = x_mat.dot(wh) / wh.dot(wh)
+
+            # Y-block weights
+            if y_obs is not None:
+                qh = y_mat.T.dot(th) / y_obs.T.dot(th * th)
+            else:
+                qh = y_mat.T.dot(th) / th.dot(th)
+            # Normalize
+            # According to Analytica Chimica Acta, 185 (1986) 1-17 this normalization
+            # should be done. However, if so, the results are not the same as th R package
+            # pls plsr method or Evince.
+            # qh = qh / math.sqrt(np.nansum(qh*qh))
+
+            # Y-block Scores
+            if y_obs is not None:
+                # Rows without observed Y values get u = 0, so they take no part
+                # in the X weights
+                uh = y_mat.dot(qh) / np.maximum(
+                    y_obs.dot(qh * qh), np.finfo(float).tiny
+                )
+            else:
+                uh = y_mat.dot(qh) / qh.dot(qh)
+
+            # Check convergence
+            change = np.nansum((th - th_old) ** 2)
+            if trace is not None:
+                trace.append(change)
+            if change < tol:
+                break
+            it += 1
+            if it >= maxiter:
+                raise RuntimeError(
+                    "Convergence was not reached in {} iterations for component {}".format(
+                        maxiter, comp
+                    )
+                )
+        return th, uh, wh, qh
+
+    def _cvpress(
+        self,
+        train,
+        test,
+        buffers,
+        comp,
+        startcol,
+        tol,
+        maxiter,
+        uh0=None,
+        accelerate=False,
+    ):
+        """Fit one component on the train rows and return the PRESS of the test rows
+
+        The training data is gathered into buffers (X, Y and their observed-value
+        masks, which are None without missing values), so no new matrices are
+        allocated"""
+        x_buf, y_buf, x_obsbuf, y_obsbuf = buffers
+        # mode="clip" keeps np.take from buffering out, the indices are all valid
+        train_x_mat = np.take(
+            self.x_mat, train, axis=0, out=x_buf[: len(train)], mode="clip"
         )
-        self.q = pd.DataFrame(
-            q,
-            index=self.y_df.columns,
-            columns=["PC{}".format(i + 1) for i in range(ncomp)],
+        train_y_mat = np.take(
+            self.y_mat, train, axis=0, out=y_buf[: len(train)], mode="clip"
         )
-        self.weights = pd.DataFrame(
-            weights,
-            index=self.x_df.columns,
-            columns=["PC{}".format(i + 1) for i in range(ncomp)],
+        train_x_obs = train_y_obs = None
+        if x_obsbuf is not None:
+            train_x_obs = np.equal(train_x_mat, train_x_mat, out=x_obsbuf[: len(train)])
+            np.nan_to_num(train_x_mat, copy=False)
+        if y_obsbuf is not None:
+            train_y_obs = np.equal(train_y_mat, train_y_mat, out=y_obsbuf[: len(train)])
+            np.nan_to_num(train_y_mat, copy=False)
+        th, uh, wh, qh = self._onecomp(
+            train_x_mat,
+            train_y_mat,
+            train_x_obs,
+            train_y_obs,
+            comp,
+            startcol,
+            tol,
+            maxiter,
+            uh0,
+            accelerate,
         )
-        self.b = pd.Series(b, index=["PC{}".format(i + 1) for i in range(ncomp)])
-        return True
+
+        pred_x_mat = np.nan_to_num(self.x_mat[test])
+        pred_y_mat = self.y_mat[test]
+        cv_th = pred_x_mat.dot(wh) / wh.dot(wh)
+        if train_y_obs is not None:
+            th_y = th * train_y_obs.any(axis=1)
+            cv_bh = uh.dot(th) / th_y.dot(th_y)
+        else:
+            cv_bh = uh.dot(th) / th.dot(th)
+        cv_res = pred_y_mat - cv_bh * np.outer(cv_th, qh)
+        cv_res[np.isnan(pred_y_mat)] = 0
+        return np.sum(cv_res**2)
+
+    def predict(self, new_x, out=None, frame=False):
+        """Predict Y for new X data
+
+        Complete rows are predicted with one matrix product by the regression
+        coefficients of the model, which have the centering and scaling folded in.
+        The scores of rows with missing values are projected one component at a
+        time on the weights of their observed variables, as in the NIPALS fit.
+
+        new_x - array or DataFrame with the X variables of the model
+        out - optional array of shape (rows, Y variables) for the result
+        frame - whether to return a DataFrame with the index of new_x and the Y
+            columns of the model, defaults to False (an array)
+        """
+        new_x, index = _asarray(new_x, self.x_df.columns)
+        coef = self._coef.astype(new_x.dtype, copy=False)
+        pred = np.dot(new_x, coef, out=out)
+        pred += self._intercept
+
+        # Missing values propagate to the predictions
+        missing = np.flatnonzero(~np.isfinite(pred).all(axis=1))
+        if len(missing):
+            pred[missing] = self._predictmissing(new_x[missing])
+        if frame:
+            return pd.DataFrame(pred, index=index, columns=self.y_df.columns)
+        return pred
+
+    def _predictmissing(self, new_x):
+        """Predict Y for rows with missing values, by single component projection"""
+        pred = self._newscores(self._preprocess(new_x, "x"))
+        pred = (pred * self._res["b"]).dot(self._res["q"].T)
+        if self.scale:
+            pred *= self.y_std
+        if self.center:
+            pred += self.y_mean
+        return pred
+
+    def _preprocess(self, new_mat, block):
+        """Centered and scaled copy of new X or Y data (block "x" or "y"), with
+        missing values for infs"""
+        mean, std = (
+            (self.x_mean, self.x_std) if block == "x" else (self.y_mean, self.y_std)
+        )
+        mat = np.where(np.isfinite(new_mat), new_mat, np.nan)
+        if self.center:
+            mat -= mean
+        if self.scale:
+            mat /= std
+        return mat
+
+    def _newscores(self, x_mat):
+        """Scores of preprocessed X data. Rows with missing values are projected one
+        component at a time on the weights of their observed variables, as in the
+        NIPALS fit."""
+        scores = np.nan_to_num(x_mat).dot(self._rotations)
+        missing = np.flatnonzero(np.isnan(x_mat).any(axis=1))
+        if len(missing):
+            x_mat = x_mat[missing]
+            x_obs = (~np.isnan(x_mat)).astype(x_mat.dtype)
+            x_mat = np.nan_to_num(x_mat, copy=False)
+            weights = self._res["weights"]
+            loadings = self._res["loadings"]
+            for comp in range(weights.shape[1]):
+                wh = weights[:, comp]
+                th = x_mat.dot(wh) / x_obs.dot(wh * wh)
+                x_mat -= np.outer(th, loadings[:, comp]) * x_obs
+                scores[missing, comp] = th
+        return scores
+
+    def dmodx(self, new_x, ncomp=None):
+        """DModX of new X data, the residual standard deviation of every row
+        relative to S0 of the training data, with the first ncomp components
+        (defaults to all). Compare with dmodx_limit."""
+        ncomp = _usecomps(ncomp, self._res["b"].shape[0])
+        new_x, _ = _asarray(new_x, self.x_df.columns)
+        x_mat = self._preprocess(new_x, "x")
+        scores = self._newscores(x_mat)[:, :ncomp]
+        loadings = self._res["loadings"]
+        res = x_mat - scores.dot(loadings[:, :ncomp].T)
+        ssres = self._xssres + (loadings[:, ncomp:] ** 2).dot(self._tt[ncomp:])
+        A0 = 0 if isinstance(self.x_mean, int) else 1
+        return _dmodx(res, ssres, self._nobs, ncomp, A0)
+
+    def dmody(self, new_x, new_y, ncomp=None):
+        """DModY of new X and Y data, the residual standard deviation of the Y
+        predictions of every row relative to S0 of the training data, with the
+        first ncomp components (defaults to all). Compare with dmody_limit."""
+        ncomp = _usecomps(ncomp, self._res["b"].shape[0])
+        new_x, _ = _asarray(new_x, self.x_df.columns)
+        new_y, _ = _asarray(new_y, self.y_df.columns)
+        scores = self._newscores(self._preprocess(new_x, "x"))[:, :ncomp]
+        q = self._res["q"]
+        res = self._preprocess(new_y, "y") - (scores * self._res["b"][:ncomp]).dot(
+            q[:, :ncomp].T
+        )
+        ssres = self._yssres + (q[:, ncomp:] ** 2).dot(self._tt[ncomp:])
+        A0 = 0 if isinstance(self.y_mean, int) else 1
+        return _dmodx(res, ssres, self._nobs, ncomp, A0)
+
+    def t2(self, new_x, ncomp=None):
+        """Hotelling's T2 of new X data with the first ncomp components (defaults to
+        all), from the score variances of the training data. Compare with t2_limit."""
+        ncomp = _usecomps(ncomp, self._res["b"].shape[0])
+        new_x, _ = _asarray(new_x, self.x_df.columns)
+        scores = self._newscores(self._preprocess(new_x, "x"))[:, :ncomp]
+        return (scores * scores).dot((self._nobs - 1) / self._tt[:ncomp])
+
+    def dmodx_limit(self, alpha=0.05, ncomp=None):
+        """Critical DModX of the model at significance level alpha"""
+        ncomp = _usecomps(ncomp, self._res["b"].shape[0])
+        A0 = 0 if isinstance(self.x_mean, int) else 1
+        nc = self._res["loadings"].shape[0]
+        return _dmodxlimit(alpha, self._nobs, nc, ncomp, A0)
+
+    def dmody_limit(self, alpha=0.05, ncomp=None):
+        """Critical DModY of the model at significance level alpha"""
+        ncomp = _usecomps(ncomp, self._res["b"].shape[0])
+        A0 = 0 if isinstance(self.y_mean, int) else 1
+        return _dmodxlimit(alpha, self._nobs, self._res["q"].shape[0], ncomp, A0)
+
+    def t2_limit(self, alpha=0.05, ncomp=None):
+        """Critical Hotelling's T2 of new data at significance level alpha"""
+        ncomp = _usecomps(ncomp, self._res["b"].shape[0])
+        return _t2limit(alpha, self._nobs, ncomp)
+
+    def save(self, path):
+        """Save the model to an uncompressed npz file at path, for scoring new data
+        after loading with PLS.load
+
+        Only the arrays needed to score new data are saved: the means and
+        standard deviations, loadings, weights, q, b, R2 and Q2 and the residual
+        sums of squares and score variances of the DModX, DModY and T2 limits. The
+        data, scores and working matrices are not."""
+        arrays = dict(
+            x_mean=self.x_mean,
+            x_std=self.x_std,
+            y_mean=self.y_mean,
+            y_std=self.y_std,
+            tt=self._tt,
+            xssres=self._xssres,
+            yssres=self._yssres,
+        )
+        for key in self._savedresults:
+            arrays[key] = self._res[key]
+        meta = dict(
+            model=type(self).__name__,
+            columns=self.x_df.columns.tolist(),
+            ycolumns=self.y_df.columns.tolist(),
+            center=self.center,
+            scale=self.scale,
+            nobs=self._nobs,
+            fitopts=self._fitopts,
+        )
+        _savemodel(path, arrays, meta)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a model saved by PLS.save (or the save of a subclass, loaded with
+        its load)
+
+        With mmap, the arrays of the model are read-only memory maps of the file,
+        so loading takes about the same time for any size of model and processes
+        that load the same file share the memory. The loaded model has no data or
+        scores, it predicts and scores new data (predict, dmodx, dmody, t2 and
+        the limits) and has the loadings, weights, q, b, R2 and Q2 results. It
+        cannot be refit or updated."""
+        arrays, meta = _loadmodel(path, cls.__name__, mmap)
+        model = cls.__new__(cls)
+        model.x_df = _labelframe(_labelindex(meta["columns"]))
+        model.y_df = _labelframe(_labelindex(meta["ycolumns"]))
+        model.center = meta["center"]
+        model.scale = meta["scale"]
+        model._nobs = meta["nobs"]
+        model._fitopts = dict(meta["fitopts"], compact=True)
+        model.x_mean = arrays.pop("x_mean")
+        model.x_std = arrays.pop("x_std")
+        model.y_mean = arrays.pop("y_mean")
+        model.y_std = arrays.pop("y_std")
+        model._tt = arrays.pop("tt")
+        model._xssres = arrays.pop("xssres")
+        model._yssres = arrays.pop("yssres")
+        ncomp = arrays["b"].shape[0]
+        model._res = dict(arrays, scores=np.empty((0, ncomp)), u=np.empty((0, ncomp)))
+        model._setresults(index=pd.RangeIndex(0))
+        return model
 
     def dModY(self):
         """
@@ -613,13 +2467,12 @@ class PLS(object):
         data." Bioinformatics, 23, pp. 1164-1167.)
         Modified to scale with mean
         """
-        nr, nc = self.y_mat.shape
-        ncomp = self.scores.shape[1]
+        nr = self._nobs
+        nc, ncomp = self._res["q"].shape
         A0 = 0 if isinstance(self.y_mean, int) else 1
         ny = np.sqrt(nr / (nr - ncomp - A0))
-        F2 = self.y_mat * self.y_mat
-        s = np.sqrt(np.nansum(F2, axis=1) / (nc - ncomp)) * ny
-        S0 = np.sqrt(np.nansum(F2) / ((nr - ncomp - A0) * (nc - ncomp)))
+        s = np.sqrt(self._yrowss / (nc - ncomp)) * ny
+        S0 = np.sqrt(self._yssres.sum() / ((nr - ncomp - A0) * (nc - ncomp)))
         return s / S0
 
     def dModX(self):
@@ -630,13 +2483,12 @@ class PLS(object):
         data." Bioinformatics, 23, pp. 1164-1167.)
         Modified to scale with mean
         """
-        nr, nc = self.x_mat.shape
-        ncomp = self.scores.shape[1]
+        nr = self._nobs
+        nc, ncomp = self._res["loadings"].shape
         A0 = 0 if isinstance(self.x_mean, int) else 1
         ny = np.sqrt(nr / (nr - ncomp - A0))
-        E2 = self.x_mat * self.x_mat
-        s = np.sqrt(np.nansum(E2, axis=1) / (nc - ncomp)) * ny
-        S0 = np.sqrt(np.nansum(E2) / ((nr - ncomp - A0) * (nc - ncomp)))
+        s = np.sqrt(self._xrowss / (nc - ncomp)) * ny
+        S0 = np.sqrt(self._xssres.sum() / ((nr - ncomp - A0) * (nc - ncomp)))
         return s / S0
 
     def plot(
@@ -655,8 +2507,12 @@ class PLS(object):
         labels=None,
         predlabels=None,
         color="#555555",
+        maxpoints=20000,
+        largemode="decimate",
+        maxlabels=200,
     ):
-        """Plot method for plotting scores, with optional classes and predictions"""
+        """Plot method for plotting scores, with optional classes and predictions,
+        see _plot for maxpoints, largemode and maxlabels"""
         return _plot(
             self,
             comps,
@@ -674,6 +2530,9 @@ class PLS(object):
             predlabels,
             10,
             color,
+            maxpoints,
+            largemode,
+            maxlabels,
         )
 
     def loadingsplot(
@@ -689,8 +2548,11 @@ class PLS(object):
         weightsize=200,
         labels=True,
         textsize=10,
+        maxpoints=20000,
+        maxlabels=200,
     ):
-        """Plot method for plotting loadings and optionally weights"""
+        """Plot method for plotting loadings and optionally weights, see
+        _loadingsplot for maxpoints and maxlabels"""
         return _loadingsplot(
             modelinstance=self,
             comps=comps,
@@ -704,6 +2566,8 @@ class PLS(object):
             weightsize=weightsize,
             labels=labels,
             textsize=textsize,
+            maxpoints=maxpoints,
+            maxlabels=maxlabels,
         )
 
     def overviewplot(self):
@@ -718,11 +2582,8 @@ class PLS(object):
 
     def dModXPlot(self):
         dmx = self.dModX()
-        nr, nc = self.x_mat.shape
-        ncomp = self.scores.shape[1]
-        A0 = 0 if isinstance(self.x_mean, int) else 1
-        fc = np.sqrt(f.isf(0.05, nr - ncomp - A0, nc - ncomp))
-        ax = pd.Series(dmx, index=self.x_df.index.get_level_values(0)).plot(
+        fc = self.dmodx_limit(0.05)
+        ax = pd.Series(dmx, index=self.scores.index.get_level_values(0)).plot(
             kind="bar", color="green"
         )
         ax.hlines(fc, -1, 20)
@@ -730,11 +2591,8 @@ class PLS(object):
 
     def dModYPlot(self):
         dmy = self.dModY()
-        nr, nc = self.y_mat.shape
-        ncomp = self.scores.shape[1]
-        A0 = 0 if isinstance(self.y_mean, int) else 1
-        fc = np.sqrt(f.isf(0.05, nr - ncomp - A0, nc - ncomp))
-        ax = pd.Series(dmy, index=self.y_df.index.get_level_values(0)).plot(
+        fc = self.dmody_limit(0.05)
+        ax = pd.Series(dmy, index=self.scores.index.get_level_values(0)).plot(
             kind="bar", color="green"
         )
         ax.hlines(fc, -1, 20)
@@ -745,10 +2603,31 @@ class Nipals(object):
     """A Nipals class that can be used for PCA.
 
     Initialize with a Pandas DataFrame or an object that can be turned into a DataFrame
-    (e.g. an array or a dict of lists)"""
+    (e.g. an array or a dict of lists), or with a scipy.sparse matrix without
+    missing values, which is centered and scaled implicitly in the NIPALS
+    iterations, so the fit takes memory and time in proportion to its nonzeros."""
+
+    # Sparse data as a CSR matrix, x_df then only holds the column labels
+    x_sparse = None
+    # Results that are built from the arrays in _res on first access
+    _lazyresults = (
+        "R2cum",
+        "eig",
+        "PRESS_SS",
+        "Q2",
+        "Q2cum",
+        "scores",
+        "loadings",
+        "niter",
+        "traces",
+    )
 
     def __init__(self, x_df):
         super(Nipals, self).__init__()
+        if issparse(x_df):
+            self.x_sparse = _sparsedata(x_df)
+            self.x_df = _labelframe(pd.RangeIndex(self.x_sparse.shape[1]))
+            return
         if not isinstance(x_df, pd.DataFrame):
             x_df = pd.DataFrame(x_df)
         self.x_df = x_df
@@ -761,47 +2640,88 @@ class Nipals(object):
             )
             self.x_df.replace([np.inf, -np.inf], np.nan, inplace=True)
 
-    def _onecomp(self, mat, comp, hasna, startcol, tol, maxiter):
-        nrt, nct = mat.shape
-        miss = np.isnan(mat)
-        # Set t to column of X with highest var
-        if startcol is None:
-            xvar = np.nanvar(mat, axis=0, ddof=1)
-            startcol_use = np.where(xvar == xvar.max())[0][0]
+    def _onecomp(
+        self,
+        mat,
+        comp,
+        hasna,
+        startcol,
+        tol,
+        maxiter,
+        obs=None,
+        th0=None,
+        accelerate=False,
+        trace=None,
+        stop=None,
+    ):
+        """NIPALS iteration for one principal component of mat
+
+        With missing values and a buffer of the same shape as mat given as obs,
+        the observed-value mask is built in obs and the missing values of mat are
+        set to 0 in place, otherwise both are allocated. The iteration starts from
+        th0 if given, otherwise from a column of mat. With accelerate and complete
+        data the iteration is accelerated by _lobpcg. The squared changes of the
+        scores are appended to trace, and None is returned as soon as stop (a
+        threading.Event) is set."""
+        if th0 is not None:
+            logging.info("PC {}, starting with given vector".format(comp))
         else:
-            startcol_use = startcol
-        logging.info("PC {}, starting with column {}".format(comp, startcol_use))
+            # Set t to column of X with highest var
+            if startcol is None:
+                xvar = _nanmeanstd(mat)[1] ** 2
+                startcol_use = _startcolumn(xvar)
+            else:
+                startcol_use = startcol
+            logging.info("PC {}, starting with column {}".format(comp, startcol_use))
 
         if hasna:
-            mat_0 = np.nan_to_num(mat)
-            th = mat_0[:, startcol_use]
+            # Observed-value mask, built once per component so the missing
+            # data denominators are plain matrix-vector products
+            if obs is None:
+                obs = (~np.isnan(mat)).astype(mat.dtype)
+                mat_0 = np.nan_to_num(mat)
+            else:
+                obs = np.equal(mat, mat, out=obs)
+                mat_0 = np.nan_to_num(mat, copy=False)
+            th = mat_0[:, startcol_use] if th0 is None else th0
         else:
-            th = mat[:, startcol_use]
+            th = mat[:, startcol_use] if th0 is None else th0
+            if accelerate:
+                result = _lobpcg(
+                    mat.T.dot(th),
+                    lambda ph: (mat.dot(ph),),
+                    mat.T.dot,
+                    tol,
+                    maxiter,
+                    comp,
+                    trace,
+                    stop,
+                )
+                return None if result is None else (result[1][0], result[0])
         it = 0
         while True:
+            if stop is not None and stop.is_set():
+                return None
             # loadings
             if hasna:
-                T2 = np.repeat(th * th, nct)
-                T2.shape = (nrt, nct)
-                T2[miss] = 0
-                ph = mat_0.T.dot(th) / T2.sum(axis=0)
+                ph = mat_0.T.dot(th) / obs.T.dot(th * th)
             else:
-                ph = mat.T.dot(th) / sum(th * th)
+                ph = mat.T.dot(th) / th.dot(th)
             # Normalize
             ph = ph / math.sqrt(np.nansum(ph * ph))
 
             # Scores
             th_old = th
             if hasna:
-                P2 = np.repeat(ph * ph, nrt)
-                P2.shape = (nct, nrt)
-                P2[miss.T] = 0
-                th = mat_0.dot(ph) / P2.sum(axis=0)
+                th = mat_0.dot(ph) / obs.dot(ph * ph)
             else:
-                th = mat.dot(ph) / sum(ph * ph)
+                th = mat.dot(ph) / ph.dot(ph)
 
             # Check convergence
-            if np.nansum((th - th_old) ** 2) < tol:
+            change = np.nansum((th - th_old) ** 2)
+            if trace is not None:
+                trace.append(change)
+            if change < tol:
                 break
             it += 1
             if it >= maxiter:
@@ -812,6 +2732,67 @@ class Nipals(object):
                 )
         return th, ph
 
+    def _cvfold(
+        self,
+        rowtrain,
+        coltrain,
+        buffers,
+        comp,
+        hasna,
+        startcol,
+        tol,
+        maxiter,
+        th0=None,
+        accelerate=False,
+    ):
+        """Fit one component without the left out rows and without the left out
+        columns of a CV round, returns the loadings and scores of the two fits
+
+        The training data is gathered into the buffers (data and observed-value
+        mask, which is None without missing values), so no new matrices are
+        allocated"""
+        buf, obsbuf = buffers
+        nr, nc = self.x_mat.shape
+        results = []
+        for shape, train, axis, th0_train in (
+            ((len(rowtrain), nc), rowtrain, 0, None if th0 is None else th0[rowtrain]),
+            ((nr, len(coltrain)), coltrain, 1, th0),
+        ):
+            size = shape[0] * shape[1]
+            # mode="clip" keeps np.take from buffering out, the indices are all valid
+            train_mat = np.take(
+                self.x_mat, train, axis=axis, out=buf[:size].reshape(shape), mode="clip"
+            )
+            obs = None if obsbuf is None else obsbuf[:size].reshape(shape)
+            results.append(
+                self._onecomp(
+                    train_mat,
+                    comp,
+                    hasna,
+                    startcol,
+                    tol,
+                    maxiter,
+                    obs,
+                    th0_train,
+                    accelerate,
+                )
+            )
+        return results[0][1], results[1][0]
+
+    def _cvpress(self, cvP, cvT):
+        """PRESS of the CV predictions cvP[i % cv, j] * cvT[j % cv, i] of the
+        current x_mat, summed over row chunks so the prediction matrix is never
+        formed in full"""
+        cv = cvP.shape[0]
+        nr, nc = self.x_mat.shape
+        colfold = np.arange(nc) % cv
+        PRESS = 0
+        for rows in _rowchunks(self.x_mat):
+            idx = np.arange(nr)[rows]
+            pred_mat = cvP[idx % cv] * cvT[:, idx][colfold].T
+            PRESS += np.nansum(np.square(self.x_mat[rows] - pred_mat))
+        return PRESS
+
     def fit(
         self,
         ncomp=None,
@@ -823,6 +2804,14 @@ class Nipals(object):
         eigsweep=False,
         cv=False,
         dropzerovar=False,
+        method="nipals",
+        dtype=None,
+        n_jobs=None,
+        init=None,
+        keep_training_data=True,
+        accelerate=False,
+        nstarts=1,
+        stats=None,
     ):
         """The Fit method, will fit a PCA to the X data.
 
@@ -834,28 +2823,49 @@ class Nipals(object):
         maxiter - maximum number of iterations before convergence is considered failed, defaults to 500
         startcol - column in X data to start iteration from, if set to None, the column with maximal variance is selected, defaults to None
         eigsweep - whether to sweep out eigenvalues from the final scores, defaults to False
-        """
+        method - "nipals", or "svd", "lanczos" or "randomized" to calculate all
+            components of complete data at once without cv, defaults to "nipals"
+        dtype - dtype of the working matrix, defaults to the dtype of the data
+        n_jobs - number of threads for the CV rounds and starts, -1 for one per CPU
+        init - a fitted model or an array with a column per component to start the
+            iterations from, defaults to None
+        keep_training_data - whether to keep the data after the fit, see compact
+        accelerate - whether to iterate complete data by LOBPCG, defaults to False
+        nstarts - number of start vectors per component, the first to converge is
+            kept, defaults to 1
+        stats - a FitStats object that records every component, defaults to None
+
+        The iterations of every component are in niter and traces, see the ReadMe
+        for the trade-offs of the options."""
         self.eigsweep = eigsweep
+        max_ncomp = min(map(len, self._labels()))
         if ncomp is None:
-            ncomp = min(self.x_df.shape)
-        elif ncomp > min(self.x_df.shape):
-            ncomp = min(self.x_df.shape)
+            ncomp = max_ncomp
+        elif ncomp > max_ncomp:
+            ncomp = max_ncomp
             logging.warning(
                 "ncomp is larger than the max dimension of the x matrix.\n"
                 "fit will only return {} components".format(ncomp)
             )
-        # Convert to np array
-        self.x_mat = self.x_df.values
+        if self.x_sparse is not None and (cv or method != "nipals"):
+            raise ValueError('Sparse data requires method="nipals" and no cv')
+        # Convert to np array, this is the working copy that is deflated in place
+        if self.x_sparse is not None:
+            self.x_mat = self.x_sparse.astype(dtype or float, copy=False)
+            self.x_mean, self.x_std = _sparsemeanstd(self.x_mat)
+        else:
+            self.x_mat = self._workmatrix(dtype)
+            self.x_mean, self.x_std = _nanmeanstd(self.x_mat)
         self.center = center
         self.scale = scale
-        self.x_mean: np.ndarray = np.nanmean(self.x_mat, axis=0)
-        self.x_std: np.ndarray = np.nanstd(self.x_mat, axis=0, ddof=1)
 
         # check for zero variance variables
         x_zerovar = self.x_df.columns[self.x_std == 0].tolist()
         if len(x_zerovar) > 0:
             if dropzerovar:
                 self.x_mat = self.x_mat[:, self.x_std != 0]
+                if self.x_sparse is not None:
+                    self.x_sparse = self.x_sparse[:, self.x_std != 0]
                 self.x_mean = self.x_mean[self.x_std != 0]
                 self.x_std = self.x_std[self.x_std != 0]
                 self.x_df = self.x_df.drop(x_zerovar, axis=1)
@@ -867,116 +2877,467 @@ class Nipals(object):
                     + 'Recall with "dropzerovar=True" to drop automatically'
                 )
 
-        if center:
-            self.x_mat = self.x_mat - self.x_mean
-        if scale:
-            self.x_mat = self.x_mat / self.x_std
+        if self.x_sparse is not None:
+            self.x_mat = _SparseResidual(
+                self.x_mat,
+                self.x_mean if center else None,
+                self.x_std if scale else None,
+            )
+        else:
+            if center:
+                self.x_mat -= self.x_mean
+            if scale:
+                self.x_mat /= self.x_std
 
-        TotalSS = np.nansum(self.x_mat * self.x_mat)
+        self._TotalSS = _sumsq(self.x_mat)
         nr, nc = self.x_mat.shape
+
+        # NA handling, sparse data has no missing values
+        if self.x_sparse is not None:
+            self._hasna = False
+            self._count = np.full(nc, nr)
+        else:
+            x_miss = np.isnan(self.x_mat)
+            self._hasna = x_miss.any()
+            if x_miss.all(axis=1).any():
+                raise ValueError("X matrix contains row with only NA values")
+            self._count = nr - x_miss.sum(axis=0)
+            del x_miss
+        if self._hasna:
+            logging.info("Data has NA values")
+        self._nobs = nr
+        if method != "nipals":
+            if self._hasna:
+                raise ValueError(
+                    'method "{}" requires complete data, '
+                    'use method="nipals" for data with missing values'.format(method)
+                )
+            if cv:
+                raise ValueError('cv is only available with method="nipals"')
+
+        if cv is True:
+            cv = 7
+        self._fitopts = dict(
+            startcol=startcol,
+            tol=tol,
+            maxiter=maxiter,
+            cv=cv or 0,
+            n_jobs=n_jobs,
+            accelerate=accelerate,
+            nstarts=nstarts,
+        )
+        self._stats = stats
+        # Results are collected in arrays with one column per component, the
+        # scores before eigsweep and the eigenvalues as sums of squares
+        if method != "nipals":
+            scores, loadings = _svdcomps(self.x_mat, ncomp, method, startcol)
+            self.x_mat -= scores.dot(loadings.T)
+            eig = (scores * scores).sum(axis=0)
+            self._res = dict(
+                scores=scores,
+                loadings=loadings,
+                eig=eig,
+                R2cum=np.cumsum(eig) / self._TotalSS,
+                PRESS_SS=np.empty((0,)),
+                niter=np.zeros(ncomp, dtype=int),
+            )
+            self._traces = [np.empty((0,)) for _ in range(ncomp)]
+            self._rowss_res, self._ssres = _residualss(self.x_mat)
+            self._setresults()
+        else:
+            self._res = dict(
+                scores=np.empty((nr, 0)),
+                loadings=np.empty((nc, 0)),
+                eig=np.empty((0,)),
+                R2cum=np.empty((0,)),
+                PRESS_SS=np.empty((0,)),
+                niter=np.empty((0,), dtype=int),
+            )
+            self._traces = []
+            self._fitcomps(ncomp, init)
+        if not keep_training_data:
+            self.compact()
+        return True
+
+    def _workmatrix(self, dtype=None):
+        """Copy of the data of the given dtype, which fit centers, scales and
+        deflates in place"""
+        return np.array(self.x_df.values, dtype=dtype)
+
+    def fit_more(self, ncomp=1, init=None):
+        """Add ncomp components to a fitted model
+
+        The new components are calculated by NIPALS from the deflated X data, with
+        the settings of the last call to fit (also after a blocked method). init
+        works as in fit, with the columns of the start vectors counted from the
+        first component of the model."""
+        if self._fitopts.get("updated"):
+            raise RuntimeError(
+                "fit_more is not available after partial_fit, refit the model"
+            )
+        if self._fitopts.get("compact"):
+            raise RuntimeError(
+                "fit_more is not available without the training data, refit the model"
+            )
+        ncomp_max = min(map(len, self._labels())) - self._res["eig"].shape[0]
+        if ncomp > ncomp_max:
+            ncomp = ncomp_max
+            logging.warning(
+                "ncomp is larger than the max dimension of the x matrix.\n"
+                "fit_more will only add {} components".format(ncomp)
+            )
+        self._fitcomps(ncomp, init)
+        return True
+
+    def partial_fit(self, new_x, forget=1.0):
+        """Update a fitted model with new rows of data
+
+        The column statistics, loadings and eigenvalues are updated from the current
+        components and the new rows by an incremental SVD (Ross et al., Int J Comput
+        Vis 77 (2008) 125-141).
+
+        forget - weight of the old data per new row, defaults to 1 (no forgetting)
+
+        new_x may be sparse, missing values are replaced by the column means.
+        Afterwards scores and dModX refer to the new rows, cross validation results
+        are removed and fit_more is not available."""
+        new_x, new_mat = _newdata(new_x, self._labels()[1])
+        nb = new_mat.shape[0]
+        weight = forget**nb
+        ncomp = self._res["eig"].shape[0]
+
+        # Column statistics, with the old data down-weighted
+        old_mean = self.x_mean
+        old_std = self.x_std
+        self._count, self.x_mean, m2 = _combinestats(
+            (self._count, old_mean, old_std**2 * (self._count - 1)), new_mat, weight
+        )
+        self.x_std = np.sqrt(m2 / (self._count - 1))
+        scale_old = old_std if self.scale else 1
+        scale = self.x_std if self.scale else 1
+
+        # Current components in the new scaling, the new rows and, when centering,
+        # a row for the shift of the mean
+        parts = [
+            np.sqrt(weight * self._res["eig"])[:, np.newaxis]
+            * (self._res["loadings"].T * (scale_old / scale))
+        ]
+        if self.center:
+            new_mean = np.nanmean(new_mat, axis=0)
+            parts.append(np.nan_to_num((new_mat - new_mean) / scale))
+            parts.append(
+                np.sqrt(weight * self._nobs * nb / (weight * self._nobs + nb))
+                * np.nan_to_num((old_mean - new_mean) / scale)[np.newaxis]
+            )
+        else:
+            parts.append(np.nan_to_num(new_mat / scale))
+        _, sv, vt = np.linalg.svd(np.vstack(parts), full_matrices=False)
+        loadings = vt[:ncomp].T
+        # Keep the signs of the current loadings
+        flip = (loadings * self._res["loadings"]).sum(axis=0) < 0
+        loadings[:, flip] = -loadings[:, flip]
+        eig = sv[:ncomp] ** 2
+        self._nobs = weight * self._nobs + nb
+
+        # Total and residual sums of squares of the model
+        shift = self.x_mean if self.center else 0
+        colss = (m2 + self._count * (self.x_mean - shift) ** 2) / scale**2
+        self._TotalSS = colss.sum()
+        self._ssres = np.maximum(colss - (loadings * loadings).dot(eig), 0)
+
+        # Scores and residuals of the new rows
+        new_mat = (new_mat - shift) / scale
+        scores = np.nan_to_num(new_mat).dot(loadings)
+        self._rowss_res = _residualss(new_mat - scores.dot(loadings.T))[0]
+
+        self._res = dict(
+            scores=scores,
+            loadings=loadings,
+            eig=eig,
+            R2cum=np.cumsum(eig) / self._TotalSS,
+            PRESS_SS=np.empty((0,)),
+        )
+        self._fitopts.update(cv=0, updated=True)
+        for attr in ("PRESS_SS", "Q2", "Q2cum", "niter", "traces"):
+            self.__dict__.pop(attr, None)
+        self._setresults(new_x.index)
+        return True
+
+    def compact(self):
+        """Drop the training data and working matrix of a fitted model
+
+        The data (x_df keeps the column labels only, x_sparse) and the deflated
+        x_mat are removed. The model keeps its results, the scores and the per-row residual
+        sums of squares of dModX, so it still transforms and scores new data, plots
+        its scores and can be updated with partial_fit. fit_more is no longer
+        available.
+        """
+        # The scores are kept as their DataFrame
+        self.scores
+        self.x_df = _labelframe(self.x_df.columns)
+        self.__dict__.pop("x_sparse", None)
+        self.__dict__.pop("x_mat", None)
+        self._res["scores"] = np.empty((0, self._res["eig"].shape[0]))
+        self._fitopts["compact"] = True
+        return True
+
+    def _scorestats(self, comps):
+        """Means and variances of the scores comps and the number of observations
+        of the model, for the Hotelling ellipse of a model updated by partial_fit.
+        None for a fitted model, whose scores are its data."""
+        if not self._fitopts.get("updated"):
+            return None, None, None
+        idx = [self._pcs().get_loc(comp) for comp in comps]
+        eig = self._res["eig"][idx]
+        loadings = self._res["loadings"][:, idx]
+        if self.center:
+            mean = np.zeros(len(idx))
+        else:
+            mean = (self.x_mean / (self.x_std if self.scale else 1)).dot(loadings)
+        var = (eig - self._nobs * mean**2) / (self._nobs - 1)
+        if self.eigsweep:
+            mean = mean / np.sqrt(eig)
+            var = var / eig
+        return mean, var, self._nobs
+
+    def _fitcomps(self, ncomp, init=None):
+        """Calculate ncomp more components from the deflated data and update the
+        results"""
+        startcol = self._fitopts["startcol"]
+        tol = self._fitopts["tol"]
+        maxiter = self._fitopts["maxiter"]
+        cv = self._fitopts["cv"]
+        hasna = self._hasna
+        stats = getattr(self, "_stats", None)
+        nr, nc = self.x_mat.shape
+        firstcomp = self._res["eig"].shape[0]
+        init = _startvectors(init, nr, "scores")
+
         # initialize outputs
         eig = np.empty((ncomp,))
         R2cum = np.empty((ncomp,))
         PRESS_SS = np.empty((ncomp,))
         loadings = np.empty((nc, ncomp))
         scores = np.empty((nr, ncomp))
+        niter = np.empty((ncomp,), dtype=int)
 
-        # NA handling
-        x_miss = np.isnan(self.x_mat)
-        hasna = x_miss.any()
-        if x_miss.all(axis=1).any():
-            raise ValueError("X matrix contains row with only NA values")
-        if hasna:
-            logging.info("Data has NA values")
-
-        # self.x_mat_0 = np.nan_to_num(self.x_mat)
-        # t = [None] * ncomp
-        # p = [None] * ncomp
-        self.eig = []
         if cv:
-            if cv is True:
-                cv = 7
-            cvxn = int(np.ceil(nr / cv))
-            cvxgroups = np.array(range(cvxn * cv)).reshape(cvxn, cv).T
-            cvyn = int(np.ceil(nc / cv))
-            cvygroups = np.array(range(cvyn * cv)).reshape(cvyn, cv).T
-        else:
-            cv = 0
-        for comp in range(ncomp):
-            # Matrixes to keep ps and ts from cv folds
-            cvP = np.empty((nr, nc))
-            cvT = np.empty((nr, nc))
+            # Row i and column j are left out in CV rounds i % cv and j % cv. All
+            # workers read the shared deflated matrix and gather their training
+            # data into one buffer each, which is reused for all folds and
+            # components
+            n_jobs = _njobs(self._fitopts["n_jobs"], cv)
+            cvrows = [np.arange(cvround, nr, cv) for cvround in range(cv)]
+            cvcols = [np.arange(cvround, nc, cv) for cvround in range(cv)]
+            cvrowtrain = [np.setdiff1d(np.arange(nr), test) for test in cvrows]
+            cvcoltrain = [np.setdiff1d(np.arange(nc), test) for test in cvcols]
+            bufsize = max(
+                max(len(train) for train in cvrowtrain) * nc,
+                max(len(train) for train in cvcoltrain) * nr,
+            )
+            cvbuffers = [
+                (
+                    np.empty(bufsize, dtype=self.x_mat.dtype),
+                    np.empty(bufsize, dtype=self.x_mat.dtype) if hasna else None,
+                )
+                for _ in range(n_jobs)
+            ]
+        for i, comp in enumerate(range(firstcomp, firstcomp + ncomp)):
+            th0 = None
+            if init is not None and comp < init.shape[1]:
+                th0 = init[:, comp]
             PRESS = 0
+            if stats is not None:
+                stats._begin(comp)
             # Calculate on full matrix
-            th, ph = self._onecomp(self.x_mat, comp, hasna, startcol, tol, maxiter)
-            for cvround in range(cv):
-                train_mat = np.delete(
-                    self.x_mat,
-                    [skp for skp in cvxgroups[cvround] if skp < self.x_mat.shape[0]],
-                    0,
-                )
-                _, ph_cv = self._onecomp(train_mat, comp, hasna, startcol, tol, maxiter)
-                train_mat = np.delete(
-                    self.x_mat,
-                    [skp for skp in cvygroups[cvround] if skp < self.x_mat.shape[1]],
-                    1,
-                )
-                th_cv, _ = self._onecomp(train_mat, comp, hasna, startcol, tol, maxiter)
-                # Make sure the PCs are rotated in the same main direction for all cvs
-                if np.corrcoef(ph, ph_cv)[1, 0] < 0:
-                    cvP[[grp for grp in cvxgroups[cvround] if grp < nr]] = -ph_cv
-                else:
-                    cvP[[grp for grp in cvxgroups[cvround] if grp < nr]] = ph_cv
-                if np.corrcoef(th, th_cv)[1, 0] < 0:
-                    cvT.T[[grp for grp in cvygroups[cvround] if grp < nc]] = -th_cv
-                else:
-                    cvT.T[[grp for grp in cvygroups[cvround] if grp < nc]] = th_cv
-            # Calculate PRESS
+            th, ph, trace = self._racecomp(comp, th0)
+            niter[i] = len(trace)
+            self._traces.append(np.array(trace))
+            if stats is not None:
+                stats._lap("matvec")
             if cv:
-                pred_mat = cvP * cvT
-                cv_res = self.x_mat - pred_mat
-                cv_res[x_miss] = 0
-                PRESS = np.sum(cv_res**2)
+                # Loadings from the row folds and scores from the column folds
+                cvP = np.empty((cv, nc))
+                cvT = np.empty((cv, nr))
+                for cvround, (ph_cv, th_cv) in enumerate(
+                    _cvmap(
+                        lambda cvround, worker: self._cvfold(
+                            cvrowtrain[cvround],
+                            cvcoltrain[cvround],
+                            cvbuffers[worker],
+                            comp,
+                            hasna,
+                            startcol,
+                            tol,
+                            maxiter,
+                            th0,
+                            self._fitopts.get("accelerate", False),
+                        ),
+                        cv,
+                        n_jobs,
+                    )
+                ):
+                    # Make sure the PCs are rotated in the same main direction for all cvs
+                    cvP[cvround] = -ph_cv if np.corrcoef(ph, ph_cv)[1, 0] < 0 else ph_cv
+                    cvT[cvround] = -th_cv if np.corrcoef(th, th_cv)[1, 0] < 0 else th_cv
+                PRESS = self._cvpress(cvP, cvT)
+                if stats is not None:
+                    stats._lap("cv")
 
-            PRESS_SS[comp] = PRESS / np.nansum(self.x_mat * self.x_mat)
+            PRESS_SS[i] = PRESS / _sumsq(self.x_mat)
             # Update X
-            self.x_mat = self.x_mat - np.outer(th, ph)
-            loadings[:, comp] = ph
-            scores[:, comp] = th
-            eig[comp] = np.nansum(th * th)
+            _deflate(self.x_mat, th, ph)
+            loadings[:, i] = ph
+            scores[:, i] = th
+            eig[i] = np.nansum(th * th)
 
             # Cumulative proportion of variance explained
-            R2cum[comp] = 1 - (np.nansum(self.x_mat * self.x_mat) / TotalSS)
+            R2cum[i] = 1 - (_sumsq(self.x_mat) / self._TotalSS)
+            if stats is not None:
+                stats._lap("deflate")
+                stats._end(trace)
+        if stats is not None:
+            stats._finish()
+
+        for key, value in (
+            ("scores", scores),
+            ("loadings", loadings),
+            ("eig", eig),
+            ("R2cum", R2cum),
+            ("PRESS_SS", PRESS_SS),
+            ("niter", niter),
+        ):
+            self._res[key] = np.concatenate((self._res[key], value), axis=-1)
+        self._rowss_res, self._ssres = _residualss(self.x_mat)
+        self._setresults()
+
+    def _racecomp(self, comp, th0=None):
+        """NIPALS iteration for component comp of the deflated data, from nstarts
+        start vectors raced on n_jobs threads (see fit). Returns the scores,
+        loadings and trace of the start that converged first, with the signs
+        that the first start gives, i.e. th't0 > 0 for its start vector t0."""
+        hasna = self._hasna
+        startcol = self._fitopts["startcol"]
+        tol = self._fitopts["tol"]
+        maxiter = self._fitopts["maxiter"]
+        accelerate = self._fitopts.get("accelerate", False)
+        nstarts = min(self._fitopts.get("nstarts", 1), self.x_mat.shape[1])
+        columns = []
+        if nstarts > 1:
+            # The other starts are the columns with the highest variance
+            xvar = _nanmeanstd(self.x_mat)[1] ** 2
+            order = np.argsort(-xvar, kind="stable")
+            first = None if th0 is not None else startcol
+            first = _startcolumn(xvar) if first is None else first
+            columns = [col for col in order if col != first][: nstarts - 1]
+
+        def run(start, stop):
+            trace = []
+            result = self._onecomp(
+                self.x_mat,
+                comp,
+                hasna,
+                startcol if start == 0 else columns[start - 1],
+                tol,
+                maxiter,
+                th0=th0 if start == 0 else None,
+                accelerate=accelerate,
+                trace=trace,
+                stop=stop,
+            )
+            return None if result is None else result + (trace,)
+
+        if nstarts <= 1:
+            return run(0, None)
+        th, ph, trace = _race(
+            run, nstarts, _njobs(self._fitopts["n_jobs"], nstarts), comp
+        )
+        if th0 is None:
+            th0 = np.nan_to_num(self.x_mat[:, first])
+        if th.dot(th0) < 0:
+            th, ph = -th, -ph
+        return th, ph, trace
+
+    def _labels(self):
+        """Row and column labels of the data, sparse data has numbered rows"""
+        if self.x_sparse is not None:
+            return pd.RangeIndex(self.x_sparse.shape[0]), self.x_df.columns
+        return self.x_df.index, self.x_df.columns
+
+    def _setresults(self, index=None):
+        """Set the results that transforms need from the collected arrays, index
+        defaults to the rows of the data. The Series and DataFrames of the
+        results (_lazyresults) are built as copies of the arrays on first
+        access."""
+        if index is None:
+            index = self._labels()[0]
+        self._resindex = index
+        for attr in self._lazyresults:
+            self.__dict__.pop(attr, None)
+        R2cum = self._res["R2cum"]
 
         # "Uncumulate" R2
         self.R2 = np.insert(np.diff(R2cum), 0, R2cum[0])
-        self.R2cum = pd.Series(
-            R2cum, index=["PC{}".format(i + 1) for i in range(ncomp)]
-        )
 
-        # Finalize eigenvalues and subtract from scores
-        self.eig = pd.Series(np.sqrt(eig))
+        self._proj, self._projoffset = self._projection()
+
+    def _pcs(self):
+        """Labels of the components of the model"""
+        return _pcindex(self._res["eig"].shape[0])
+
+    @functools.cached_property
+    def R2cum(self):
+        return pd.Series(self._res["R2cum"], index=self._pcs(), copy=True)
+
+    @functools.cached_property
+    def eig(self):
+        return pd.Series(np.sqrt(self._res["eig"]))
+
+    @functools.cached_property
+    def PRESS_SS(self):
+        if not self._fitopts["cv"]:
+            raise AttributeError("PRESS_SS is only available after a fit with cv")
+        return pd.Series(self._res["PRESS_SS"], index=self._pcs(), copy=True)
+
+    @functools.cached_property
+    def Q2(self):
+        return 1 - self.PRESS_SS
+
+    @functools.cached_property
+    def Q2cum(self):
+        return 1 - np.cumprod(self.PRESS_SS)
+
+    @functools.cached_property
+    def scores(self):
+        # Eigenvalues are swept out of the scores with eigsweep
+        scores = self._res["scores"]
         if self.eigsweep:
-            scores = scores / self.eig.values
-        if cv:
-            self.PRESS_SS = pd.Series(
-                PRESS_SS, index=["PC{}".format(i + 1) for i in range(ncomp)]
-            )
-            self.Q2 = 1 - self.PRESS_SS
-            self.Q2cum = 1 - np.cumprod(self.PRESS_SS)
-
-        # Convert results to DataFrames
-        self.scores = pd.DataFrame(
-            scores,
-            index=self.x_df.index,
-            columns=["PC{}".format(i + 1) for i in range(ncomp)],
+            scores = scores / np.sqrt(self._res["eig"])
+        return pd.DataFrame(
+            scores, index=self._resindex, columns=self._pcs(), copy=True
         )
-        self.loadings = pd.DataFrame(
-            loadings,
-            index=self.x_df.columns,
-            columns=["PC{}".format(i + 1) for i in range(ncomp)],
+
+    @functools.cached_property
+    def loadings(self):
+        return pd.DataFrame(
+            self._res["loadings"],
+            index=self._labels()[1],
+            columns=self._pcs(),
+            copy=True,
         )
-        return True
+
+    @functools.cached_property
+    def niter(self):
+        # Iterations and their squared score changes of the NIPALS fits
+        if "niter" not in self._res:
+            raise AttributeError("niter is not available after partial_fit")
+        return pd.Series(self._res["niter"], index=self._pcs(), copy=True)
+
+    @functools.cached_property
+    def traces(self):
+        if "niter" not in self._res:
+            raise AttributeError("traces are not available after partial_fit")
+        return dict(zip(self._pcs(), self._traces))
 
     def dModX(self):
         """
@@ -986,13 +3347,12 @@ class Nipals(object):
         data." Bioinformatics, 23, pp. 1164-1167.)
         Modified to scale with mean
         """
-        nr, nc = self.x_mat.shape
-        ncomp = self.scores.shape[1]
+        nr = self._nobs
+        nc, ncomp = self._res["loadings"].shape
         A0 = 0 if isinstance(self.x_mean, int) else 1
         ny = np.sqrt(nr / (nr - ncomp - A0))
-        E2 = self.x_mat * self.x_mat
-        s = np.sqrt(np.nansum(E2, axis=1) / (nc - ncomp)) * ny
-        S0 = np.sqrt(np.nansum(E2) / ((nr - ncomp - A0) * (nc - ncomp)))
+        s = np.sqrt(self._rowss_res / (nc - ncomp)) * ny
+        S0 = np.sqrt(self._ssres.sum() / ((nr - ncomp - A0) * (nc - ncomp)))
         return s / S0
 
     def loadingsplot(
@@ -1000,8 +3360,11 @@ class Nipals(object):
         comps=["PC1", "PC2"],
         msize=100,
         figsize=(12, 8),
+        maxpoints=20000,
+        maxlabels=200,
     ):
-        """Plot method for plotting loadings"""
+        """Plot method for plotting loadings, see _loadingsplot for maxpoints and
+        maxlabels"""
         return _loadingsplot(
             modelinstance=self,
             comps=comps,
@@ -1015,6 +3378,8 @@ class Nipals(object):
             weightsize=None,
             labels=True,
             textsize=10,
+            maxpoints=maxpoints,
+            maxlabels=maxlabels,
         )
 
     def plot(
@@ -1034,8 +3399,12 @@ class Nipals(object):
         predlabels=None,
         textsize=10,
         color="#555555",
+        maxpoints=20000,
+        largemode="decimate",
+        maxlabels=200,
     ):
-        """Plot method for plotting scores, with optional classes and predictions"""
+        """Plot method for plotting scores, with optional classes and predictions,
+        see _plot for maxpoints, largemode and maxlabels"""
         return _plot(
             self,
             comps,
@@ -1053,28 +3422,220 @@ class Nipals(object):
             predlabels,
             textsize,
             color,
+            maxpoints,
+            largemode,
+            maxlabels,
         )
 
-    def predict(self, new_x: np.ndarray):
-        """Predict new values into the NIPALS model
+    def predict(self, new_x: np.ndarray, missing="tsr"):
+        """Predict new values into the NIPALS model, the scores are set as pred
+
+        new_x is not modified, see transform
 
         parameters:
-        new_x: np.ndarray
+        new_x: np.ndarray or pd.DataFrame
+        missing: method for rows with missing values, see transform
+        """
+        self.pred = self.transform(new_x, frame=True, missing=missing)
+        return True
+
+    def transform(self, new_x, out=None, frame=False, missing="tsr"):
+        """Scores of new data
+
+        Neither new_x nor the model are modified, so a fitted model can be used
+        from several threads at once. Complete rows are projected by one matrix
+        product, with the centering, scaling and eigsweep folded into the
+        projection matrix.
+
+        new_x - array or DataFrame with the variables of the model
+        out - optional array of shape (rows, components) for the scores
+        frame - whether to return a DataFrame with the index of new_x and the
+            component columns, defaults to False (an array)
+        missing - method for the scores of rows with missing values: "tsr" for
+            trimmed score regression, "pmp" for projection to the model plane
+            (see _projectmissing) or "mean" to replace the missing values by the
+            column means (by 0 without centering), defaults to "tsr"
         """
-        self.new_x = new_x
+        new_x, index = _asarray(new_x, self._labels()[1])
         try:
-            if self.center:
-                self.new_x -= self.x_mean
-            if self.scale:
-                self.new_x /= self.x_std
+            proj, offset = self._proj, self._projoffset
         except AttributeError:
-            # Compatibility with saved objects from pre-0.5.0 versions.
-            self.new_x = (new_x - self.x_mean) / self.x_std
-        self.new_x = self.new_x.fillna(0)
-        self.pred = self.new_x.dot(self.loadings)
+            # Saved objects from older versions
+            proj, offset = self._projection()
+        scores = np.dot(new_x, proj.astype(new_x.dtype, copy=False), out=out)
+        scores -= offset
+
+        # Missing values propagate to the scores
+        rows = np.flatnonzero(~np.isfinite(scores).all(axis=1))
+        if len(rows):
+            scores[rows] = self._missingscores(new_x[rows], missing, proj, offset)
+        if frame:
+            return pd.DataFrame(scores, index=index, columns=self.loadings.columns)
+        return scores
+
+    def _missingscores(self, rows, method, proj, offset):
+        """Scores of rows with missing or infinite values"""
+        center = getattr(self, "center", True)
+        if method == "tsr" and not hasattr(self, "_ssres"):
+            # Saved objects from pre-0.5.0 versions have no residual variances,
+            # their rows are scored as those versions did, by filling in the
+            # means
+            method = "mean"
+        if method == "mean":
+            fill = self.x_mean if center else 0
+            return np.where(np.isfinite(rows), rows, fill).dot(proj) - offset
+        mat = np.where(np.isfinite(rows), rows, np.nan)
+        if center:
+            mat -= np.asarray(self.x_mean, dtype=float)
+        if getattr(self, "scale", True):
+            mat /= np.asarray(self.x_std, dtype=float)
+        if method == "pmp" and not hasattr(self, "_res"):
+            scores = _projectmissing(
+                mat, np.asarray(self.loadings, dtype=float), method
+            )
+            if self.eigsweep:
+                scores /= np.asarray(self.eig, dtype=float)
+            return scores
+        eig = self._res["eig"]
+        scores = _projectmissing(
+            mat,
+            self._res["loadings"],
+            method,
+            scorevar=eig / (self._nobs - 1),
+            resvar=self._ssres / (self._nobs - 1),
+        )
         if self.eigsweep:
-            self.pred = self.pred / self.eig.values
-        return True
+            scores /= np.sqrt(eig)
+        return scores
+
+    def _newscores(self, new_x, missing):
+        """Preprocessed new data (missing values as NaN) and its scores before
+        eigsweep"""
+        scores = self.transform(new_x, missing=missing)
+        if self.eigsweep:
+            scores *= np.sqrt(self._res["eig"])
+        x_mat = np.where(np.isfinite(new_x), new_x, np.nan)
+        if self.center:
+            x_mat -= self.x_mean
+        if self.scale:
+            x_mat /= self.x_std
+        return x_mat, scores
+
+    def dmodx(self, new_x, ncomp=None, missing="tsr"):
+        """DModX of new data, the residual standard deviation of every row relative
+        to S0 of the training data, with the first ncomp components (defaults to
+        all). Rows with missing values are scored as in transform and their
+        residual standard deviation is taken over the observed variables. Compare
+        with dmodx_limit."""
+        ncomp = _usecomps(ncomp, self._res["eig"].shape[0])
+        new_x, _ = _asarray(new_x, self._labels()[1])
+        x_mat, scores = self._newscores(new_x, missing)
+        loadings = self._res["loadings"]
+        res = x_mat - scores[:, :ncomp].dot(loadings[:, :ncomp].T)
+        ssres = self._ssres + (loadings[:, ncomp:] ** 2).dot(self._res["eig"][ncomp:])
+        A0 = 0 if isinstance(self.x_mean, int) else 1
+        return _dmodx(res, ssres, self._nobs, ncomp, A0)
+
+    def t2(self, new_x, ncomp=None, missing="tsr"):
+        """Hotelling's T2 of new data with the first ncomp components (defaults to
+        all), from the score variances of the training data. Compare with
+        t2_limit."""
+        ncomp = _usecomps(ncomp, self._res["eig"].shape[0])
+        new_x, _ = _asarray(new_x, self._labels()[1])
+        scores = self._newscores(new_x, missing)[1][:, :ncomp]
+        return (scores * scores).dot((self._nobs - 1) / self._res["eig"][:ncomp])
+
+    def dmodx_limit(self, alpha=0.05, ncomp=None):
+        """Critical DModX of the model at significance level alpha"""
+        ncomp = _usecomps(ncomp, self._res["eig"].shape[0])
+        A0 = 0 if isinstance(self.x_mean, int) else 1
+        nc = self._res["loadings"].shape[0]
+        return _dmodxlimit(alpha, self._nobs, nc, ncomp, A0)
+
+    def t2_limit(self, alpha=0.05, ncomp=None):
+        """Critical Hotelling's T2 of new data at significance level alpha"""
+        ncomp = _usecomps(ncomp, self._res["eig"].shape[0])
+        return _t2limit(alpha, self._nobs, ncomp)
+
+    def save(self, path):
+        """Save the model to an uncompressed npz file at path, for scoring new data
+        after loading with Nipals.load
+
+        Only the arrays needed to score new data are saved: the means and
+        standard deviations, loadings, eigenvalues, R2 and Q2 and the residual
+        sums of squares of the DModX limit and of missing value estimation. The
+        data, scores and working matrices are not."""
+        _savemodel(path, *self._savestate())
+
+    def _savestate(self):
+        """Arrays and meta dict saved by save"""
+        arrays = dict(x_mean=self.x_mean, x_std=self.x_std, ssres=self._ssres)
+        for key in ("loadings", "eig", "R2cum", "PRESS_SS"):
+            arrays[key] = self._res[key]
+        meta = dict(
+            model="Nipals",
+            columns=self._labels()[1].tolist(),
+            center=self.center,
+            scale=self.scale,
+            eigsweep=self.eigsweep,
+            nobs=self._nobs,
+            fitopts=self._fitopts,
+        )
+        return arrays, meta
+
+    @staticmethod
+    def load(path, mmap=True):
+        """Load a model saved by Nipals.save (or ChunkedNipals.save) as a Nipals
+        model
+
+        With mmap, the arrays of the model are read-only memory maps of the file,
+        so loading takes about the same time for any size of model and processes
+        that load the same file share the memory. The loaded model has no data or
+        scores, it scores new data (transform, predict, dmodx, t2 and the limits)
+        and has the loadings, eig, R2 and Q2 results. It cannot be refit or
+        updated."""
+        arrays, meta = _loadmodel(path, "Nipals", mmap)
+        return Nipals._loadstate(Nipals.__new__(Nipals), arrays, meta)
+
+    @staticmethod
+    def _loadstate(model, arrays, meta):
+        """Set up the unfitted model from the arrays and meta dict of a saved
+        model, see load"""
+        model.x_df = _labelframe(_labelindex(meta["columns"]))
+        model.center = meta["center"]
+        model.scale = meta["scale"]
+        model.eigsweep = meta["eigsweep"]
+        model._nobs = meta["nobs"]
+        model._fitopts = dict(meta["fitopts"], compact=True)
+        model.x_mean = arrays.pop("x_mean")
+        model.x_std = arrays.pop("x_std")
+        model._ssres = arrays.pop("ssres")
+        ncomp = arrays["eig"].shape[0]
+        model._res = dict(arrays, scores=np.empty((0, ncomp)))
+        model._setresults(index=pd.RangeIndex(0))
+        return model
+
+    def _projection(self):
+        """Projection matrix and offset of the scores in the units of the data,
+        scores = X proj - offset"""
+        # Compatibility with saved objects from pre-0.5.0 versions, which always
+        # centered and scaled
+        center = getattr(self, "center", True)
+        scale = getattr(self, "scale", True)
+        if hasattr(self, "_res"):
+            loadings, eig = self._res["loadings"], np.sqrt(self._res["eig"])
+        else:
+            loadings, eig = self.loadings, self.eig
+        proj = np.asarray(loadings, dtype=float)
+        if scale:
+            proj = proj / np.asarray(self.x_std, dtype=float)[:, np.newaxis]
+        if self.eigsweep:
+            proj = proj / np.asarray(eig, dtype=float)
+        if center:
+            offset = np.asarray(self.x_mean, dtype=float).dot(proj)
+        else:
+            offset = np.zeros(proj.shape[1])
+        return proj, offset
 
     def overviewplot(self):
         return (
@@ -1088,12 +3649,599 @@ class Nipals(object):
 
     def dModXPlot(self):
         dmx = self.dModX()
-        nr, nc = self.x_mat.shape
-        ncomp = self.scores.shape[1]
-        A0 = 0 if isinstance(self.x_mean, int) else 1
-        fc = np.sqrt(f.isf(0.05, nr - ncomp - A0, nc - ncomp))
-        ax = pd.Series(dmx, index=self.x_df.index.get_level_values(0)).plot(
+        fc = self.dmodx_limit(0.05)
+        ax = pd.Series(dmx, index=self.scores.index.get_level_values(0)).plot(
             kind="bar", color="green"
         )
         ax.hlines(fc, -1, 20)
         return ax.figure
+
+
+class ChunkedNipals(Nipals):
+    """Nipals PCA for data that does not fit in memory
+
+    Initialize with an array that supports slicing of row blocks, e.g. an
+    np.memmap, an HDF5 dataset or a Zarr array, with a list of row blocks, or with
+    a function that returns an iterator over the row blocks (called once per pass
+    over the data). The data is never loaded as a whole, only one block at a time
+    is converted to float, centered, scaled and deflated.
+
+    chunksize - rows per block when slicing an array, defaults to about 2**20
+    values per block
+    columns - column labels for the loadings, defaults to the column numbers
+    """
+
+    def __init__(self, x, chunksize=None, columns=None):
+        if not callable(x) and not hasattr(x, "shape") and iter(x) is x:
+            raise ValueError(
+                "An iterator can only be read once, pass a function that returns "
+                "a new iterator over the row blocks for every pass instead"
+            )
+        self.source = x
+        self.chunksize = chunksize
+        self.columns = columns
+
+    def _blocks(self, warn=False, copy=True):
+        """Row blocks of the data as float arrays without infs and dropped columns
+
+        Without copy, blocks of complete data that already have the working dtype
+        are returned as they are, e.g. as views of a memmap"""
+        if callable(self.source):
+            blocks = self.source()
+        elif hasattr(self.source, "shape"):
+            nr, nc = self.source.shape
+            step = self.chunksize or max(1, 2**20 // max(1, nc))
+            blocks = (self.source[i : i + step] for i in range(0, nr, step))
+        else:
+            blocks = self.source
+        for block in blocks:
+            if not copy and not self._hasna:
+                block = np.asarray(block, dtype=self._dtype)
+                yield block if self._keep is None else block[:, self._keep]
+                continue
+            block = np.array(block, dtype=self._dtype)
+            inf = np.isinf(block)
+            if inf.any():
+                if warn:
+                    logging.warning(
+                        "Data contained infinite values, converting to missing values"
+                    )
+                    warn = False
+                block[inf] = np.nan
+            if self._keep is not None:
+                block = block[:, self._keep]
+            yield block
+
+    def _residuals(self):
+        """Centered, scaled and deflated row blocks of the data, yields the rows
+        of every block, the block with missing values set to 0 and the
+        observed-value mask (None without missing values)"""
+        scores = self._res["scores"]
+        loadings = self._res["loadings"]
+        start = 0
+        for block in self._blocks():
+            rows = slice(start, start + block.shape[0])
+            start = rows.stop
+            if self.center:
+                block -= self.x_mean
+            if self.scale:
+                block /= self.x_std
+            if scores.shape[1]:
+                block -= scores[rows].dot(loadings.T)
+            if self._hasna:
+                obs = (~np.isnan(block)).astype(block.dtype)
+                block = np.nan_to_num(block, copy=False)
+            else:
+                obs = None
+            yield rows, block, obs
+
+    def _labels(self):
+        columns = self.columns
+        if columns is None:
+            columns = np.arange(len(self.x_std)) if self._keep is None else self._keep
+        return pd.RangeIndex(self._nr), pd.Index(columns)
+
+    def compact(self):
+        """Drop the data source of a fitted model, see Nipals.compact"""
+        self.scores
+        self.source = None
+        self._res["scores"] = np.empty((0, self._res["eig"].shape[0]))
+        self._fitopts["compact"] = True
+        return True
+
+    def fit(
+        self,
+        ncomp=None,
+        tol=0.000001,
+        center=True,
+        scale=True,
+        maxiter=500,
+        startcol=None,
+        eigsweep=False,
+        dropzerovar=False,
+        dtype=np.float64,
+        init=None,
+        stats=None,
+    ):
+        """The Fit method, will fit a PCA to the X data one row block at a time.
+
+        The keyword arguments are as for Nipals.fit, dtype is the dtype the blocks
+        are converted to. The column means and standard deviations are calculated
+        in one streaming pass, after that every NIPALS iteration is one pass over
+        the data, which also updates the scores of the next iteration. Only the
+        scores and loadings are kept in memory. Cross validation is not available.
+        stats records the passes of the iterations as matvec and the residual
+        pass after every component as deflate.
+        """
+        self.eigsweep = eigsweep
+        self.center = center
+        self.scale = scale
+        self._dtype = dtype
+        self._keep = None
+        # Blocks are copied and checked for infs until the statistics are known
+        self._hasna = True
+
+        # Streaming column statistics
+        colstats = (0, 0.0, 0.0)
+        nr = 0
+        for block in self._blocks(warn=True):
+            if np.isnan(block).all(axis=1).any():
+                raise ValueError("X matrix contains row with only NA values")
+            colstats = _combinestats(colstats, block)
+            nr += block.shape[0]
+        self._nr = nr
+        self._nobs = nr
+        count, mean, m2 = colstats
+        std = np.sqrt(m2 / (count - 1))
+
+        # check for zero variance variables
+        x_zerovar = np.flatnonzero(std == 0).tolist()
+        if self.columns is not None:
+            x_zerovar = [self.columns[i] for i in x_zerovar]
+        if len(x_zerovar) > 0:
+            if dropzerovar:
+                self._keep = np.flatnonzero(std != 0)
+                count, mean, m2, std = (
+                    count[self._keep],
+                    mean[self._keep],
+                    m2[self._keep],
+                    std[self._keep],
+                )
+                if self.columns is not None:
+                    self.columns = pd.Index(self.columns)[self._keep]
+            else:
+                raise ValueError(
+                    "X matrix has zero variance in column(s) {x_zerovar}\n".format(
+                        x_zerovar=x_zerovar
+                    )
+                    + 'Recall with "dropzerovar=True" to drop automatically'
+                )
+        self._count = count
+        self.x_mean = mean
+        self.x_std = std
+        self._hasna = (count < nr).any()
+        if self._hasna:
+            logging.info("Data has NA values")
+
+        # Total sum of squares and column variances of the preprocessed data
+        shift = mean if center else 0
+        scale2 = std * std if scale else 1
+        colss = (m2 + count * (mean - shift) ** 2) / scale2
+        self._colvar = m2 / scale2 / (count - 1)
+        self._TotalSS = colss.sum()
+
+        if ncomp is None:
+            ncomp = min(nr, len(count))
+        elif ncomp > min(nr, len(count)):
+            ncomp = min(nr, len(count))
+            logging.warning(
+                "ncomp is larger than the max dimension of the x matrix.\n"
+                "fit will only return {} components".format(ncomp)
+            )
+        self._fitopts = dict(startcol=startcol, tol=tol, maxiter=maxiter, cv=0)
+        self._stats = stats
+        self._res = dict(
+            scores=np.empty((nr, 0)),
+            loadings=np.empty((len(count), 0)),
+            eig=np.empty((0,)),
+            R2cum=np.empty((0,)),
+            PRESS_SS=np.empty((0,)),
+            niter=np.empty((0,), dtype=int),
+        )
+        self._traces = []
+        self._fitcomps(ncomp, init)
+        return True
+
+    def _fitcomps(self, ncomp, init=None):
+        """Calculate ncomp more components from the data and update the results"""
+        startcol = self._fitopts["startcol"]
+        stats = getattr(self, "_stats", None)
+        nr = self._nr
+        nc = self._count.shape[0]
+        firstcomp = self._res["eig"].shape[0]
+        init = _startvectors(init, nr, "scores")
+
+        for comp in range(firstcomp, firstcomp + ncomp):
+            th0 = None
+            if init is not None and comp < init.shape[1]:
+                th0 = init[:, comp]
+                logging.info("PC {}, starting with given vector".format(comp))
+            else:
+                # Set t to column of X with highest var
+                if startcol is None:
+                    startcol_use = _startcolumn(self._colvar)
+                else:
+                    startcol_use = startcol
+                logging.info(
+                    "PC {}, starting with column {}".format(comp, startcol_use)
+                )
+                th0 = startcol_use
+            trace = []
+            if stats is not None:
+                stats._begin(comp)
+            th, ph = self._iterate(comp, th0, trace)
+            self._traces.append(np.array(trace))
+            if stats is not None:
+                stats._lap("matvec")
+            for key, value in (
+                ("scores", th[:, np.newaxis]),
+                ("loadings", ph[:, np.newaxis]),
+                ("eig", [np.nansum(th * th)]),
+                ("niter", [len(trace)]),
+            ):
+                self._res[key] = np.concatenate((self._res[key], value), axis=-1)
+
+            # Residual pass, for R2 and the start column of the next component
+            colsum = np.zeros(nc)
+            colss = np.zeros(nc)
+            self._rowss_res = np.empty(nr)
+            self._ssres = colss
+            for rows, res, obs in self._residuals():
+                colsum += res.sum(axis=0)
+                colss += np.square(res).sum(axis=0)
+                self._rowss_res[rows] = np.square(res).sum(axis=1)
+            self._colvar = (colss - colsum * colsum / self._count) / (self._count - 1)
+            self._res["R2cum"] = np.append(
+                self._res["R2cum"], 1 - colss.sum() / self._TotalSS
+            )
+            self._res["PRESS_SS"] = np.append(self._res["PRESS_SS"], 0.0)
+            if stats is not None:
+                stats._lap("deflate")
+                stats._end(trace)
+        if stats is not None:
+            stats._finish()
+        self._setresults()
+
+    def _iterate(self, comp, start, trace=None):
+        """NIPALS iteration for one principal component, start is the column or
+        the vector to start from. Every pass over the data calculates the scores
+        from the current loadings and the loadings of the next iteration from
+        these scores. The squared changes of the scores are appended to trace."""
+        tol = self._fitopts["tol"]
+        maxiter = self._fitopts["maxiter"]
+        if np.isscalar(start):
+            unit = np.zeros(self._count.shape[0])
+            unit[start] = 1.0
+            th, ph_num, ph_den = self._products(unit, norm=False)
+        else:
+            th, ph_num, ph_den = self._products(th=start)
+        it = 0
+        while True:
+            # loadings
+            ph = ph_num / ph_den
+            # Normalize
+            ph = ph / math.sqrt(np.nansum(ph * ph))
+
+            # Scores, and the loadings for the next iteration
+            th_old = th
+            th, ph_num, ph_den = self._products(ph)
+
+            # Check convergence
+            change = np.nansum((th - th_old) ** 2)
+            if trace is not None:
+                trace.append(change)
+            if change < tol:
+                break
+            it += 1
+            if it >= maxiter:
+                raise RuntimeError(
+                    "Convergence was not reached in {} iterations for component {}".format(
+                        maxiter, comp
+                    )
+                )
+        return th, ph
+
+    def _products(self, ph=None, th=None, norm=True):
+        """One pass over the deflated data E: the scores th = E ph / ph'ph (or
+        E ph without norm, or the given th) and the numerator E'th and denominator
+        th'th of the next loadings, with the missing values left out of the sums.
+
+        Complete data is centered, scaled and deflated implicitly, so every block
+        is only read by two matrix-vector products."""
+        scores = self._res["scores"]
+        loadings = self._res["loadings"]
+        th_new = np.empty(self._nr)
+        if self._hasna:
+            ph_num = 0
+            ph_den = 0
+            for rows, res, obs in self._residuals():
+                if th is None:
+                    th_b = res.dot(ph)
+                    if norm:
+                        th_b /= obs.dot(ph * ph)
+                else:
+                    th_b = th[rows]
+                th_new[rows] = th_b
+                ph_num = ph_num + res.T.dot(th_b)
+                ph_den = ph_den + obs.T.dot(th_b * th_b)
+            return th_new, ph_num, ph_den
+
+        shift = self.x_mean if self.center else np.zeros_like(self.x_mean)
+        scale = self.x_std if self.scale else np.ones_like(self.x_std)
+        if th is None:
+            ph_scaled = ph / scale
+            ph_shift = shift.dot(ph_scaled)
+            ph_loadings = loadings.T.dot(ph)
+            ph_norm = ph.dot(ph) if norm else 1.0
+        xt = 0
+        tt = 0
+        sum_t = 0
+        start = 0
+        for block in self._blocks(copy=False):
+            rows = slice(start, start + block.shape[0])
+            start = rows.stop
+            if th is None:
+                th_b = block.dot(ph_scaled) - ph_shift
+                th_b -= scores[rows].dot(ph_loadings)
+                th_b /= ph_norm
+            else:
+                th_b = th[rows]
+            th_new[rows] = th_b
+            xt = xt + block.T.dot(th_b)
+            tt = tt + scores[rows].T.dot(th_b)
+            sum_t += th_b.sum()
+        ph_num = (xt - shift * sum_t) / scale - loadings.dot(tt)
+        return th_new, ph_num, th_new.dot(th_new)
+
+
+class KernelNipals(Nipals):
+    """Kernel PCA by NIPALS on an explicit low rank feature map of the kernel
+
+    The kernel matrix of the n rows is approximated by F F' with an n x m
+    feature matrix F, whose centered columns are fit by Nipals.fit, so the
+    results are those of Nipals on the features. New data is mapped to the
+    features by transform, predict, dmodx, t2 and partial_fit. Initialize with
+    complete data as for Nipals.
+
+    kernel - "rbf", "poly" or "linear", see _kernelmatrix, defaults to "rbf"
+    approximation - "nystroem" (Williams and Seeger, NIPS 13 (2001) 682-688) or
+        "fourier" for the rbf kernel (Rahimi and Recht, NIPS 20 (2007)
+        1177-1184), defaults to "nystroem"
+    nfeatures - number of landmarks or Fourier features m, defaults to 500
+    gamma - kernel width, defaults to 1 / number of variables
+    degree, coef0 - parameters of the poly kernel
+    seed - seed of the random landmarks or Fourier features"""
+
+    def __init__(
+        self,
+        x_df,
+        kernel="rbf",
+        approximation="nystroem",
+        nfeatures=500,
+        gamma=None,
+        degree=3,
+        coef0=1.0,
+        seed=0,
+    ):
+        if approximation not in ("nystroem", "fourier"):
+            raise ValueError("Unknown approximation {}".format(approximation))
+        if approximation == "fourier" and kernel != "rbf":
+            raise ValueError("Fourier features are only available for the rbf kernel")
+        if kernel not in ("rbf", "poly", "linear"):
+            raise ValueError("Unknown kernel {}".format(kernel))
+        if issparse(x_df):
+            x_df = x_df.toarray()
+        if not isinstance(x_df, pd.DataFrame):
+            x_df = pd.DataFrame(x_df)
+        self.data_df = x_df.astype("float")
+        if not np.isfinite(self.data_df.values).all():
+            raise ValueError("Kernel PCA needs complete data without infinite values")
+        self.kernel = kernel
+        self.approximation = approximation
+        self.nfeatures = nfeatures
+        self.gamma = gamma
+        self.degree = degree
+        self.coef0 = coef0
+        self.seed = seed
+
+    def fit(
+        self,
+        ncomp=None,
+        tol=0.000001,
+        scale=True,
+        maxiter=500,
+        startcol=None,
+        eigsweep=False,
+        cv=False,
+        method="nipals",
+        dtype=None,
+        n_jobs=None,
+        init=None,
+        keep_training_data=True,
+        accelerate=False,
+        nstarts=1,
+        stats=None,
+    ):
+        """The Fit method, will fit a kernel PCA to the data
+
+        scale - whether to scale the variables to unit variance before the kernel,
+            defaults to True. The features are always centered and never scaled.
+        dtype - dtype of the feature matrix, np.float32 halves the memory use
+        The other arguments are those of Nipals.fit."""
+        mat = self.data_df.values
+        nr, nc = mat.shape
+        self.data_mean = mat.mean(axis=0)
+        self.data_std = mat.std(axis=0, ddof=1) if scale else np.ones(nc)
+        self.data_std[self.data_std == 0] = 1
+        gamma = 1.0 / nc if self.gamma is None else self.gamma
+        rng = np.random.default_rng(self.seed)
+        if self.approximation == "nystroem":
+            landmarks = self._scaledata(
+                mat[np.sort(rng.choice(nr, min(self.nfeatures, nr), replace=False))]
+            )
+            lam, vec = np.linalg.eigh(
+                _kernelmatrix(
+                    landmarks, landmarks, self.kernel, gamma, self.degree, self.coef0
+                )
+            )
+            keep = lam > lam.max() * 1e-10
+            nfeat = keep.sum()
+            self._featuremap = dict(
+                landmarks=landmarks, proj=vec[:, keep] / np.sqrt(lam[keep]), gamma=gamma
+            )
+        else:
+            self._featuremap = dict(
+                freq=rng.standard_normal((nc, self.nfeatures)) * math.sqrt(2 * gamma),
+                phase=rng.uniform(0, 2 * math.pi, self.nfeatures),
+                gamma=gamma,
+            )
+            nfeat = self.nfeatures
+        self.x_df = _labelframe(pd.Index(["F{}".format(i + 1) for i in range(nfeat)]))
+        self._fitdtype = dtype
+        return super(KernelNipals, self).fit(
+            ncomp=ncomp,
+            tol=tol,
+            center=True,
+            scale=False,
+            maxiter=maxiter,
+            startcol=startcol,
+            eigsweep=eigsweep,
+            cv=cv,
+            method=method,
+            dtype=dtype,
+            n_jobs=n_jobs,
+            init=init,
+            keep_training_data=keep_training_data,
+            accelerate=accelerate,
+            nstarts=nstarts,
+            stats=stats,
+        )
+
+    def _scaledata(self, mat):
+        """Data centered and scaled as before the kernel"""
+        return (mat - self.data_mean) / self.data_std
+
+    def _features(self, mat, dtype=None):
+        """Feature matrix of the rows of data mat, calculated in row chunks so
+        the only full size array is the result"""
+        fmap = self._featuremap
+        nfeat = (fmap["proj"] if "proj" in fmap else fmap["freq"]).shape[1]
+        out = np.empty((mat.shape[0], nfeat), dtype=dtype or float)
+        for rows in _rowchunks(out):
+            block = self._scaledata(np.asarray(mat[rows], dtype=float))
+            if "proj" in fmap:
+                out[rows] = _kernelmatrix(
+                    block,
+                    fmap["landmarks"],
+                    self.kernel,
+                    fmap["gamma"],
+                    self.degree,
+                    self.coef0,
+                ).dot(fmap["proj"])
+            else:
+                block = block.dot(fmap["freq"])
+                block += fmap["phase"]
+                out[rows] = np.cos(block) * math.sqrt(2.0 / nfeat)
+        return out
+
+    def _featureframe(self, new_x):
+        """Features of new data as a DataFrame with the index of new_x"""
+        new_x, index = _asarray(new_x, self.data_df.columns)
+        if not np.isfinite(new_x).all():
+            raise ValueError("Kernel PCA needs complete data without infinite values")
+        return pd.DataFrame(
+            self._features(new_x), index=index, columns=self.x_df.columns
+        )
+
+    def _workmatrix(self, dtype=None):
+        return self._features(self.data_df.values, dtype)
+
+    def _labels(self):
+        """Row labels of the data and the feature labels"""
+        return self.data_df.index, self.x_df.columns
+
+    def compact(self):
+        """Drop the data and the feature matrix of a fitted model, see
+        Nipals.compact"""
+        self.data_df = _labelframe(self.data_df.columns)
+        return super(KernelNipals, self).compact()
+
+    def partial_fit(self, new_x, forget=1.0):
+        """Update a fitted model with new rows of data, see Nipals.partial_fit. The
+        feature map is not updated."""
+        return super(KernelNipals, self).partial_fit(self._featureframe(new_x), forget)
+
+    def transform(self, new_x, out=None, frame=False, missing="tsr"):
+        """Scores of new data, see Nipals.transform. The data must be complete,
+        missing is only accepted for predict."""
+        features = self._featureframe(new_x)
+        scores = super(KernelNipals, self).transform(features.values, out=out)
+        if frame:
+            return pd.DataFrame(scores, index=features.index, columns=self._pcs())
+        return scores
+
+    def _newscores(self, new_x, missing):
+        """Centered features of new data and their scores before eigsweep"""
+        scores = super(KernelNipals, self).transform(new_x)
+        if self.eigsweep:
+            scores *= np.sqrt(self._res["eig"])
+        return new_x - self.x_mean, scores
+
+    def dmodx(self, new_x, ncomp=None):
+        """DModX of new data in feature space, see Nipals.dmodx. The data must be
+        complete."""
+        return super(KernelNipals, self).dmodx(self._featureframe(new_x), ncomp)
+
+    def t2(self, new_x, ncomp=None):
+        """Hotelling's T2 of new data, see Nipals.t2. The data must be complete."""
+        return super(KernelNipals, self).t2(self._featureframe(new_x), ncomp)
+
+    def save(self, path):
+        """Save the model to an uncompressed npz file at path, for scoring new data
+        after loading with KernelNipals.load, see Nipals.save. The feature map is
+        saved with the model."""
+        arrays, meta = self._savestate()
+        arrays.update(
+            ("fmap_" + key, value)
+            for key, value in self._featuremap.items()
+            if key != "gamma"
+        )
+        arrays.update(data_mean=self.data_mean, data_std=self.data_std)
+        meta.update(
+            model="KernelNipals",
+            datacolumns=self.data_df.columns.tolist(),
+            kernel=self.kernel,
+            approximation=self.approximation,
+            nfeatures=self.nfeatures,
+            gamma=self._featuremap["gamma"],
+            degree=self.degree,
+            coef0=self.coef0,
+            seed=self.seed,
+        )
+        _savemodel(path, arrays, meta)
+
+    @staticmethod
+    def load(path, mmap=True):
+        """Load a model saved by KernelNipals.save, see Nipals.load"""
+        arrays, meta = _loadmodel(path, "KernelNipals", mmap)
+        model = KernelNipals.__new__(KernelNipals)
+        model.data_df = _labelframe(_labelindex(meta["datacolumns"]))
+        for key in ("kernel", "approximation", "nfeatures", "degree", "coef0", "seed"):
+            setattr(model, key, meta[key])
+        model.gamma = meta["gamma"]
+        model.data_mean = arrays.pop("data_mean")
+        model.data_std = arrays.pop("data_std")
+        model._featuremap = dict(gamma=meta["gamma"])
+        for name in [name for name in arrays if name.startswith("fmap_")]:
+            model._featuremap[name[5:]] = arrays.pop(name)
+        return Nipals._loadstate(model, arrays, meta)
@@ -0,0 +1,464 @@
+"""Nonlinear PLS, with a nonlinear inner relation between the X and Y scores
+
+Linear PLS relates the scores of every component by u = b t. Here the inner
+relation is a curve u = g(t), a polynomial or a cubic spline in t, and the X
+weights of the component are chosen so that g(X w) fits u (Wold, Kettaneh-Wold
+and Skagerberg, Chemometr Intell Lab 7 (1989) 53-65; Baffi, Martin and Morris,
+Comput Chem Eng 23 (1999) 395-411).
+"""
+
+from __future__ import division
+
+import functools
+import logging
+
+import numpy as np
+import pandas as pd
+
+from nipals import (
+    PLS,
+    _asarray,
+    _deflate,
+    _dmodx,
+    _residualss,
+    _startcolumn,
+    _startvectors,
+    _sumsq,
+    _usecomps,
+)
+
+# Degree and number of knots of the inner relations, None takes the argument
+_RELATIONS = dict(quadratic=(2, 0), polynomial=(None, 0), spline=(None, None))
+
+
+def _basis(s, degree, nknots):
+    """Basis functions of the inner relations at the normalized scores s, shape
+    (..., rows), as an array of shape (..., functions, rows): the powers 1, s,
+    ..., s^degree and the truncated powers (s - k)_+^degree for nknots knots k
+    equally spaced in (0, 1)
+
+    The powers are built up by multiplication in place, which is much faster
+    than np.power."""
+    out = np.empty(s.shape[:-1] + (degree + 1 + nknots,) + s.shape[-1:])
+    out[..., 0, :] = 1
+    for j in range(1, degree + 1):
+        np.multiply(out[..., j - 1, :], s, out=out[..., j, :])
+    hinge = np.empty_like(s) if nknots else None
+    for k in range(nknots):
+        _hinge(s, (k + 1) / (nknots + 1), hinge)
+        power = out[..., degree + 1 + k, :]
+        power[...] = hinge
+        for _ in range(1, degree):
+            power *= hinge
+    return out
+
+
+def _hinge(s, knot, out):
+    """(s - knot)_+ in out"""
+    np.subtract(s, knot, out=out)
+    return np.maximum(out, 0, out=out)
+
+
+def _innerslope(s, basis, coef, degree, nknots):
+    """Derivatives by s of the inner relations with the coefficients coef (one
+    row per column of s) and the basis at s, one column per relation
+
+    The derivatives of the powers are the lower powers in the basis, only the
+    truncated powers of degree - 1 are calculated, in place."""
+    powers = np.arange(1, degree + 1)
+    slope = np.matmul(
+        (coef[:, 1 : degree + 1] * powers)[:, np.newaxis, :], basis[:, :degree, :]
+    )[:, 0, :]
+    hinge = np.empty_like(s)
+    power = np.empty_like(s)
+    for k in range(nknots):
+        _hinge(s, (k + 1) / (nknots + 1), hinge)
+        if degree == 1:
+            np.greater(hinge, 0, out=power)
+        else:
+            power[...] = hinge
+        for _ in range(2, degree):
+            power *= hinge
+        power *= degree * coef[:, degree + 1 + k, np.newaxis]
+        slope += power
+    return slope.T
+
+
+def _innerfit(th, uh, mask, degree, nknots):
+    """Least squares inner relations u = g(t) between the columns of th and uh,
+    each on the rows where its column of mask is 1
+
+    The scores are normalized to s = (t - lo) / span, with lo and span the
+    minimum and range of the fitted rows. Returns the coefficients of the basis
+    functions (one row per column of th), lo, span, s (one row per column of th,
+    0 outside the mask) and the basis at s, shape (columns, basis functions,
+    rows), which is zero outside the mask, as all basis functions but the
+    constant vanish at s = 0. All columns are fit together by batched normal
+    equations."""
+    lo = np.where(mask, th, np.inf).min(axis=0)
+    span = np.where(mask, th, -np.inf).max(axis=0) - lo
+    span = np.maximum(span, np.finfo(float).tiny)
+    # Rows of s are contiguous, which halves the time of the basis
+    s = np.ascontiguousarray(((th - lo) / span * mask).T)
+    basis = _basis(s, degree, nknots)
+    basis[:, 0, :] = mask.T
+    btb = np.matmul(basis, basis.transpose(0, 2, 1))
+    btu = np.matmul(basis, uh.T[:, :, np.newaxis])
+    # A tiny ridge keeps the equations solvable for scores with few distinct
+    # values, e.g. in knot intervals without rows
+    ridge = 1e-10 * np.trace(btb, axis1=1, axis2=2) + np.finfo(float).tiny
+    btb += ridge[:, np.newaxis, np.newaxis] * np.eye(btb.shape[1])
+    coef = np.linalg.solve(btb, btu)[:, :, 0]
+    return coef, lo, span, s, basis
+
+
+def _innereval(basis, coef):
+    """Inner relations g with the coefficients coef (one row per column) from
+    their basis of shape (columns, basis functions, rows), one column per
+    relation"""
+    return np.matmul(coef[:, np.newaxis, :], basis)[:, 0, :].T
+
+
+def _innercomp(x_mat, y_mat, mask, uh, degree, nknots, tol, maxiter, comp, trace=None):
+    """NIPALS iteration for one component with a nonlinear inner relation, for
+    several fits at once
+
+    Column f of mask selects the rows of fit f (the training rows of a CV round,
+    or all rows) and column f of uh is its start vector. The X weights start as
+    the linear PLS weights X'u. In every iteration the inner relation is fit,
+    the weights take a Gauss-Newton step for the error u - g(X w), along the
+    gradient X' (g'(t) e) with the Jacobian diag(g'(t)) X of g(X w), and the Y
+    loadings and scores follow from g(t) as the linear scores t in PLS. A step
+    costs two products with X and X', as in PLS. The largest squared change of
+    the scores is appended to trace every iteration. Returns th (for all rows),
+    uh, wh and qh with a column per fit and the inner relations (coef, lo,
+    span)."""
+    uh = uh * mask
+    wh = x_mat.T.dot(uh)
+    wh /= np.sqrt((wh * wh).sum(axis=0))
+    th = x_mat.dot(wh)
+    tiny = np.finfo(float).tiny
+    it = 0
+    while True:
+        coef, lo, span, s, basis = _innerfit(th, uh, mask, degree, nknots)
+
+        # Y loadings and scores from the inner relation
+        gh = _innereval(basis, coef)
+        qh = y_mat.T.dot(gh) / np.maximum((gh * gh).sum(axis=0), tiny)
+        uh = y_mat.dot(qh) / np.maximum((qh * qh).sum(axis=0), tiny) * mask
+
+        # Gauss-Newton step along the gradient, the step length minimizes the
+        # linearized error
+        dgh = _innerslope(s, basis, coef, degree, nknots) / span
+        err = uh - gh
+        grad = x_mat.T.dot(dgh * err)
+        jgrad = dgh * x_mat.dot(grad) * mask
+        step = (grad * grad).sum(axis=0) / np.maximum((jgrad * jgrad).sum(axis=0), tiny)
+        wh = wh + step * grad
+        wh /= np.sqrt((wh * wh).sum(axis=0))
+
+        th_old = th
+        th = x_mat.dot(wh)
+        change = (((th - th_old) ** 2) * mask).sum(axis=0).max()
+        if trace is not None:
+            trace.append(change)
+        if change < tol:
+            break
+        it += 1
+        if it >= maxiter:
+            raise RuntimeError(
+                "Convergence was not reached in {} iterations for component {}".format(
+                    maxiter, comp
+                )
+            )
+    coef, lo, span, _, _ = _innerfit(th, uh, mask, degree, nknots)
+    return th, uh, wh, qh, (coef, lo, span)
+
+
+class NonlinearPLS(PLS):
+    """A class for nonlinear PLS, with a polynomial or spline inner relation
+    between the X and Y scores of every component.
+
+    Initialize as PLS. The scores, loadings, weights and the DModX, T2 and
+    plotting methods are those of PLS, the X data is deflated linearly. The Y
+    data is deflated by g(t) q', so predictions go through the inner relations.
+    b holds the slopes of the linear inner relations of the scores, for
+    reference only. partial_fit is not available."""
+
+    _lazyresults = PLS._lazyresults + ("inner",)
+    _savedresults = PLS._savedresults + ("inner", "lo", "span", "gg")
+
+    def fit(
+        self,
+        ncomp=None,
+        center=True,
+        scale=True,
+        startcol=None,
+        tol=0.000001,
+        maxiter=500,
+        cv=False,
+        dropzerovar=False,
+        dtype=None,
+        n_jobs=None,
+        init=None,
+        keep_training_data=True,
+        *,
+        relation="quadratic",
+        degree=3,
+        knots=4,
+        stats=None,
+    ):
+        """The Fit method, will fit a nonlinear PLS to the X and Y data
+
+        The positional arguments are those of PLS.fit up to keep_training_data,
+        relation, degree, knots and stats are keyword-only.
+
+        relation - the inner relation u = g(t) of every component:
+            "quadratic" - a second degree polynomial (QPLS)
+            "polynomial" - a polynomial of the given degree
+            "spline" - a spline of the given degree (cubic by default) with
+                knots equally spaced knots within the range of the scores
+        degree=1 gives a linear inner relation, whose weights fit u by X w
+        instead of maximizing the covariance as in PLS.
+
+        The CV rounds of every component are iterated together, in products
+        with the whole X matrix with a column per round, so CV costs about as
+        much as fitting cv components, and n_jobs is not used. The other
+        arguments are those of PLS.fit, the data must be complete."""
+        if relation not in _RELATIONS:
+            raise ValueError("Unknown relation {}".format(relation))
+        degree = _RELATIONS[relation][0] or degree
+        knots = (
+            _RELATIONS[relation][1] if _RELATIONS[relation][1] is not None else knots
+        )
+        max_ncomp = min(map(len, self._labels()))
+        if ncomp is None:
+            ncomp = max_ncomp
+        elif ncomp > max_ncomp:
+            ncomp = max_ncomp
+            logging.warning(
+                "ncomp is larger than the max dimension of the x matrix.\n"
+                "fit will only return {} components".format(ncomp)
+            )
+        if cv and self.x_sparse is not None:
+            raise ValueError("cv is not available for sparse X data")
+
+        self._preparedata(center, scale, dropzerovar, dtype)
+        if self._x_hasna or self._y_hasna:
+            raise ValueError("Nonlinear PLS needs complete data")
+        if cv is True:
+            cv = 7
+        self._fitopts = dict(
+            startcol=startcol,
+            tol=tol,
+            maxiter=maxiter,
+            cv=cv or 0,
+            n_jobs=n_jobs,
+            algorithm="nipals",
+            relation=relation,
+            degree=degree,
+            knots=knots,
+        )
+        self._stats = stats
+        self._initresults()
+        self._res.update(
+            inner=np.empty((degree + 1 + knots, 0)),
+            lo=np.empty((0,)),
+            span=np.empty((0,)),
+            gg=np.empty((0,)),
+        )
+        self._fitcomps(ncomp, init)
+        if not keep_training_data:
+            self.compact()
+        return True
+
+    def partial_fit(self, new_x, new_y, forget=1.0):
+        """Not available, the inner relations cannot be updated from the cross
+        products of the data"""
+        raise RuntimeError(
+            "partial_fit is not available for nonlinear PLS, refit the model"
+        )
+
+    def _fitcomps(self, ncomp, init=None):
+        """Calculate ncomp more components from the deflated data and update the
+        results"""
+        startcol = self._fitopts["startcol"]
+        tol = self._fitopts["tol"]
+        maxiter = self._fitopts["maxiter"]
+        cv = self._fitopts["cv"]
+        degree = self._fitopts["degree"]
+        nknots = self._fitopts["knots"]
+        nr, x_nc = self.x_mat.shape
+        y_nc = self.y_mat.shape[1]
+        firstcomp = self._res["b"].shape[0]
+        init = _startvectors(init, nr, "u")
+
+        res = dict(
+            (key, np.empty(shape))
+            for key, shape in (
+                ("R2Xcum", (ncomp,)),
+                ("R2Ycum", (ncomp,)),
+                ("PRESS_SS", (ncomp,)),
+                ("loadings", (x_nc, ncomp)),
+                ("scores", (nr, ncomp)),
+                ("u", (nr, ncomp)),
+                ("weights", (x_nc, ncomp)),
+                ("q", (y_nc, ncomp)),
+                ("b", (ncomp,)),
+                ("inner", (degree + 1 + nknots, ncomp)),
+                ("lo", (ncomp,)),
+                ("span", (ncomp,)),
+                ("gg", (ncomp,)),
+            )
+        )
+        if cv:
+            # Row i is left out in CV round i % cv, column i of the mask selects
+            # the training rows of round i
+            fold = np.arange(nr) % cv
+            cvmask = (fold[:, np.newaxis] != np.arange(cv)).astype(float)
+        full = np.ones((nr, 1))
+        niter = np.empty((ncomp,), dtype=int)
+        stats = getattr(self, "_stats", None)
+
+        for i, comp in enumerate(range(firstcomp, firstcomp + ncomp)):
+            if init is not None and comp < init.shape[1]:
+                uh0 = init[:, comp]
+                logging.info("PC {}, starting with given vector".format(comp))
+            else:
+                if startcol is None:
+                    yvar = np.var(self.y_mat, axis=0, ddof=1)
+                    startcol_use = _startcolumn(yvar)
+                else:
+                    startcol_use = startcol
+                uh0 = self.y_mat[:, startcol_use]
+                logging.info(
+                    "PC {}, starting with column {}".format(comp, startcol_use)
+                )
+            if stats is not None:
+                stats._begin(comp)
+
+            if cv:
+                # All rounds at once, every left out row is predicted by its round
+                th, _, _, qh, (coef, lo, span) = _innercomp(
+                    self.x_mat,
+                    self.y_mat,
+                    cvmask,
+                    np.repeat(uh0[:, np.newaxis], cv, axis=1),
+                    degree,
+                    nknots,
+                    tol,
+                    maxiter,
+                    comp,
+                )
+                basis = _basis(((th - lo) / span)[np.arange(nr), fold], degree, nknots)
+                gh = (basis * coef[fold].T).sum(axis=0)
+                cv_res = self.y_mat - gh[:, np.newaxis] * qh.T[fold]
+                res["PRESS_SS"][i] = np.sum(cv_res**2) / _sumsq(self.y_mat)
+                if stats is not None:
+                    stats._lap("cv")
+
+            trace = []
+            th, uh, wh, qh, (coef, lo, span) = _innercomp(
+                self.x_mat,
+                self.y_mat,
+                full,
+                uh0[:, np.newaxis],
+                degree,
+                nknots,
+                tol,
+                maxiter,
+                comp,
+                trace,
+            )
+            niter[i] = len(trace)
+            self._traces.append(np.array(trace))
+            if stats is not None:
+                stats._lap("matvec")
+            th, uh, wh, qh = th[:, 0], uh[:, 0], wh[:, 0], qh[:, 0]
+            gh = coef[0].dot(_basis((th - lo[0]) / span[0], degree, nknots))
+            ph = self.x_mat.T.dot(th) / th.dot(th)
+
+            res["loadings"][:, i] = ph
+            res["scores"][:, i] = th
+            res["u"][:, i] = uh
+            res["q"][:, i] = qh
+            res["weights"][:, i] = wh
+            res["b"][i] = uh.dot(th) / th.dot(th)
+            res["inner"][:, i] = coef[0]
+            res["lo"][i] = lo[0]
+            res["span"][i] = span[0]
+            res["gg"][i] = gh.dot(gh)
+
+            _deflate(self.x_mat, th, ph)
+            _deflate(self.y_mat, gh, qh)
+
+            # Cumulative proportion of variance explained
+            res["R2Xcum"][i] = 1 - (_sumsq(self.x_mat) / self._TotalSSX)
+            res["R2Ycum"][i] = 1 - (_sumsq(self.y_mat) / self._TotalSSY)
+            if stats is not None:
+                stats._lap("deflate")
+                stats._end(trace)
+        if stats is not None:
+            stats._finish()
+
+        res["niter"] = niter
+        for key, value in res.items():
+            self._res[key] = np.concatenate((self._res[key], value), axis=-1)
+        self._xrowss, self._xssres = _residualss(self.x_mat)
+        self._yrowss, self._yssres = _residualss(self.y_mat)
+        self._tt = (self._res["scores"] ** 2).sum(axis=0)
+        self._setresults()
+
+    @functools.cached_property
+    def inner(self):
+        """The inner relations as a DataFrame with a row per component, with the
+        normalization lo and span of the scores and the coefficients c0, c1, ...
+        of the basis functions (see _basis)"""
+        nbasis = self._res["inner"].shape[0]
+        return pd.DataFrame(
+            np.column_stack((self._res["lo"], self._res["span"], self._res["inner"].T)),
+            index=self._pcs(),
+            columns=["lo", "span"] + ["c{}".format(k) for k in range(nbasis)],
+        )
+
+    def _innerpredict(self, scores):
+        """Preprocessed Y predictions from the X scores of the first components,
+        with the inner relations of all components evaluated together"""
+        ncomp = scores.shape[1]
+        s = (scores - self._res["lo"][:ncomp]) / self._res["span"][:ncomp]
+        basis = _basis(s.T, self._fitopts["degree"], self._fitopts["knots"])
+        return _innereval(basis, self._res["inner"][:, :ncomp].T).dot(
+            self._res["q"][:, :ncomp].T
+        )
+
+    def predict(self, new_x, out=None, frame=False):
+        """Predict Y for new X data
+
+        The scores are calculated as in PLS and the Y values through the inner
+        relations of the components. The arguments are those of PLS.predict."""
+        new_x, index = _asarray(new_x, self.x_df.columns)
+        pred = self._innerpredict(self._newscores(self._preprocess(new_x, "x")))
+        if self.scale:
+            pred *= self.y_std
+        if self.center:
+            pred += self.y_mean
+        if out is not None:
+            out[...] = pred
+            pred = out
+        if frame:
+            return pd.DataFrame(pred, index=index, columns=self.y_df.columns)
+        return pred
+
+    def dmody(self, new_x, new_y, ncomp=None):
+        """DModY of new X and Y data, as PLS.dmody with the predictions through
+        the inner relations"""
+        ncomp = _usecomps(ncomp, self._res["b"].shape[0])
+        new_x, _ = _asarray(new_x, self.x_df.columns)
+        new_y, _ = _asarray(new_y, self.y_df.columns)
+        scores = self._newscores(self._preprocess(new_x, "x"))[:, :ncomp]
+        res = self._preprocess(new_y, "y") - self._innerpredict(scores)
+        ssres = self._yssres + (self._res["q"][:, ncomp:] ** 2).dot(
+            self._res["gg"][ncomp:]
+        )
+        A0 = 0 if isinstance(self.y_mean, int) else 1
+        return _dmodx(res, ssres, self._nobs, ncomp, A0)
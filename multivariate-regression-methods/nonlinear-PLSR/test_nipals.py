@@ -0,0 +1,928 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nipals import PLS, ChunkedNipals, FitStats, Nipals
+
+
+def _lowrank(nr=500, nc=20, ny=3, seed=0):
+    rng = np.random.default_rng(seed)
+    t = rng.standard_normal((nr, 4)) * [3, 2.5, 2, 1]
+    x = t.dot(rng.standard_normal((4, nc))) + 0.3 * rng.standard_normal((nr, nc))
+    y = t.dot(rng.standard_normal((4, ny))) + 0.3 * rng.standard_normal((nr, ny))
+    return pd.DataFrame(x), pd.DataFrame(y)
+
+
+def _signdiff(a, b):
+    """Largest difference of the columns of a and b, up to their signs"""
+    a = np.asarray(a)
+    b = np.asarray(b)
+    return np.abs(a * np.sign((a * b).sum(axis=0)) - b).max()
+
+
+@pytest.mark.parametrize("tol", [1e-6, 1e-12, 1e-20])
+def test_accelerated_pca(tol):
+    x, _ = _lowrank()
+    plain = Nipals(x)
+    plain.fit(3, tol=1e-14, maxiter=10000)
+    fast = Nipals(x)
+    fast.fit(3, tol=tol, accelerate=True)
+    assert _signdiff(fast.loadings, plain.loadings) < (1e-4 if tol > 1e-10 else 1e-6)
+
+
+@pytest.mark.parametrize("tol", [1e-6, 1e-12, 1e-20])
+def test_accelerated_pls(tol):
+    x, y = _lowrank()
+    plain = PLS(x, y)
+    plain.fit(3, tol=1e-14, maxiter=10000)
+    fast = PLS(x, y)
+    fast.fit(3, tol=tol, accelerate=True)
+    assert _signdiff(fast.weights, plain.weights) < 1e-6
+    assert _signdiff(fast.scores, plain.scores) < 1e-6
+
+
+def test_tsr_closed_form():
+    # Scores with missing values against the TSR estimate of Arteaga and Ferrer,
+    # t = S P*'P* (P*'P* S P*'P* + P*' E* P*)^-1 P*' x*, built row by row from
+    # the observed variables
+    x, _ = _lowrank(nr=200, nc=8)
+    model = Nipals(x)
+    model.fit(3)
+    new_x = x.values[:6].copy()
+    new_x[0, 1] = new_x[1, [2, 5]] = new_x[2, 0] = new_x[4, [1, 3, 7]] = np.nan
+    loadings = model._res["loadings"]
+    scorevar = model._res["eig"] / (model._nobs - 1)
+    resvar = model._ssres / (model._nobs - 1)
+    mat = (new_x - model.x_mean) / model.x_std
+    for row, scores in zip(mat, model.transform(new_x)):
+        obs = ~np.isnan(row)
+        if obs.all():
+            # Complete rows are projected
+            np.testing.assert_allclose(scores, row.dot(loadings), rtol=1e-10)
+            continue
+        lo = loadings[obs]
+        pp = lo.T.dot(lo)
+        cov = pp.dot(np.diag(scorevar)).dot(pp) + lo.T.dot(np.diag(resvar[obs])).dot(lo)
+        expected = (
+            np.diag(scorevar).dot(pp).dot(np.linalg.solve(cov, lo.T.dot(row[obs])))
+        )
+        np.testing.assert_allclose(scores, expected, rtol=1e-10, atol=1e-12)
+
+
+def test_race_signs():
+    # A serial race is a retry: the first start (column 0) runs out of
+    # iterations, so another start wins, with the signs of the first start
+    x, y = _lowrank()
+    for model, maxiter in ((Nipals(x), 36), (PLS(x, y), 16)):
+        model.fit(2, tol=1e-12, startcol=0, maxiter=10000)
+        assert model.niter.iloc[0] > maxiter
+        args = (x,) if isinstance(model, Nipals) else (x, y)
+        raced = type(model)(*args)
+        raced.fit(2, tol=1e-12, startcol=0, maxiter=maxiter, nstarts=3, n_jobs=1)
+        np.testing.assert_allclose(raced.scores, model.scores, atol=1e-4)
+
+
+def test_old_object_missing():
+    # Objects saved by pre-0.5.0 versions have no _res or _ssres and always
+    # centered and scaled, their rows with missing values are scored as those
+    # versions did, with the missing values filled by the means
+    x, _ = _lowrank(nr=200, nc=8)
+    model = Nipals(x)
+    model.fit(3)
+    old = Nipals.__new__(Nipals)
+    old.__dict__.update(
+        x_df=model.x_df,
+        x_mean=pd.Series(model.x_mean, index=x.columns),
+        x_std=pd.Series(model.x_std, index=x.columns),
+        loadings=model.loadings,
+        eig=pd.Series(np.sqrt(model._res["eig"]), index=model.loadings.columns),
+        eigsweep=False,
+    )
+    new_x = x.iloc[:6].copy()
+    new_x.iloc[0, 1] = new_x.iloc[4, [1, 3]] = np.nan
+    mat = ((new_x - old.x_mean) / old.x_std).fillna(0)
+    np.testing.assert_allclose(old.transform(new_x), mat.dot(old.loadings))
+    np.testing.assert_allclose(
+        old.transform(new_x, missing="pmp"), model.transform(new_x, missing="pmp")
+    )
+
+
+def test_results_are_copies():
+    # Editing a result frame in place does not change the model
+    x, y = _lowrank()
+    for model in (Nipals(x), PLS(x, y)):
+        model.fit(2)
+        project = model.transform if isinstance(model, Nipals) else model.predict
+        expected = project(x.values[:5])
+        model.scores.iloc[:] = 0
+        model.loadings.iloc[:] = 0
+        np.testing.assert_array_equal(project(x.values[:5]), expected)
+        assert (model._res["scores"] != 0).all()
+
+
+def test_start_column_ties():
+    # After scaling all variances are 1 up to rounding, the fits start from the
+    # first column, so the components do not depend on how the variances were
+    # summed; without scaling the column with the highest variance is used
+    x, y = _lowrank(seed=1)
+    for scale, start in ((True, 0), (False, int(np.argmax(x.var().values)))):
+        model = Nipals(x)
+        model.fit(3, scale=scale)
+        ref = Nipals(x)
+        ref.fit(3, scale=scale, startcol=start)
+        np.testing.assert_array_equal(
+            model.loadings.iloc[:, 0], ref.loadings.iloc[:, 0]
+        )
+    model = PLS(x, y)
+    model.fit(2)
+    ref = PLS(x, y)
+    ref.fit(2, startcol=0)
+    np.testing.assert_array_equal(model.weights.iloc[:, 0], ref.weights.iloc[:, 0])
+    svd = Nipals(x)
+    svd.fit(3, method="svd")
+    model = Nipals(x)
+    model.fit(3, tol=1e-12)
+    np.testing.assert_allclose(svd.loadings, model.loadings, atol=1e-6)
+
+
+@pytest.mark.parametrize("missing", [0, 0.05])
+def test_chunked_equivalence(missing):
+    # Same components with the same signs as Nipals, for scaled data where all
+    # columns have the same variance
+    x, _ = _lowrank(seed=1)
+    x = x.values.copy()
+    x[np.random.default_rng(1).random(x.shape) < missing] = np.nan
+    model = Nipals(pd.DataFrame(x))
+    model.fit(3, tol=1e-12)
+    chunked = ChunkedNipals(x, chunksize=97)
+    chunked.fit(3, tol=1e-12)
+    np.testing.assert_allclose(chunked.loadings, model.loadings, atol=1e-8)
+    np.testing.assert_allclose(chunked.scores, model.scores, atol=1e-6)
+
+
+def test_nonlinear_signature():
+    # The positional arguments of NonlinearPLS.fit are those of PLS.fit
+    import inspect
+
+    from nonlinear_plsr import NonlinearPLS
+
+    def positional(func):
+        return [
+            name
+            for name, param in inspect.signature(func).parameters.items()
+            if param.kind == param.POSITIONAL_OR_KEYWORD
+        ]
+
+    names = positional(NonlinearPLS.fit)
+    assert positional(PLS.fit)[: len(names)] == names
+    rng = np.random.default_rng(0)
+    x = rng.random((200, 4))
+    y = np.sin(2 * np.pi * x[:, :1]) + x[:, 1:2] ** 2
+    model = NonlinearPLS(x, y)
+    model.fit(2, True, True, None, 1e-6, 5000, relation="spline")
+    assert model._fitopts["relation"] == "spline"
+    assert model._fitopts["maxiter"] == 5000
+
+
+def test_u_after_compact():
+    # compact drops u of the training rows, partial_fit sets u of its new rows
+    x, y = _lowrank()
+    model = PLS(x.iloc[:400], y.iloc[:400])
+    model.fit(2)
+    model.partial_fit(x.iloc[400:450], y.iloc[400:450])
+    model.compact()
+    with pytest.raises(AttributeError, match="compact"):
+        model.u
+    model.partial_fit(x.iloc[450:], y.iloc[450:])
+    assert model.u.shape == (50, 2)
+    assert model.u.index.equals(x.index[450:])
+
+
+def test_sparse_partial_fit():
+    # Sparse rows update a model of sparse data as dense rows a dense model
+    from scipy import sparse
+
+    x, y = _lowrank()
+    x = x.where(x.abs() > 1, 0)
+    dense = Nipals(x.iloc[:400])
+    dense.fit(3)
+    dense.partial_fit(x.iloc[400:])
+    model = Nipals(sparse.csr_matrix(x.values[:400]))
+    model.fit(3)
+    model.partial_fit(sparse.csr_matrix(x.values[400:]))
+    np.testing.assert_allclose(model.loadings, dense.loadings, atol=1e-8)
+    np.testing.assert_allclose(model.scores, dense.scores, atol=1e-6)
+    dense = PLS(x.iloc[:400], y.iloc[:400])
+    dense.fit(2)
+    dense.partial_fit(x.iloc[400:], y.iloc[400:])
+    model = PLS(sparse.csr_matrix(x.values[:400]), y.iloc[:400])
+    model.fit(2)
+    model.partial_fit(sparse.csr_matrix(x.values[400:]), y.iloc[400:])
+    np.testing.assert_allclose(model.weights, dense.weights, atol=1e-8)
+
+
+def test_nonlinear_partial_fit():
+    # partial_fit is not available for nonlinear PLS
+    from nonlinear_plsr import NonlinearPLS
+
+    rng = np.random.default_rng(0)
+    x = rng.random((200, 4))
+    y = np.sin(2 * np.pi * x[:, :1]) + x[:, 1:2] ** 2
+    model = NonlinearPLS(x, y)
+    model.fit(2)
+    with pytest.raises(RuntimeError, match="not available"):
+        model.partial_fit(x, y)
+
+
+def test_chunked_niter():
+    # ChunkedNipals records the iterations and traces of its components
+    x, _ = _lowrank()
+    model = Nipals(x)
+    model.fit(3, tol=1e-10)
+    chunked = ChunkedNipals(x.values, chunksize=97)
+    chunked.fit(3, tol=1e-10)
+    np.testing.assert_array_equal(chunked.niter, model.niter)
+    assert [len(t) for t in chunked.traces.values()] == list(model.niter)
+    model.partial_fit(x.iloc[:10])
+    with pytest.raises(AttributeError, match="partial_fit"):
+        model.niter
+
+
+@pytest.mark.parametrize("method", ["pmp", "tsr"])
+def test_projectmissing_gram(method):
+    # The projections use the Gram matrix of the observed loadings, which is
+    # not I - Pm'Pm for loadings that are not exactly orthonormal
+    from nipals import _projectmissing
+
+    rng = np.random.default_rng(0)
+    loadings = np.linalg.qr(rng.standard_normal((8, 3)))[0]
+    loadings += 0.05 * rng.standard_normal(loadings.shape)
+    scorevar = np.array([4.0, 2.0, 1.0])
+    resvar = rng.random(8) + 0.1
+    mat = rng.standard_normal((5, 8))
+    mat[0, 1] = mat[1, [2, 5]] = mat[2, 0] = mat[3, [1, 3, 7]] = mat[4, 4] = np.nan
+    scores = _projectmissing(mat, loadings, method, scorevar, resvar)
+    for row, score in zip(mat, scores):
+        obs = ~np.isnan(row)
+        lo = loadings[obs]
+        pp = lo.T.dot(lo)
+        if method == "pmp":
+            expected = np.linalg.solve(pp, lo.T.dot(row[obs]))
+        else:
+            cov = pp.dot(np.diag(scorevar)).dot(pp) + (lo.T * resvar[obs]).dot(lo)
+            expected = (
+                np.diag(scorevar).dot(pp).dot(np.linalg.solve(cov, lo.T.dot(row[obs])))
+            )
+        np.testing.assert_allclose(score, expected, rtol=1e-10)
+
+
+def test_partial_fit_startcol():
+    # The updated weights have the signs of a refit with the same start column
+    x, y = _lowrank()
+    y[1] = -y[1] + 5 * y[0]
+    for startcol in (None, 1, 2):
+        model = PLS(x.iloc[:400], y.iloc[:400])
+        model.fit(3, startcol=startcol, tol=1e-12)
+        model.partial_fit(x.iloc[400:], y.iloc[400:])
+        ref = PLS(x, y)
+        ref.fit(3, startcol=startcol, tol=1e-12)
+        np.testing.assert_allclose(model.weights, ref.weights, atol=1e-6)
+
+
+@pytest.mark.parametrize("algorithm", ["kernel", "simpls", "widekernel"])
+def test_kernel_start_column_ties(algorithm):
+    # The kernel algorithms sign the weights from the start column of NIPALS,
+    # also when the scaled Y variances are equal up to rounding
+    x, y = _lowrank()
+    y[1] = -y[1] + 5 * y[0]
+    model = PLS(x, y)
+    model.fit(1, algorithm=algorithm)
+    ref = PLS(x, y)
+    ref.fit(1, tol=1e-12)
+    assert (model.weights.values * ref.weights.values).sum() > 0
+
+
+def test_ncomp_range():
+    # ncomp of the new data statistics defaults to all components and must be
+    # one of the components of the model
+    x, y = _lowrank()
+    pls = PLS(x, y)
+    pls.fit(2)
+    pca = Nipals(x)
+    pca.fit(3)
+    new_x = x.values[:5]
+    for model, calls in (
+        (
+            pls,
+            [
+                lambda n: pls.dmodx(new_x, n),
+                lambda n: pls.dmody(new_x, y.values[:5], n),
+                lambda n: pls.t2(new_x, n),
+                lambda n: pls.dmodx_limit(ncomp=n),
+                lambda n: pls.dmody_limit(ncomp=n),
+                lambda n: pls.t2_limit(ncomp=n),
+            ],
+        ),
+        (
+            pca,
+            [
+                lambda n: pca.dmodx(new_x, n),
+                lambda n: pca.t2(new_x, n),
+                lambda n: pca.dmodx_limit(ncomp=n),
+                lambda n: pca.t2_limit(ncomp=n),
+            ],
+        ),
+    ):
+        for call in calls:
+            maxcomp = 2 if model is pls else 3
+            np.testing.assert_array_equal(call(None), call(maxcomp))
+            for ncomp in (0, -1, maxcomp + 1):
+                with pytest.raises(ValueError, match="ncomp"):
+                    call(ncomp)
+
+
+def test_kernel_missing():
+    # Kernel PCA scores complete data only, rows with missing values raise
+    from nipals import KernelNipals
+
+    x, _ = _lowrank(nr=200, nc=5)
+    model = KernelNipals(x, nfeatures=50)
+    model.fit(2)
+    new_x = x.values[:3].copy()
+    new_x[0, 1] = np.nan
+    for func in (model.transform, model.predict, model.dmodx, model.t2):
+        with pytest.raises(ValueError, match="complete"):
+            func(new_x)
+    with pytest.raises(TypeError):
+        model.dmodx(new_x, missing="pmp")
+
+
+def test_missing_denominators():
+    # The masked denominators give the iterations of the former dense
+    # T2 = repeat(t * t) path, for the first component with missing values
+    x, _ = _lowrank(nr=200, nc=8)
+    x = x.where(np.random.default_rng(2).random(x.shape) > 0.1)
+    model = Nipals(x)
+    model.fit(1, startcol=0, tol=1e-10)
+    mat = ((x - x.mean()) / x.std()).values
+    miss = np.isnan(mat)
+    mat_0 = np.nan_to_num(mat)
+    nrt, nct = mat.shape
+    th = mat_0[:, 0]
+    while True:
+        T2 = np.repeat(th * th, nct).reshape(nrt, nct)
+        T2[miss] = 0
+        ph = mat_0.T.dot(th) / T2.sum(axis=0)
+        ph = ph / np.sqrt(np.sum(ph * ph))
+        th_old = th
+        P2 = np.repeat(ph * ph, nrt).reshape(nct, nrt)
+        P2[miss.T] = 0
+        th = mat_0.dot(ph) / P2.sum(axis=0)
+        if np.sum((th - th_old) ** 2) < 1e-10:
+            break
+    np.testing.assert_allclose(model.loadings.iloc[:, 0], ph, rtol=1e-10)
+    np.testing.assert_allclose(model.scores.iloc[:, 0], th, rtol=1e-10)
+
+
+@pytest.mark.parametrize("method", ["svd", "lanczos", "randomized"])
+def test_blocked_methods(method):
+    # The blocked SVD methods give the NIPALS components with their signs
+    x, _ = _lowrank()
+    model = Nipals(x)
+    model.fit(3, tol=1e-14, maxiter=10000)
+    blocked = Nipals(x)
+    blocked.fit(3, method=method)
+    np.testing.assert_allclose(blocked.loadings, model.loadings, atol=1e-6)
+    np.testing.assert_allclose(blocked.scores, model.scores, atol=1e-5)
+    np.testing.assert_allclose(blocked.eig, model.eig, rtol=1e-8)
+    np.testing.assert_allclose(blocked.R2cum, model.R2cum, rtol=1e-8)
+
+
+def test_float32_inplace():
+    # The data is copied once into a working matrix of the given dtype, which is
+    # deflated in place; float32 gives the float64 components within its
+    # precision and the data is not modified
+    x, y = _lowrank()
+    x_orig = x.copy()
+    for model, args in ((Nipals, (x,)), (PLS, (x, y))):
+        double = model(*args)
+        double.fit(2, tol=1e-10)
+        single = model(*args)
+        single.fit(2, tol=1e-10, dtype=np.float32)
+        assert single.x_mat.dtype == np.float32
+        np.testing.assert_allclose(single.loadings, double.loadings, atol=1e-4)
+        np.testing.assert_allclose(single.scores, double.scores, atol=1e-3)
+        mat = (x.values - double.x_mean) / double.x_std
+        np.testing.assert_allclose(
+            double.x_mat, mat - double.scores.dot(double.loadings.T), atol=1e-10
+        )
+    pd.testing.assert_frame_equal(x, x_orig)
+
+
+def test_parallel_cv_pls():
+    # The CV rounds on threads give the results of the serial CV
+    x, y = _lowrank(nr=200)
+    serial = PLS(x, y)
+    serial.fit(3, cv=5)
+    threaded = PLS(x, y)
+    threaded.fit(3, cv=5, n_jobs=3)
+    np.testing.assert_array_equal(threaded.PRESS_SS, serial.PRESS_SS)
+    np.testing.assert_array_equal(threaded.Q2cum, serial.Q2cum)
+    np.testing.assert_array_equal(threaded.weights, serial.weights)
+
+
+@pytest.mark.parametrize("missing", [0, 0.05])
+def test_parallel_cv_nipals(missing):
+    # The row and column folds on threads give the results of the serial CV
+    x, _ = _lowrank(nr=200)
+    x = x.where(np.random.default_rng(3).random(x.shape) >= missing)
+    serial = Nipals(x)
+    serial.fit(3, cv=5)
+    threaded = Nipals(x)
+    threaded.fit(3, cv=5, n_jobs=3)
+    np.testing.assert_array_equal(threaded.PRESS_SS, serial.PRESS_SS)
+    np.testing.assert_array_equal(threaded.Q2cum, serial.Q2cum)
+    np.testing.assert_array_equal(threaded.loadings, serial.loadings)
+
+
+def test_fit_more():
+    # Adding components gives the model fit with all components at once, and a
+    # warm start from a fitted model converges in fewer iterations
+    x, y = _lowrank()
+    for model, args in ((Nipals, (x,)), (PLS, (x, y))):
+        once = model(*args)
+        once.fit(3, tol=1e-12)
+        more = model(*args)
+        more.fit(1, tol=1e-12)
+        more.fit_more(2)
+        np.testing.assert_allclose(more.scores, once.scores, atol=1e-10)
+        np.testing.assert_allclose(more.loadings, once.loadings, atol=1e-10)
+        warm = model(*args)
+        warm.fit(3, tol=1e-12, init=once)
+        np.testing.assert_allclose(warm.scores, once.scores, atol=1e-5)
+        assert warm.niter.sum() < once.niter.sum()
+
+
+def test_chunked_sources(tmp_path):
+    # A list of row blocks, a function returning an iterator over the blocks
+    # and a memory map give the components of the array
+    x, _ = _lowrank(seed=1)
+    x = x.values
+    model = ChunkedNipals(x, chunksize=97)
+    model.fit(2, tol=1e-12)
+    blocks = [x[i : i + 130] for i in range(0, len(x), 130)]
+    mmap = np.lib.format.open_memmap(tmp_path / "x.npy", mode="w+", shape=x.shape)
+    mmap[:] = x
+    for source in (blocks, lambda: iter(blocks), mmap):
+        other = ChunkedNipals(source)
+        other.fit(2, tol=1e-12)
+        np.testing.assert_allclose(other.loadings, model.loadings, atol=1e-10)
+        np.testing.assert_allclose(other.scores, model.scores, atol=1e-10)
+
+
+def test_nipals_partial_fit():
+    # Updates in batches move the components toward a refit on all rows, with
+    # the exact column statistics; forget down-weights the old rows
+    x, _ = _lowrank(nr=1000)
+    ref = Nipals(x)
+    ref.fit(3, tol=1e-12)
+    model = Nipals(x.iloc[:500])
+    model.fit(3, tol=1e-12)
+    before = _signdiff(model.loadings, ref.loadings)
+    for start in range(500, 1000, 100):
+        model.partial_fit(x.iloc[start : start + 100])
+    assert _signdiff(model.loadings, ref.loadings) < before / 10
+    np.testing.assert_allclose(model.eig, ref.eig, rtol=1e-4)
+    np.testing.assert_allclose(model.x_mean, ref.x_mean, atol=1e-12)
+    np.testing.assert_allclose(model.x_std, ref.x_std, rtol=1e-12)
+    assert model.scores.index.equals(x.index[900:])
+    model = Nipals(x.iloc[:500])
+    model.fit(3)
+    model.partial_fit(x.iloc[500:600] + 5, forget=0.99)
+    weight = 0.99**100 * 500
+    expected = (weight * x.iloc[:500].mean() + 100 * (x.iloc[500:600].mean() + 5)) / (
+        weight + 100
+    )
+    np.testing.assert_allclose(model.x_mean, expected, atol=1e-12)
+
+
+def test_pls_partial_fit():
+    # Updates in batches predict as a refit on all rows, and with the old rows
+    # forgotten as a fit on the new rows only
+    x, y = _lowrank()
+    new_x = x.values[:5]
+    model = PLS(x.iloc[:300], y.iloc[:300])
+    model.fit(3, tol=1e-12)
+    for start in (300, 400):
+        model.partial_fit(x.iloc[start : start + 100], y.iloc[start : start + 100])
+    ref = PLS(x, y)
+    ref.fit(3, tol=1e-12)
+    np.testing.assert_allclose(model.predict(new_x), ref.predict(new_x), atol=1e-8)
+    model = PLS(x.iloc[:300], y.iloc[:300])
+    model.fit(3, tol=1e-12)
+    model.partial_fit(x.iloc[300:], y.iloc[300:], forget=1e-3)
+    ref = PLS(x.iloc[300:], y.iloc[300:])
+    ref.fit(3, tol=1e-12)
+    np.testing.assert_allclose(model.predict(new_x), ref.predict(new_x), atol=1e-8)
+    np.testing.assert_allclose(model.weights, ref.weights, atol=1e-8)
+
+
+@pytest.mark.parametrize("missing", [False, True])
+def test_pls_predict(missing):
+    # Predictions of the training rows are the fitted values, Y minus the
+    # deflated Y, also for rows with missing values
+    x, y = _lowrank()
+    if missing:
+        x.iloc[[0, 3], 1] = x.iloc[5, [2, 4]] = np.nan
+    model = PLS(x, y)
+    model.fit(3, tol=1e-12)
+    fitted = y.values - model.y_mat * model.y_std
+    np.testing.assert_allclose(model.predict(x.values), fitted, atol=1e-12)
+    out = np.empty((5, 3))
+    assert model.predict(x.values[:5], out=out) is out
+    np.testing.assert_allclose(out, fitted[:5], atol=1e-12)
+    pred = model.predict(x.iloc[:5], frame=True)
+    assert pred.index.equals(x.index[:5]) and pred.columns.equals(y.columns)
+
+
+@pytest.mark.parametrize("eigsweep", [False, True])
+def test_nipals_transform(eigsweep):
+    # transform gives the training scores and, with missing="mean", the former
+    # predict, which filled the missing values of the scaled data with 0; the
+    # new data is not modified
+    x, _ = _lowrank()
+    model = Nipals(x)
+    model.fit(3, tol=1e-12, eigsweep=eigsweep)
+    np.testing.assert_allclose(model.transform(x.values), model.scores, atol=1e-10)
+    new_x = x.iloc[:6].copy()
+    new_x.iloc[0, 1] = new_x.iloc[4, [1, 3]] = np.nan
+    orig = new_x.copy()
+    expected = ((new_x - model.x_mean) / model.x_std).fillna(0).dot(model.loadings)
+    if eigsweep:
+        expected /= model.eig.values
+    np.testing.assert_allclose(model.transform(new_x, missing="mean"), expected)
+    pd.testing.assert_frame_equal(new_x, orig)
+    model.predict(new_x, missing="mean")
+    np.testing.assert_allclose(model.pred, expected)
+    assert model.pred.index.equals(new_x.index)
+
+
+def test_pmp_transform():
+    # Scores of rows with missing values by projection to the model plane, the
+    # least squares scores of the observed variables, which for a row on the
+    # model plane are its scores; complete rows are projected
+    x, _ = _lowrank(nr=200, nc=8)
+    model = Nipals(x)
+    model.fit(3)
+    loadings = model._res["loadings"]
+    scores = model.transform(x.values[:6])
+    mat = scores.dot(loadings.T) * model.x_std + model.x_mean
+    mat[0, 1] = mat[1, [2, 5]] = mat[2, 0] = mat[4, [1, 3, 7]] = np.nan
+    np.testing.assert_allclose(model.transform(mat, missing="pmp"), scores)
+    with pytest.raises(ValueError, match="Unknown"):
+        model.transform(mat, missing="median")
+
+
+def test_new_data_statistics():
+    # dmodx and dmody of the training rows are dModX and dModY without the
+    # correction sqrt(n / (n - ncomp - 1)) of training rows, the T2 of the
+    # training rows sum to ncomp (n - 1), and the DModX limit is that of
+    # dModXPlot
+    from scipy.stats import f
+
+    x, y = _lowrank()
+    nr, nc = x.shape
+    pca = Nipals(x)
+    pca.fit(3, tol=1e-12)
+    pls = PLS(x, y)
+    pls.fit(2, tol=1e-12)
+    for model, ncomp in ((pca, 3), (pls, 2)):
+        factor = np.sqrt(nr / (nr - ncomp - 1))
+        np.testing.assert_allclose(model.dmodx(x) * factor, model.dModX())
+        assert model.t2(x).sum() == pytest.approx(ncomp * (nr - 1))
+        limit = np.sqrt(f.isf(0.05, nr - ncomp - 1, nc - ncomp))
+        assert model.dmodx_limit() == pytest.approx(limit)
+    np.testing.assert_allclose(pls.dmody(x, y) * factor, pls.dModY())
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load(tmp_path, mmap):
+    # A loaded model scores new data as the saved one; with mmap its arrays are
+    # read-only views of the file, which np.load also reads
+    x, y = _lowrank()
+    x.iloc[0, 1] = np.nan
+    new_x, new_y = x.values[:20], y.values[:20]
+    pls = PLS(x, y)
+    pls.fit(2)
+    pls.save(tmp_path / "pls.npz")
+    loaded = PLS.load(tmp_path / "pls.npz", mmap=mmap)
+    np.testing.assert_array_equal(loaded.predict(new_x), pls.predict(new_x))
+    np.testing.assert_array_equal(loaded.dmodx(new_x), pls.dmodx(new_x))
+    np.testing.assert_array_equal(loaded.dmody(new_x, new_y), pls.dmody(new_x, new_y))
+    np.testing.assert_array_equal(loaded.t2(new_x), pls.t2(new_x))
+    assert loaded.t2_limit() == pls.t2_limit()
+    pd.testing.assert_frame_equal(loaded.weights, pls.weights)
+    assert loaded._res["weights"].flags.writeable is not mmap
+    pca = Nipals(x)
+    pca.fit(3)
+    pca.save(tmp_path / "pca.npz")
+    loaded = Nipals.load(tmp_path / "pca.npz", mmap=mmap)
+    for missing in ("tsr", "pmp"):
+        np.testing.assert_array_equal(
+            loaded.transform(new_x, missing=missing),
+            pca.transform(new_x, missing=missing),
+        )
+    np.testing.assert_array_equal(loaded.dmodx(new_x), pca.dmodx(new_x))
+    assert loaded.dmodx_limit() == pca.dmodx_limit()
+    with np.load(tmp_path / "pca.npz") as npz:
+        np.testing.assert_array_equal(npz["loadings"], pca._res["loadings"])
+    with pytest.raises(ValueError, match="Nipals"):
+        Nipals.load(tmp_path / "pls.npz", mmap=mmap)
+
+
+def test_compact():
+    # Without the training data a model keeps its scores and dModX and scores
+    # new data as before, fit_more is not available
+    x, y = _lowrank()
+    new_x = x.values[:20]
+    for model, args in ((Nipals, (x,)), (PLS, (x, y))):
+        full = model(*args)
+        full.fit(2)
+        slim = model(*args)
+        slim.fit(2, keep_training_data=False)
+        assert not hasattr(slim, "x_mat") and slim.x_df.empty
+        pd.testing.assert_frame_equal(slim.scores, full.scores)
+        np.testing.assert_array_equal(slim.dModX(), full.dModX())
+        np.testing.assert_array_equal(slim.dmodx(new_x), full.dmodx(new_x))
+        np.testing.assert_array_equal(slim.t2(new_x), full.t2(new_x))
+        if model is PLS:
+            np.testing.assert_array_equal(slim.predict(new_x), full.predict(new_x))
+            np.testing.assert_array_equal(slim.dModY(), full.dModY())
+        else:
+            np.testing.assert_array_equal(slim.transform(new_x), full.transform(new_x))
+        with pytest.raises(RuntimeError, match="training data"):
+            slim.fit_more(1)
+
+
+@pytest.mark.parametrize("center", [True, False])
+def test_sparse_fit(center):
+    # Sparse X data gives the components and predictions of the dense data
+    from scipy import sparse
+
+    x, y = _lowrank()
+    x = x.where(x.abs() > 1, 0)
+    mat = sparse.csr_matrix(x.values)
+    dense = Nipals(x)
+    dense.fit(3, center=center, tol=1e-12)
+    model = Nipals(mat)
+    model.fit(3, center=center, tol=1e-12)
+    np.testing.assert_allclose(model.loadings, dense.loadings, atol=1e-8)
+    np.testing.assert_allclose(model.scores, dense.scores, atol=1e-8)
+    np.testing.assert_allclose(model.R2cum, dense.R2cum, atol=1e-12)
+    np.testing.assert_allclose(model.transform(mat[:10]), dense.transform(x[:10]))
+    dense = PLS(x, y)
+    dense.fit(2, center=center, tol=1e-12)
+    model = PLS(mat, y)
+    model.fit(2, center=center, tol=1e-12)
+    np.testing.assert_allclose(model.weights, dense.weights, atol=1e-8)
+    np.testing.assert_allclose(model.predict(mat[:10]), dense.predict(x[:10]))
+    with pytest.raises(ValueError, match="sparse"):
+        model.fit(2, cv=3)
+
+
+@pytest.mark.parametrize("missing", [False, True])
+def test_fit_many(missing):
+    # Every model of fit_many is the model fit separately on its targets
+    x, y = _lowrank()
+    if missing:
+        x.iloc[[0, 3], 1] = np.nan
+    targets = [0, [1, 2]]
+    models = PLS.fit_many(x, y, targets, ncomp=2, tol=1e-12, n_jobs=2)
+    for model, cols in zip(models, targets):
+        ref = PLS(x, y[cols if isinstance(cols, list) else [cols]])
+        ref.fit(2, tol=1e-12)
+        assert model.y_df.columns.equals(ref.y_df.columns)
+        np.testing.assert_allclose(model.weights, ref.weights, atol=1e-8)
+        np.testing.assert_allclose(model.scores, ref.scores, atol=1e-6)
+        np.testing.assert_allclose(model.R2Ycum, ref.R2Ycum, atol=1e-10)
+        np.testing.assert_allclose(
+            model.predict(x.values[:10]), ref.predict(x.values[:10]), atol=1e-6
+        )
+
+
+@pytest.mark.parametrize(
+    "algorithm, nr, nc, ny",
+    [
+        ("kernel", 500, 20, 3),
+        ("widekernel", 40, 200, 3),
+        ("simpls", 500, 20, 1),
+        ("simpls", 40, 200, 1),
+    ],
+)
+def test_kernel_algorithms(algorithm, nr, nc, ny):
+    # kernel and widekernel give the NIPALS components, SIMPLS those of a single
+    # Y column, and fit_more continues them by NIPALS
+    x, y = _lowrank(nr, nc, ny)
+    ref = PLS(x, y)
+    ref.fit(3, tol=1e-14, maxiter=10000)
+    model = PLS(x, y)
+    model.fit(2, tol=1e-14, maxiter=10000, algorithm=algorithm)
+    model.fit_more(1)
+    for attr in ("weights", "loadings", "q", "b", "R2Xcum", "R2Ycum"):
+        np.testing.assert_allclose(getattr(model, attr), getattr(ref, attr), atol=1e-6)
+    np.testing.assert_allclose(model.scores, ref.scores, atol=1e-5)
+    x.iloc[0, 0] = np.nan
+    with pytest.raises(ValueError, match="complete"):
+        PLS(x, y).fit(2, algorithm=algorithm)
+
+
+def test_nonlinear_beats_linear():
+    # Cubic polynomial and spline inner relations predict held-out rows of a
+    # sine far better than linear PLS, a linear inner relation about as well
+    from nonlinear_plsr import NonlinearPLS
+
+    rng = np.random.default_rng(0)
+    x = rng.random((300, 4))
+    y = np.sin(2 * np.pi * x[:, :1]) + x[:, 1:2] ** 2
+    y += 0.05 * rng.standard_normal(y.shape)
+
+    def r2(pred):
+        return (
+            1 - ((y[200:] - pred) ** 2).sum() / ((y[200:] - y[200:].mean()) ** 2).sum()
+        )
+
+    linear = PLS(x[:200], y[:200])
+    linear.fit(2)
+    baseline = r2(linear.predict(x[200:]))
+    for relation, degree, expected in (
+        ("polynomial", 1, baseline - 0.02),
+        ("polynomial", 3, 0.95),
+        ("spline", 3, 0.95),
+    ):
+        model = NonlinearPLS(x[:200], y[:200])
+        model.fit(2, relation=relation, degree=degree)
+        assert r2(model.predict(x[200:])) > expected
+    assert baseline < 0.7
+
+
+@pytest.mark.parametrize("kernel", ["rbf", "poly"])
+def test_kernel_pca(kernel):
+    # With every row a landmark the Nystroem features reproduce the kernel, so
+    # the scores and eigenvalues are those of exact kernel PCA from the centered
+    # kernel matrix; many Fourier features come close for the rbf kernel
+    from nipals import KernelNipals, _kernelmatrix
+
+    x, _ = _lowrank(nr=100, nc=5)
+    model = KernelNipals(x, kernel=kernel, nfeatures=100)
+    model.fit(3, tol=1e-14, maxiter=10000)
+    mat = ((x - x.mean()) / x.std()).values
+    center = np.eye(100) - 1 / 100
+    kmat = center.dot(_kernelmatrix(mat, mat, kernel, 1 / 5)).dot(center)
+    lam, vec = np.linalg.eigh(kmat)
+    lam, vec = lam[::-1][:3], vec[:, ::-1][:, :3]
+    np.testing.assert_allclose(model._res["eig"], lam, rtol=1e-10)
+    assert _signdiff(model.scores, vec * np.sqrt(lam)) < 1e-6
+    if kernel == "rbf":
+        model = KernelNipals(x, approximation="fourier", nfeatures=20000)
+        model.fit(3)
+        np.testing.assert_allclose(model._res["eig"], lam, rtol=0.05)
+
+
+def test_parallel_starts():
+    # Starts raced on threads reach the components of a single start, with its
+    # signs, and record the iterations of the winning start
+    x, y = _lowrank()
+    for model, args in ((Nipals, (x,)), (PLS, (x, y))):
+        single = model(*args)
+        single.fit(3, tol=1e-12)
+        raced = model(*args)
+        raced.fit(3, tol=1e-12, nstarts=3, n_jobs=3)
+        np.testing.assert_allclose(raced.scores, single.scores, atol=1e-5)
+        assert [len(t) for t in raced.traces.values()] == list(raced.niter)
+
+
+def test_fit_stats():
+    # FitStats records every NIPALS component of fit and fit_more, with the
+    # iterations of the model, in a frame with a row per component
+    x, y = _lowrank()
+    seen = []
+    stats = FitStats(callback=seen.append, memory=True)
+    model = PLS(x, y)
+    model.fit(2, cv=3, stats=stats)
+    model.fit_more(1)
+    frame = stats.frame()
+    assert list(frame.index) == ["PC1", "PC2", "PC3"]
+    assert list(frame.columns) == [
+        "comp",
+        "niter",
+        "matvec",
+        "cv",
+        "deflate",
+        "total",
+        "bytes",
+    ]
+    np.testing.assert_array_equal(frame["niter"], model.niter)
+    assert (frame["cv"] > 0).all()
+    assert (frame["total"] >= frame[["matvec", "cv", "deflate"]].sum(axis=1)).all()
+    assert (frame["bytes"] > 0).all()
+    assert len(seen) == 3 and seen[0]["trace"].shape == (model.niter.iloc[0],)
+    stats = FitStats()
+    Nipals(x).fit(2, stats=stats)
+    assert "bytes" not in stats.frame() and len(stats.records) == 2
+
+
+def test_bench_suite(tmp_path, capsys):
+    # A small suite times every operation of both models, and its baseline file
+    # compares with itself at ratio 1
+    import bench_nipals
+
+    configs = bench_nipals._configs(
+        dict(rows=200, cols=10, ncomp=2, missing=0.0, cv=0), dict(missing=(0.0, 0.1))
+    )
+    assert [c["missing"] for c in configs] == [0.0, 0.1]
+    results = bench_nipals.bench_suite(repeat=1, npred=20, configs=configs)
+    assert len(results) == 2 * 2 * 5
+    assert all(r["time"] > 0 and r["peak_mb"] > 0 for r in results.values())
+    path = tmp_path / "baseline.json"
+    bench_nipals.write_baseline(results, path)
+    capsys.readouterr()
+    bench_nipals.compare_baseline(results, path)
+    lines = capsys.readouterr().out.splitlines()[1:]
+    assert len(lines) == len(results)
+    assert all("time   1.00  memory   1.00" in line for line in lines)
+    # The benchmarked denominators of the mask formulation are those of the
+    # former repeat formulation
+    mat = bench_nipals.lowrank(50, 8, missing=0.2)
+    miss = np.isnan(mat)
+    rng = np.random.default_rng(0)
+    th, ph = rng.standard_normal(50), rng.standard_normal(8)
+    for old, new in zip(
+        bench_nipals._denominators_repeat(np.nan_to_num(mat), miss, th, ph),
+        bench_nipals._denominators_mask((~miss).astype(float), th, ph),
+    ):
+        np.testing.assert_allclose(new, old)
+
+
+def test_lazy_results():
+    # The result frames are built on first access, with the labels of the data,
+    # and rebuilt after fit_more
+    x, y = _lowrank()
+    x.index = ["r{}".format(i) for i in range(len(x))]
+    for model, args, attrs in (
+        (Nipals, (x,), ("scores", "loadings", "R2cum", "eig")),
+        (PLS, (x, y), ("scores", "loadings", "weights", "q", "b", "R2Ycum")),
+    ):
+        fitted = model(*args)
+        fitted.fit(1)
+        assert not any(attr in fitted.__dict__ for attr in attrs)
+        assert fitted.scores.index.equals(x.index)
+        assert list(fitted.loadings.columns) == ["PC1"]
+        fitted.fit_more(1)
+        assert all(getattr(fitted, attr).shape[-1] == 2 for attr in attrs)
+
+
+def test_large_plots():
+    # Above maxpoints the score plot shows a sample of the scores or their
+    # hexagonal bins, with at most maxlabels labels; the ellipse is the former
+    # Hotelling ellipse of all scores
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from scipy.stats import f
+
+    from nipals import simpleEllipse
+
+    x, _ = _lowrank(nr=5000)
+    x.index.name = "row"
+    model = Nipals(x)
+    model.fit(2)
+    for kwargs, kind, npoints in (
+        (dict(maxpoints=500, labels="row", maxlabels=10), "PathCollection", 500),
+        (dict(maxpoints=None), "PathCollection", 5000),
+        (dict(maxpoints=500, largemode="density"), "PolyCollection", None),
+    ):
+        fig = model.plot(**kwargs)
+        ax = fig.axes[0]
+        (points,) = ax.collections
+        assert type(points).__name__ == kind
+        if npoints:
+            assert len(points.get_offsets()) == npoints
+        assert len(ax.texts) == (10 if "labels" in kwargs else 0)
+        plt.close(fig)
+    with pytest.raises(ValueError, match="largemode"):
+        model.plot(largemode="sample")
+    fig = model.loadingsplot(maxlabels=3)
+    assert len(fig.axes[0].texts) == 3
+    plt.close(fig)
+    t1, t2 = model.scores["PC1"], model.scores["PC2"]
+    n = len(t1)
+    angles = [i / 199 * np.pi * 2 for i in range(200)]
+    scale = f.ppf(0.95, 2, n - 2) * 2 * (n**2 - 1) / (n * (n - 2))
+    el = simpleEllipse(t1, t2, 0.95, 200)
+    np.testing.assert_allclose(
+        el[0], np.sqrt(t1.var() * scale) * np.cos(angles) + t1.mean()
+    )
+    np.testing.assert_allclose(
+        el[1], np.sqrt(t2.var() * scale) * np.sin(angles) + t2.mean()
+    )